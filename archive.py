@@ -0,0 +1,190 @@
+from datetime import date, timedelta
+
+from materializer import BackgroundJob
+
+SLOT_HOURS = 0.5
+ARCHIVE_START = "0000-01-01"  # нижняя граница запроса по диапазону дат
+_FORBIDDEN = str.maketrans({char: "_" for char in ".#$[]/"})
+
+
+def _key(value) -> str:
+    """Ключ узла Firebase: без . # $ [ ] /"""
+    return str(value).translate(_FORBIDDEN)
+
+
+def summarize_days(days: dict, tasks: dict, template) -> dict:
+    """Отличия прошедших дней {date: overrides} -> {"YYYY-MM": сводка месяца}.
+
+    Сводка: часы по дням (они же отметка, что день уже учтён), по задачам
+    и по приоритетам. Название, приоритет и объём задачи берутся из
+    tasks на момент архивации — потом задача может быть удалена.
+    """
+    months = {}
+    for date_str, overrides in days.items():
+        day = template.materialize(date_str, overrides)
+        month = months.setdefault(date_str[:7], {"days": {}, "hours": 0, "tasks": {}, "priorities": {}})
+        hours = 0
+        for _, slot_type, task, task_id in day.items():
+            if not task or slot_type == "lecture":
+                continue
+            ref = task_id or task
+            summary = tasks.get(ref) or {}
+            entry = month["tasks"].setdefault(_key(ref), {
+                "name": summary.get("name", "Удалённая задача"),
+                "priority": summary.get("priority", "не указан"),
+                "hours": 0,
+            })
+            if summary.get("time_required"):
+                entry["time_required"] = summary["time_required"]
+            entry["hours"] += SLOT_HOURS
+            priority = _key(entry["priority"])
+            month["priorities"][priority] = month["priorities"].get(priority, 0) + SLOT_HOURS
+            hours += SLOT_HOURS
+        month["days"][date_str] = hours
+        month["hours"] += hours
+    return months
+
+
+def archived_days(current: dict) -> set:
+    """Дни, уже учтённые в сохранённых сводках {"YYYY-MM": сводка}"""
+    return {date_str for month in current.values() for date_str in ((month or {}).get("days") or {})}
+
+
+def merge_month(current: dict, addition: dict) -> dict:
+    """Сводка месяца current (может быть None) плюс сводка addition"""
+    merged = {
+        "days": dict((current or {}).get("days") or {}),
+        "hours": (current or {}).get("hours", 0),
+        "tasks": {key: dict(entry) for key, entry in ((current or {}).get("tasks") or {}).items()},
+        "priorities": dict((current or {}).get("priorities") or {}),
+    }
+    merged["days"].update(addition["days"])
+    merged["hours"] += addition["hours"]
+    for key, entry in addition["tasks"].items():
+        target = merged["tasks"].setdefault(key, {**entry, "hours": 0})
+        target["hours"] += entry["hours"]
+        if "time_required" in entry:
+            target["time_required"] = entry["time_required"]
+    for priority, hours in addition["priorities"].items():
+        merged["priorities"][priority] = merged["priorities"].get(priority, 0) + hours
+    return merged
+
+
+def archive_stats(months: dict) -> dict:
+    """Итоги по сводкам месяцев {"YYYY-MM": сводка} без обращения к сырым блокам.
+
+    Выполнение задачи — доля её объёма (time_required), отработанная
+    в архивированных днях за все переданные месяцы.
+    """
+    tasks = {}
+    priorities = {}
+    hours = 0
+    task_days = 0
+    for month in months.values():
+        hours += month.get("hours", 0)
+        task_days += sum(1 for day_hours in (month.get("days") or {}).values() if day_hours > 0)
+        for priority, value in (month.get("priorities") or {}).items():
+            priorities[priority] = priorities.get(priority, 0) + value
+        for key, entry in (month.get("tasks") or {}).items():
+            total = tasks.setdefault(key, {**entry, "hours": 0})
+            total["hours"] += entry.get("hours", 0)
+    for entry in tasks.values():
+        required = entry.get("time_required")
+        entry["completion"] = min(1.0, entry["hours"] / float(required)) if required else None
+    return {
+        "months": sorted(months),
+        "hours": hours,
+        "task_days": task_days,
+        "priorities": priorities,
+        "tasks": sorted(tasks.values(), key=lambda entry: -entry["hours"]),
+        "completed": sum(1 for entry in tasks.values() if entry["completion"] == 1.0),
+    }
+
+
+def render_stats(stats: dict, limit: int = 10) -> str:
+    if not stats["months"]:
+        return "📊 В архиве пока нет прошедших дней."
+    period = stats["months"][0] if len(stats["months"]) == 1 else f"{stats['months'][0]} — {stats['months'][-1]}"
+    lines = [
+        f"📊 *Статистика за {period}*\n",
+        f"Часов на задачи: {stats['hours']:g} (дней с задачами: {stats['task_days']})",
+        f"Задач выполнено по объёму: {stats['completed']} из {len(stats['tasks'])}",
+    ]
+    if stats["priorities"]:
+        lines.append("\n*По приоритетам:*")
+        lines.extend(f"- {priority}: {hours:g} ч" for priority, hours in
+                     sorted(stats["priorities"].items(), key=lambda item: -item[1]))
+    if stats["tasks"]:
+        lines.append("\n*По задачам:*")
+        for entry in stats["tasks"][:limit]:
+            completion = f" ({entry['completion']:.0%})" if entry["completion"] is not None else ""
+            lines.append(f"- {entry['name']}: {entry['hours']:g} ч{completion}")
+    return "\n".join(lines)
+
+
+class ScheduleCompactor(BackgroundJob):
+    """Фоновая архивация прошедших дней schedule/{uid}.
+
+    Дни старше keep_days сворачиваются в сводки archive/{uid}/{YYYY-MM},
+    после чего сырые блоки удаляются (Repository.archive_days). Так
+    schedule/{uid} не растёт бесконечно, а статистика читает только архив.
+
+    Запускается через JobQueue (tick) в непиковое окно offpeak: раз в сутки
+    получает список пользователей (только ключи schedule) и обрабатывает
+    их пачками по batch_size не чаще rate_per_sec; за один заход у
+    пользователя архивируется не больше max_days дней. owns(user_id)
+    оставляет только пользователей этого воркера, чтобы несколько процессов
+    не архивировали одни и те же дни.
+    """
+
+    def __init__(self, repository, keep_days: int = 7, batch_size: int = 50,
+                 rate_per_sec: float = 10.0, max_days: int = 366, offpeak: tuple = None, owns=None):
+        super().__init__(batch_size, rate_per_sec, offpeak)
+        self.repository = repository
+        self.owns = owns
+        self.keep_days = keep_days
+        self.max_days = max_days
+        self.queue = []
+        self.scanned = None  # дата последнего получения списка пользователей
+        self.users = 0
+        self.days = 0
+
+    def cutoff(self, today: date = None) -> date:
+        """Первый день, который ещё остаётся в schedule"""
+        return (today or date.today()) - timedelta(days=self.keep_days)
+
+    async def tick(self, context=None):
+        if not self.in_offpeak():
+            return
+        today = date.today()
+        if not self.queue and self.scanned != today:
+            self.queue = [user_id for user_id in await self.repository.get_schedule_users()
+                          if self.owns is None or self.owns(user_id)]
+            self.scanned = today
+        batch, self.queue = self.queue[:self.batch_size], self.queue[self.batch_size:]
+        cutoff = self.cutoff(today)
+
+        async def compact(user_id):
+            if await self.compact_user(user_id, cutoff) >= self.max_days:
+                self.queue.append(user_id)  # остались ещё более поздние дни
+
+        await self.run_batch(batch, compact, "Не удалось архивировать расписание %s")
+
+    async def compact_user(self, user_id: str, cutoff: date) -> int:
+        """Архивирует дни пользователя до cutoff (не включая); возвращает их число"""
+        repository = self.repository
+        days = await repository.get_past_days(user_id, cutoff, limit=self.max_days)
+        if not days:
+            return 0
+        await repository.archive_days(user_id, days)
+        self.users += 1
+        self.days += len(days)
+        return len(days)
+
+    def stats(self) -> dict:
+        return {
+            "queue": len(self.queue),
+            "users": self.users,
+            "days": self.days,
+            "errors": self.errors,
+        }
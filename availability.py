@@ -0,0 +1,179 @@
+from array import array
+from datetime import date, datetime, timedelta
+
+SLOTS_PER_DAY = 48
+DAY_MASK = (1 << SLOTS_PER_DAY) - 1
+# Поиск свободных блоков начинается с 08:00, полночные 00:00/00:30 — в конце дня
+DAY_START_SLOT = 16
+
+
+def slot_index(time_str: str) -> int:
+    """"HH:MM" -> номер получасового блока (00:00 = 0)"""
+    return int(time_str[:2]) * 2 + (1 if time_str[3:5] >= "30" else 0)
+
+
+def slot_time(index: int) -> str:
+    return f"{index // 2:02d}:{(index % 2) * 30:02d}"
+
+
+def _parse_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+class AvailabilityIndex:
+    """Битовый индекс свободных блоков пользователя.
+
+    На каждый день непрерывного диапазона дат хранятся две 48-битные маски
+    в array('Q'): блоки с type == "free" и блоки, к которым привязана задача.
+    Доступный блок — free & ~taken.
+
+    fill(date) -> (free, taken) задаёт маски для дней, которые появляются
+    при расширении диапазона (например, из недельного шаблона).
+    """
+
+    def __init__(self, start=None, fill=None):
+        self.start = _parse_date(start) if start is not None else None
+        self.fill = fill
+        self.free = array("Q")
+        self.taken = array("Q")
+
+    def _offset(self, day: date, grow: bool) -> int:
+        if self.start is None:
+            if not grow:
+                return -1
+            self.start = day
+        offset = (day - self.start).days
+        if offset < 0:
+            if not grow:
+                return -1
+            # Расширяем диапазон влево
+            free, taken = self._filled(day, -offset)
+            self.free = free + self.free
+            self.taken = taken + self.taken
+            self.start = day
+            offset = 0
+        if offset >= len(self.free):
+            if not grow:
+                return -1
+            free, taken = self._filled(self.start + timedelta(days=len(self.free)),
+                                       offset + 1 - len(self.free))
+            self.free.extend(free)
+            self.taken.extend(taken)
+        return offset
+
+    def _filled(self, first: date, count: int) -> tuple:
+        if self.fill is None:
+            return array("Q", bytes(8 * count)), array("Q", bytes(8 * count))
+        free, taken = array("Q"), array("Q")
+        for offset in range(count):
+            day_free, day_taken = self.fill(first + timedelta(days=offset))
+            free.append(day_free)
+            taken.append(day_taken)
+        return free, taken
+
+    def copy(self) -> "AvailabilityIndex":
+        """Независимая копия (например, для планировщика в другом потоке)"""
+        index = AvailabilityIndex(fill=self.fill)
+        index.start = self.start
+        index.free = array("Q", self.free)
+        index.taken = array("Q", self.taken)
+        return index
+
+    def trim_before(self, day):
+        """Выбрасывает из индекса дни раньше day"""
+        if self.start is None:
+            return
+        drop = min((_parse_date(day) - self.start).days, len(self.free))
+        if drop > 0:
+            del self.free[:drop]
+            del self.taken[:drop]
+            self.start += timedelta(days=drop)
+
+    def ensure(self, until):
+        """Гарантирует, что диапазон индекса покрывает даты до until включительно"""
+        self._offset(_parse_date(until), grow=True)
+
+    def set_day(self, date_str, day):
+        """day — словарь блоков дня или PackedDay"""
+        if hasattr(day, "masks"):
+            free, taken = day.masks()
+        else:
+            free = taken = 0
+            for time_str, block in (day or {}).items():
+                if not isinstance(block, dict):
+                    continue
+                bit = 1 << slot_index(time_str)
+                if block.get("type") == "free":
+                    free |= bit
+                if block.get("task"):
+                    taken |= bit
+        offset = self._offset(_parse_date(date_str), grow=True)
+        self.free[offset] = free
+        self.taken[offset] = taken
+
+    def apply(self, path: str, value):
+        """Синхронизирует индекс с записью "date/time[/field]" в schedule/{uid}"""
+        parts = path.split("/")
+        if len(parts) == 1:
+            self.set_day(parts[0], value)
+            return
+        offset = self._offset(_parse_date(parts[0]), grow=True)
+        bit = 1 << slot_index(parts[1])
+        if len(parts) == 2:
+            block = value if isinstance(value, dict) else {}
+            is_free = block.get("type") == "free"
+            is_taken = bool(block.get("task"))
+        else:
+            field = parts[2]
+            is_free = bool(self.free[offset] & bit)
+            is_taken = bool(self.taken[offset] & bit)
+            if field == "type":
+                is_free = value == "free"
+            elif field == "task":
+                is_taken = bool(value)
+            else:
+                return
+        self.free[offset] = (self.free[offset] | bit) if is_free else (self.free[offset] & ~bit)
+        self.taken[offset] = (self.taken[offset] | bit) if is_taken else (self.taken[offset] & ~bit)
+
+    def available_mask(self, date_str) -> int:
+        offset = self._offset(_parse_date(date_str), grow=False)
+        if offset < 0:
+            return 0
+        return self.free[offset] & ~self.taken[offset] & DAY_MASK
+
+    def is_available(self, date_str, time_str: str) -> bool:
+        return bool(self.available_mask(date_str) >> slot_index(time_str) & 1)
+
+    def first_free(self, start_date, deadline, count: int, per_day: int = 6) -> list:
+        """Первые count свободных блоков с start_date по deadline включительно,
+        не более per_day в день. Возвращает [{"date": ..., "time": ...}]"""
+        result = []
+        if self.start is None or count <= 0:
+            return result
+        first = max(self._offset_unchecked(_parse_date(start_date)), 0)
+        last = min(self._offset_unchecked(_parse_date(deadline)), len(self.free) - 1)
+        for offset in range(first, last + 1):
+            mask = self.free[offset] & ~self.taken[offset] & DAY_MASK
+            if not mask:
+                continue
+            # Поворачиваем маску так, чтобы нулевой бит соответствовал 08:00
+            mask = (mask >> DAY_START_SLOT) | ((mask << (SLOTS_PER_DAY - DAY_START_SLOT)) & DAY_MASK)
+            date_str = (self.start + timedelta(days=offset)).strftime("%Y-%m-%d")
+            take = min(per_day, count - len(result))
+            while mask and take:
+                low = mask & -mask
+                mask ^= low
+                bit = (low.bit_length() - 1 + DAY_START_SLOT) % SLOTS_PER_DAY
+                result.append({"date": date_str, "time": slot_time(bit)})
+                take -= 1
+            if len(result) >= count:
+                break
+        return result
+
+    def _offset_unchecked(self, day: date) -> int:
+        return (day - self.start).days
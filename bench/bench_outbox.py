@@ -0,0 +1,113 @@
+"""Проверка планировщика исходящих сообщений без Telegram: приоритет ответов
+над рассылкой напоминаний, лимит чата, объединение правок, деление длинных
+сообщений и повтор после RetryAfter.
+
+Отправка имитируется задержкой; лимиты масштабированы (x10), чтобы
+прогон занимал секунды.
+
+    python bench/bench_outbox.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import RetryAfter  # noqa: E402
+
+from outbox import OutboundScheduler  # noqa: E402
+
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.005):
+        self.latency = latency
+        self.calls = []  # (время, метод, chat_id, текст)
+        self.flood = set()  # chat_id, которым один раз ответить RetryAfter
+
+    async def post(self, endpoint, data, **kwargs):
+        await asyncio.sleep(self.latency)
+        if data["chat_id"] in self.flood:
+            self.flood.discard(data["chat_id"])
+            raise RetryAfter(0.2)
+        self.calls.append((time.monotonic(), endpoint, data["chat_id"], data.get("text")))
+        return {"ok": True}
+
+
+async def send(scheduler, telegram, endpoint, lane=None, **data):
+    return await scheduler.process_request(
+        telegram.post, (endpoint, data), {}, endpoint, data, lane)
+
+
+async def priority(reminders: int = 1000, replies: int = 50):
+    scheduler = OutboundScheduler(global_rate=300, chat_rate=10, chat_burst=3)
+    await scheduler.initialize()
+    telegram = FakeTelegram()
+    began = time.monotonic()
+    broadcast = [asyncio.ensure_future(send(scheduler, telegram, "sendMessage", "reminder",
+                                            chat_id=chat_id, text="⏰ напоминание"))
+                 for chat_id in range(100000, 100000 + reminders)]
+    await asyncio.sleep(0.5)
+    answered = []
+    for chat_id in range(replies):
+        sent = time.monotonic()
+        await send(scheduler, telegram, "sendMessage", chat_id=chat_id, text="ответ")
+        answered.append(time.monotonic() - sent)
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*broadcast)
+    answered.sort()
+    stats = scheduler.stats()["lanes"]
+    print(f"{reminders} напоминаний за {time.monotonic() - began:.2f} c "
+          f"(ожидание p95 {stats['reminder']['wait']['p95']} c); "
+          f"ответы во время рассылки: p50 {answered[len(answered) // 2] * 1000:.0f} мс, "
+          f"max {answered[-1] * 1000:.0f} мс")
+    await scheduler.shutdown()
+
+
+async def per_chat(messages: int = 13):
+    scheduler = OutboundScheduler(global_rate=300, chat_rate=10, chat_burst=3)
+    await scheduler.initialize()
+    telegram = FakeTelegram(latency=0)
+    await asyncio.gather(*(send(scheduler, telegram, "sendMessage", chat_id=1, text=str(number))
+                           for number in range(messages)))
+    times = [call[0] for call in telegram.calls]
+    order = [call[3] for call in telegram.calls] == [str(number) for number in range(messages)]
+    print(f"{messages} сообщений в один чат (10/с, запас 3): {times[-1] - times[0]:.2f} c, порядок сохранён: {order}")
+    await scheduler.shutdown()
+
+
+async def edits_and_split():
+    scheduler = OutboundScheduler(global_rate=300, chat_rate=10, chat_burst=3)
+    await scheduler.initialize()
+    telegram = FakeTelegram(latency=0.05)
+    edits = [asyncio.ensure_future(send(scheduler, telegram, "editMessageText",
+                                        chat_id=5, message_id=7, text=f"страница {page}"))
+             for page in range(20)]
+    await asyncio.gather(*edits)
+    texts = [call[3] for call in telegram.calls]
+    print(f"20 правок подряд: отправлено {len(texts)}, последняя — «{texts[-1]}», "
+          f"объединено {scheduler.coalesced}")
+
+    telegram.calls.clear()
+    text = "\n\n".join(f"• *Задача {number}*\n  ⏳ 2 ч | 📅 2030-01-01\n  📝 " + "заметка " * 10
+                       for number in range(150))
+    await send(scheduler, telegram, "sendMessage", chat_id=6, text=text, reply_markup="kb")
+    sizes = [len(call[3]) for call in telegram.calls]
+    print(f"сообщение из {len(text)} символов отправлено частями {sizes}")
+
+    telegram.calls.clear()
+    telegram.flood.add(8)
+    began = time.monotonic()
+    await send(scheduler, telegram, "sendMessage", chat_id=8, text="после паузы")
+    print(f"RetryAfter: повторов {scheduler.retried}, доставлено через {time.monotonic() - began:.2f} c")
+    await scheduler.shutdown()
+
+
+async def main():
+    await priority()
+    await per_chat()
+    await edits_and_split()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""Память и размер полезной нагрузки: дерево словарей против PackedDay.
+
+    python bench/bench_packed_day.py
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from packed_day import PackedDay  # noqa: E402
+
+USERS = 100
+DAYS = 30
+
+
+def make_day(day_offset: int) -> dict:
+    day = {}
+    for hour in range(1, 8):
+        for minute in (0, 30):
+            day[f"{hour:02d}:{minute:02d}"] = {"type": "sleep"}
+    for hour in [*range(8, 24), 0]:
+        for minute in (0, 30):
+            day[f"{hour:02d}:{minute:02d}"] = {"type": "free"}
+    if day_offset % 7 in (0, 1, 3, 4):
+        for time_key in ("12:30", "13:00", "13:30", "14:00"):
+            day[time_key] = {"type": "lecture", "task": "Лаб. по ML"}
+    for time_key in ("15:00", "15:30", "16:00"):
+        day[time_key] = {"type": "free", "task": f"-NxTask{day_offset:04d}abcde"}
+    return day
+
+
+def measure(build) -> tuple:
+    tracemalloc.start()
+    began = time.perf_counter()
+    data = build()
+    elapsed = time.perf_counter() - began
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return data, current, elapsed
+
+
+def main():
+    # Словари строим из JSON, как их возвращает firebase_admin
+    raw = [json.dumps(make_day(offset), ensure_ascii=False) for offset in range(DAYS)]
+
+    dicts, dict_bytes, dict_time = measure(
+        lambda: [[json.loads(day) for day in raw] for _ in range(USERS)]
+    )
+    packed, packed_bytes, packed_time = measure(
+        lambda: [[PackedDay.from_dict(day) for day in user] for user in dicts]
+    )
+
+    for user_days, user_packed in zip(dicts, packed):
+        for day, packed_day in zip(user_days, user_packed):
+            assert PackedDay.from_dict(packed_day.to_dict()).to_dict() == packed_day.to_dict()
+            assert packed_day.to_dict() == day
+
+    tree_payload = sum(len(day.encode()) for day in raw)
+    packed_payload = sum(
+        len(json.dumps(day.to_json(), ensure_ascii=False).encode()) for day in packed[0]
+    )
+
+    print(f"{USERS} users x {DAYS} days")
+    print(f"memory:  dict tree {dict_bytes / 1024:>9.1f} KiB   packed {packed_bytes / 1024:>9.1f} KiB"
+          f"   x{dict_bytes / packed_bytes:.1f}")
+    print(f"payload: dict tree {tree_payload / 1024:>9.1f} KiB   packed {packed_payload / 1024:>9.1f} KiB"
+          f"   x{tree_payload / packed_payload:.1f}   (per user, {DAYS} days)")
+    print(f"pack time: {packed_time * 1000 / (USERS * DAYS):.3f} ms/day")
+
+
+if __name__ == "__main__":
+    main()
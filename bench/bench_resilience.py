@@ -0,0 +1,89 @@
+"""Проверка слоя устойчивости Repository на FaultInjectingBackend:
+повторы при доле сбоев, объединение одинаковых чтений, отказ хранилища
+с устаревшими данными из кэша и восстановление предохранителя.
+
+    python bench/bench_resilience.py
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import LRUCache  # noqa: E402
+from repository import Repository  # noqa: E402
+from resilience import CircuitBreaker, RetryPolicy, StorageUnavailable  # noqa: E402
+from storage import FaultInjectingBackend, MemoryBackend  # noqa: E402
+
+
+def make_repository(failure_rate: float = 0.0, latency: float = 0.0, ttl: float = 300):
+    backend = FaultInjectingBackend(MemoryBackend(), failure_rate=failure_rate, latency=latency, seed=1)
+    repository = Repository(
+        backend, LRUCache(ttl=ttl),
+        retry=RetryPolicy(attempts=4, base_delay=0.001, max_delay=0.01),
+        breaker=CircuitBreaker(failure_threshold=5, reset_timeout=0.2),
+    )
+    return repository, backend
+
+
+async def retries(failure_rate: float, reads: int = 500):
+    repository, backend = make_repository(failure_rate)
+    repository.breaker.failure_threshold = 10 ** 9  # здесь проверяем только повторы
+    failed = 0
+    for number in range(reads):
+        repository.cache.clear()
+        try:
+            await repository.get_tasks(str(number % 20))
+        except StorageUnavailable:
+            failed += 1
+    print(f"сбоев {failure_rate:.0%}: успешных чтений {reads - failed}/{reads}, "
+          f"повторов {repository.retries}, вызовов хранилища {backend.calls}")
+
+
+async def coalescing(readers: int = 200):
+    repository, backend = make_repository(latency=0.02)
+    day = date.today().isoformat()
+    await repository.get_template("1")
+    calls = backend.calls
+    began = time.perf_counter()
+    await asyncio.gather(*(repository.get_day_schedule("1", day) for _ in range(readers)))
+    print(f"{readers} одновременных чтений дня: вызовов хранилища {backend.calls - calls}, "
+          f"объединено {repository.flights.shared}, {time.perf_counter() - began:.3f} c")
+
+
+async def outage():
+    repository, backend = make_repository(ttl=0.05)
+    days = [(date.today() + timedelta(days=offset)).isoformat() for offset in range(3)]
+    for day in days:
+        await repository.get_day_schedule("1", day)
+    await asyncio.sleep(0.06)  # кэш просрочен
+
+    backend.down = True
+    served = errors = 0
+    for _ in range(20):
+        for day in days + ["2099-01-01"]:
+            try:
+                await repository.get_day_schedule("1", day)
+                served += 1
+            except StorageUnavailable:
+                errors += 1
+    print(f"отказ хранилища: отдано из устаревшего кэша {served}, ошибок {errors}, "
+          f"предохранитель {repository.breaker.state}, вызовов {backend.calls}")
+
+    backend.down = False
+    await asyncio.sleep(0.25)
+    await repository.get_day_schedule("1", days[0])
+    print(f"после восстановления: предохранитель {repository.breaker.state}")
+
+
+async def main():
+    for failure_rate in (0.1, 0.3, 0.5):
+        await retries(failure_rate)
+    await coalescing()
+    await outage()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
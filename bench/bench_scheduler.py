@@ -0,0 +1,81 @@
+"""Бенчмарк scheduler.plan_schedule: время расчёта в зависимости от числа
+задач и длины горизонта.
+
+    python bench/bench_scheduler.py
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from availability import AvailabilityIndex  # noqa: E402
+from scheduler import plan_schedule  # noqa: E402
+
+PRIORITIES = {"urgent": 4, "high": 3, "medium": 2, "low": 1}
+PRIORITY_LABELS = ["urgent 🔴", "high 🟠", "medium 🟡", "low ⚪"]
+
+
+def make_index(start: datetime, days: int) -> AvailabilityIndex:
+    index = AvailabilityIndex()
+    for offset in range(days):
+        day = {}
+        for hour in range(1, 8):
+            for minute in (0, 30):
+                day[f"{hour:02d}:{minute:02d}"] = {"type": "sleep"}
+        for hour in [*range(8, 24), 0]:
+            for minute in (0, 30):
+                day[f"{hour:02d}:{minute:02d}"] = {"type": "free"}
+        if offset % 7 in (0, 1, 3, 4):
+            for time_key in ("12:30", "13:00", "13:30", "14:00"):
+                day[time_key] = {"type": "lecture", "task": "Лекция"}
+        index.set_day((start + timedelta(days=offset)).strftime("%Y-%m-%d"), day)
+    return index
+
+
+def make_tasks(start: datetime, count: int, days: int, rng: random.Random) -> dict:
+    return {
+        f"task{i}": {
+            "name": f"Задача {i}",
+            "priority": rng.choice(PRIORITY_LABELS),
+            "time_required": rng.choice([0.5, 1, 1.5, 2, 3, 4]),
+            "deadline": (start + timedelta(days=rng.randrange(1, days))).strftime("%Y-%m-%d"),
+        }
+        for i in range(count)
+    }
+
+
+def run(count: int, days: int, repeats: int = 5) -> tuple:
+    rng = random.Random(count * 1000 + days)
+    start = datetime(2026, 1, 5, 0, 0)
+    index = make_index(start, days)
+    tasks = make_tasks(start, count, days, rng)
+
+    # Первый прогон — «холодное» распределение, затем применяем и считаем
+    # повторный (инкрементальный) прогон, где дифф должен быть минимальным
+    plan = plan_schedule(tasks, index, PRIORITIES, now=start)
+    for task_id, values in plan["task_updates"].items():
+        tasks[task_id].update(values)
+    for path, value in plan["schedule_updates"].items():
+        index.apply(path, value)
+
+    best = float("inf")
+    for _ in range(repeats):
+        began = time.perf_counter()
+        replan = plan_schedule(tasks, index, PRIORITIES, now=start)
+        best = min(best, time.perf_counter() - began)
+    return best, len(plan["schedule_updates"]), len(replan["schedule_updates"]), len(plan["unscheduled"])
+
+
+def main():
+    print(f"{'tasks':>6} {'days':>5} {'ms':>9} {'cold diff':>10} {'re-plan diff':>13} {'unscheduled':>12}")
+    for days in (30, 90, 365):
+        for count in (10, 100, 300, 1000):
+            seconds, cold, warm, unscheduled = run(count, days)
+            print(f"{count:>6} {days:>5} {seconds * 1000:>9.2f} {cold:>10} {warm:>13} {unscheduled:>12}")
+
+
+if __name__ == "__main__":
+    main()
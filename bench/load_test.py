@@ -0,0 +1,216 @@
+"""Нагрузочный тест обработчиков бота без Telegram и без Firebase.
+
+N пользователей параллельно проходят сценарий через настоящие обработчики
+из main.py: /start -> /addtask -> режим -> приоритет -> ввод задачи ->
+авто- или ручное распределение -> план на день -> /deletetask.
+Updates синтетические, хранилище — MemoryBackend (или SQLite), при желании
+с искусственной сетевой задержкой.
+
+    python bench/load_test.py --users 200 --latency-ms 20 --manual-ratio 0.3
+"""
+import argparse
+import asyncio
+import contextvars
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+current_action = contextvars.ContextVar("current_action", default="other")
+
+
+# ------------------- Синтетические объекты Telegram -------------------
+
+class FakeMessage:
+    def __init__(self, chat_id: int, text: str = None):
+        self.chat = SimpleNamespace(id=chat_id)
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return self
+
+
+class FakeCallbackQuery:
+    def __init__(self, chat_id: int, data: str):
+        self.data = data
+        self.message = FakeMessage(chat_id)
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text, **kwargs):
+        self.message.replies.append(text)
+        return self.message
+
+
+def make_update(chat_id: int, text: str = None, data: str = None):
+    return SimpleNamespace(
+        message=FakeMessage(chat_id, text) if data is None else None,
+        callback_query=FakeCallbackQuery(chat_id, data) if data is not None else None,
+        effective_chat=SimpleNamespace(id=chat_id),
+        effective_user=SimpleNamespace(id=chat_id),
+    )
+
+
+class FakeApplication:
+    def __init__(self):
+        self.tasks = []
+
+    def create_task(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.append(task)
+        return task
+
+
+# ------------------- Учёт запросов к хранилищу -------------------
+
+class SlowBackend:
+    """Прокси бэкенда с искусственной задержкой каждого вызова"""
+
+    def __init__(self, inner, latency: float):
+        self._inner = inner
+        self._latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self._inner, name)
+        if not callable(attr) or not self._latency:
+            return attr
+
+        def call(*args, **kwargs):
+            time.sleep(self._latency)
+            return attr(*args, **kwargs)
+        return call
+
+
+def count_storage_calls(main, counts: dict):
+    """Считает походы в хранилище по текущему действию пользователя.
+
+    Считается каждый вызов бэкенда, который видит InstrumentedBackend
+    (metrics.storage), а не Repository.run: один run может сделать
+    несколько запросов (get_task_summaries), а повторы — ещё больше.
+    run_in_executor не переносит contextvars в поток пула, поэтому
+    действие передаётся в поток вместе с вызовом.
+    """
+    lock = threading.Lock()
+    observe = main.metrics.observe_storage
+
+    def observe_storage(op, path, *args, **kwargs):
+        with lock:
+            counts[current_action.get()] += 1
+        observe(op, path, *args, **kwargs)
+
+    main.metrics.observe_storage = observe_storage
+    executor = main.repository._executor
+    submit = executor.submit
+    executor.submit = lambda fn, *args: submit(contextvars.copy_context().run, fn, *args)
+
+
+# ------------------- Сценарий пользователя -------------------
+
+async def call(handler, update, context, latencies: dict, name: str = None):
+    name = name or handler.__name__
+    token = current_action.set(name)
+    began = time.perf_counter()
+    try:
+        await handler(update, context)
+    finally:
+        latencies[name].append(time.perf_counter() - began)
+        current_action.reset(token)
+
+
+async def simulate_user(main, chat_id: int, manual: bool, latencies: dict, rng: random.Random):
+    context = SimpleNamespace(user_data={}, args=[], application=FakeApplication())
+    name = f"Задача {chat_id}"
+    deadline = date.today() + timedelta(days=rng.randrange(7, 30))
+
+    await call(main.start, make_update(chat_id, "/start"), context, latencies)
+    await asyncio.gather(*context.application.tasks)
+    await call(main.add_task_start, make_update(chat_id, "/addtask"), context, latencies)
+    await call(main.ask_priority, make_update(chat_id, data="manual" if manual else "auto"),
+               context, latencies)
+    await call(main.handle_task_input, make_update(chat_id, data=rng.choice(
+        ["urgent 🔴", "high 🟠", "medium 🟡", "low ⚪"])), context, latencies)
+    for text, step in ((name, "input_name"), ("1.5", "input_time"),
+                       (deadline.strftime("%d.%m.%Y"), "input_deadline"),
+                       ("нагрузочный тест", "input_notes")):
+        await call(main.handle_task_input, make_update(chat_id, text), context, latencies,
+                   name=f"handle_task_input:{step}")
+
+    if manual:
+        day = date.today() + timedelta(days=1 + chat_id % 5)
+        minute = 8 * 60
+        while 'selected_blocks' in context.user_data and minute < 24 * 60:
+            text = f"{day.strftime('%d.%m.%Y')} {minute // 60:02d}:{minute % 60:02d}"
+            await call(main.handle_manual_blocks, make_update(chat_id, text), context, latencies)
+            minute += 30
+
+    await call(main.show_daily_plan, make_update(chat_id, "📝 План на день"), context, latencies)
+    context.args = name.split()
+    await call(main.delete_task, make_update(chat_id, f"/deletetask {name}"), context, latencies)
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+async def run(args):
+    import main
+
+    # Задержка — под InstrumentedBackend, чтобы она попадала в его замеры
+    if args.latency_ms:
+        main.backend.backend = SlowBackend(main.backend.backend, args.latency_ms / 1000)
+    counts = defaultdict(int)
+    count_storage_calls(main, counts)
+    latencies = defaultdict(list)
+    rng = random.Random(args.seed)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def user(chat_id):
+        async with semaphore:
+            await simulate_user(main, chat_id, rng.random() < args.manual_ratio, latencies, rng)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(user(100000 + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - began
+
+    total_actions = sum(len(values) for values in latencies.values())
+    print(f"backend={main.backend.name} users={args.users} concurrency={args.concurrency} "
+          f"latency={args.latency_ms}ms")
+    print(f"{'handler':<32} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'db/op':>7}")
+    for name, values in sorted(latencies.items()):
+        print(f"{name:<32} {len(values):>6} {percentile(values, 0.5) * 1000:>9.2f} "
+              f"{percentile(values, 0.95) * 1000:>9.2f} {percentile(values, 0.99) * 1000:>9.2f} "
+              f"{counts[name] / len(values):>7.2f}")
+    print(f"actions={total_actions} wall={elapsed:.2f}s throughput={total_actions / elapsed:.1f} actions/s "
+          f"db_calls={sum(counts.values())} repository={main.repository.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=100, help="одновременно активных пользователей")
+    parser.add_argument("--latency-ms", type=float, default=0, help="искусственная задержка вызова хранилища")
+    parser.add_argument("--manual-ratio", type=float, default=0.3)
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ["METRICS_ENABLED"] = "1"  # походы в хранилище считает InstrumentedBackend
+    if args.backend == "sqlite":
+        os.environ.setdefault("SQLITE_PATH", "loadtest.db")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Маркер промаха (None — допустимое закэшированное значение: «в базе пусто»)
+MISSING = object()
+
+
+def estimate_size(value) -> int:
+    """Приблизительный размер значения в байтах (по JSON-представлению)"""
+    approx_size = getattr(value, "approx_size", None)
+    if approx_size is not None:
+        return approx_size
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode())
+    except (TypeError, ValueError):
+        return 256
+
+
+class LRUCache:
+    """Ограниченный по памяти LRU-кэш с TTL.
+
+    Ключи — кортежи вида ("schedule", user_id, date) или ("tasks", user_id).
+    Потокобезопасен: к нему обращаются и корутины, и код в asyncio.to_thread.
+
+    У каждого ключа есть версия: её меняют invalidate(), touch() и set()
+    без version, даже если записи в кэше нет. Чтение с промахом берёт
+    метку version() до похода в хранилище и кладёт результат через
+    set(..., version=метка): если за время чтения ключ сбросила запись,
+    устаревшее значение в кэш не попадает.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0  # чтений, опоздавших к записи (set с устаревшей меткой)
+        # Версии — значения общего счётчика; у ключа без записи — _floor
+        self._clock = 0
+        self._floor = 0
+        self._versions = {}  # key -> версия
+        self._user_versions = {}  # user_id -> версия (invalidate_user)
+
+    def get(self, key):
+        """Свежее значение или MISSING. Просроченная запись остаётся до вытеснения
+        или записи — её можно отдать через get_stale(), пока хранилище недоступно"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key):
+        """Как get(), но без учёта в счётчиках и без продления LRU.
+
+        Просроченную запись удаляет: peek используется при записи
+        (write-through), и устаревшая копия не должна разойтись с базой."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                return MISSING
+            return entry[2]
+
+    def get_stale(self, key):
+        """Значение независимо от TTL (MISSING, если записи нет)"""
+        with self._lock:
+            entry = self._data.get(key)
+            return MISSING if entry is None else entry[2]
+
+    def version(self, *keys) -> tuple:
+        """Метка версий keys для set(..., version=...); хешируема — годится
+        в ключ объединения одинаковых чтений"""
+        with self._lock:
+            return tuple((key, self._version(key)) for key in keys)
+
+    def set(self, key, value, version: tuple = None):
+        """Запись значения. С version (меткой из version()) — только если ни
+        один из ключей метки не менялся; без неё — это запись, и версия
+        ключа меняется"""
+        size = estimate_size(value)
+        with self._lock:
+            if version is None:
+                self._bump(key)
+            elif any(self._version(k) != v for k, v in version):
+                self.rejected += 1
+                return
+            if key in self._data:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._data:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def touch(self, key):
+        """Пересчитывает размер записи после изменения значения на месте.
+        Версия меняется и без записи: данные в хранилище изменились"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self.set(key, entry[2])
+            else:
+                self._bump(key)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._bump(key)
+            if key in self._data:
+                self._drop(key)
+
+    def invalidate_user(self, user_id: str):
+        with self._lock:
+            self._clock += 1
+            self._user_versions[user_id] = self._clock
+            for key in [k for k in self._data if len(k) > 1 and k[1] == user_id]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self._clock += 1
+            self._forget_versions()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+            }
+
+    def _version(self, key) -> int:
+        version = self._versions.get(key, self._floor)
+        if len(key) > 1:
+            version = max(version, self._user_versions.get(key[1], self._floor))
+        return version
+
+    def _bump(self, key):
+        self._clock += 1
+        self._versions[key] = self._clock
+        if len(self._versions) > 4 * len(self._data) + 1024:
+            self._forget_versions()
+
+    def _forget_versions(self):
+        # Все ключи получают текущее значение счётчика: метки, взятые до
+        # последнего изменения, меньше него и по-прежнему отвергаются
+        self._floor = self._clock
+        self._versions.clear()
+        self._user_versions.clear()
+
+    def _drop(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
@@ -0,0 +1,71 @@
+PLAN_FIELDS = ("name", "priority", "notes")  # поля задачи, которые видны в плане
+
+
+class DailyPlan:
+    """Материализованный план дня: блоки расписания, соединённые с задачами.
+
+    Хранит только то, что нужно для показа, — (время, название, приоритет,
+    заметки) для каждого занятого блока, — и набор task_id, от которых
+    план зависит. Текст собирается один раз при первом показе.
+    """
+
+    __slots__ = ("date", "entries", "task_ids", "_text")
+
+    def __init__(self, date_str: str, entries: list, task_ids: set):
+        self.date = date_str
+        self.entries = entries
+        self.task_ids = task_ids
+        self._text = None
+
+    @staticmethod
+    def referenced_ids(day) -> set:
+        """id задач, на которые ссылаются блоки дня (авто — в task, ручные — в task_id)"""
+        return {
+            task_id or task
+            for _, slot_type, task, task_id in day.items()
+            if task and slot_type != "lecture"
+        }
+
+    @classmethod
+    def build(cls, date_str: str, day, tasks: dict) -> "DailyPlan":
+        """Одно соединение: блоки дня × сводки задач"""
+        entries = []
+        task_ids = set()
+        for time_slot, slot_type, task, task_id in day.items():
+            if not task:
+                continue
+            ref = task_id or task
+            if slot_type == "lecture":
+                summary, default_name = {}, task
+            else:
+                summary, default_name = tasks.get(ref) or {}, "Задача"
+                task_ids.add(ref)
+            entries.append((
+                time_slot,
+                summary.get("name", default_name),
+                summary.get("priority", "не указан"),
+                summary.get("notes", "нет"),
+            ))
+        return cls(date_str, entries, task_ids)
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            if not self.entries:
+                self._text = "На сегодня задач нет. Отдыхайте! 😊"
+            else:
+                self._text = "📅 *Ваш план на сегодня:*\n\n" + "".join(
+                    f"⏰ *{time_slot}*\n"
+                    f"• {name}\n"
+                    f"• Приоритет: {priority}\n"
+                    f"• Заметки: {notes}\n\n"
+                    for time_slot, name, priority, notes in self.entries
+                )
+        return self._text
+
+    @property
+    def approx_size(self) -> int:
+        return 128 + sum(
+            64 + 2 * (len(name or "") + len(priority or "") + len(str(notes)))
+            for _, name, priority, notes in self.entries
+        )
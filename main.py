@@ -1,103 +1,152 @@
-import firebase_admin
-from firebase_admin import credentials, db
 from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Updater, CommandHandler, MessageHandler, filters, CallbackContext, CallbackQueryHandler, Application
+from telegram.ext import CommandHandler, MessageHandler, filters, CallbackContext, CallbackQueryHandler, Application
 from datetime import datetime, timedelta
 import asyncio
-import os, sys, logging, json
+import os, logging
 from dotenv import load_dotenv
 from math import ceil
+from cache import LRUCache
+from repository import Repository
+from storage import ConflictError, create_backend
+from resilience import CircuitBreaker, RetryPolicy, StorageUnavailable
+from scheduler import MAX_PLAN_DAYS, displaced_tasks, plan_schedule
+from materializer import HorizonMaterializer, parse_window
+from reminders import ReminderEngine
+from archive import ScheduleCompactor, archive_stats, render_stats
+from task_import import DocumentError, export_document, parse_document, validate_rows
+from schedule_view import FREE_PAGE_SIZE, page_keyboard, render_free_slots
+from templates import SETTINGS_HELP, describe_template, edit_template
+from pipeline import AdmissionQueue, ChatSerializer, SerializedApplication
+from outbox import OutboundScheduler
+from persistence import SqlitePersistence
+from metrics import InstrumentedBackend, Metrics, flatten, setup_exporters, setup_logging
 
 load_dotenv()
 
-# Получаем JSON-ключ из переменной окружения
-firebase_config = json.loads(os.getenv('FIREBASE_KEY'))
+# Логи: уровень и доля DEBUG/INFO-записей, которые реально пишутся
+setup_logging(os.getenv("LOG_LEVEL", "INFO"), float(os.getenv("LOG_SAMPLE_RATE", 1)))
 
-# Инициализация Firebase
-cred = credentials.Certificate(firebase_config)
-firebase_admin.initialize_app(cred, {
-    "databaseURL": "https://urroutine-default-rtdb.firebaseio.com"
-})
+# Метрики обработчиков и хранилища; размер данных считается для доли вызовов
+metrics = Metrics(payload_sample=float(os.getenv("METRICS_PAYLOAD_SAMPLE", 0.1)))
+
+# Хранилище: Firebase (JSON-ключ из FIREBASE_KEY) или локальный SQLite (STORAGE_BACKEND)
+backend = create_backend()
+if os.getenv("METRICS_ENABLED", "1") == "1":
+    backend = InstrumentedBackend(backend, metrics)
 
 # Константы
 PRIORITIES = {"urgent": 4, "high": 3, "medium": 2, "low": 1}
+# Приоритет хранится подписью кнопки
+PRIORITY_LABELS = {"urgent": "urgent 🔴", "high": "high 🟠", "medium": "medium 🟡", "low": "low ⚪"}
+MAX_IMPORT_BYTES = 1024 * 1024
+
+# Кэш расписаний и задач: бюджет памяти (байты) и TTL (секунды) задаются в .env
+cache = LRUCache(
+    max_bytes=int(os.getenv("CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    ttl=float(os.getenv("CACHE_TTL", 300)),
+)
+
+# Асинхронный доступ к базе: размер пула, лимит параллельных запросов и таймаут
+repository = Repository(
+    backend,
+    cache,
+    max_workers=int(os.getenv("DB_WORKERS", 8)),
+    max_concurrency=int(os.getenv("DB_MAX_CONCURRENCY", 32)),
+    timeout=float(os.getenv("DB_TIMEOUT", 10)),
+    horizon_days=int(os.getenv("SCHEDULE_HORIZON_DAYS", 30)),
+    retry=RetryPolicy(
+        attempts=int(os.getenv("DB_RETRY_ATTEMPTS", 3)),
+        base_delay=float(os.getenv("DB_RETRY_BASE_DELAY", 0.05)),
+        max_delay=float(os.getenv("DB_RETRY_MAX_DELAY", 1.0)),
+    ),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("DB_BREAKER_THRESHOLD", 5)),
+        reset_timeout=float(os.getenv("DB_BREAKER_RESET", 30)),
+    ),
+)
+
+# Фоновое продвижение горизонта: размер пачки, лимит пользователей в секунду, непиковое окно
+materializer = HorizonMaterializer(
+    repository,
+    horizon_days=int(os.getenv("SCHEDULE_HORIZON_DAYS", 30)),
+    batch_size=int(os.getenv("HORIZON_BATCH_SIZE", 50)),
+    rate_per_sec=float(os.getenv("HORIZON_RATE", 20)),
+    offpeak=parse_window(os.getenv("HORIZON_OFFPEAK", "01:00-07:00")),
+)
+
+# Исходящие сообщения: общий лимит и лимит чата (в секунду), групп (в минуту), размер очереди
+outbox = None
+if os.getenv("OUTBOX_ENABLED", "1") == "1":
+    outbox = OutboundScheduler(
+        global_rate=float(os.getenv("OUTBOX_GLOBAL_RATE", 30)),
+        chat_rate=float(os.getenv("OUTBOX_CHAT_RATE", 1)),
+        chat_burst=float(os.getenv("OUTBOX_CHAT_BURST", 3)),
+        group_rate=float(os.getenv("OUTBOX_GROUP_RATE", 20)) / 60,
+        max_queue=int(os.getenv("OUTBOX_MAX_QUEUE", 2000)),
+    )
+
+# Несколько процессов бота делят чаты по chat_id % WORKER_COUNT; фоновые задачи
+# по пользователям (напоминания, архивация) каждый выполняет только для своих
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", 0))
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", 1))
+
+
+def owns_chat(user_id) -> bool:
+    return WORKER_COUNT <= 1 or int(user_id) % WORKER_COUNT == WORKER_INDEX
+
+
+# Напоминания о занятых блоках: за сколько минут, темп отправки и размер пачки
+reminders = ReminderEngine(
+    repository,
+    lead_minutes=int(os.getenv("REMINDER_LEAD_MINUTES", 5)),
+    rate_per_sec=float(os.getenv("REMINDER_RATE", 25)),
+    batch_size=int(os.getenv("REMINDER_BATCH", 100)),
+    lane="reminder" if outbox else None,
+    owns=owns_chat,
+    load_chunk=int(os.getenv("REMINDER_LOAD_CHUNK", 100)),
+)
+repository.subscribe(reminders)
+
+# Архивация прошедших дней: сколько дней хранить целиком, темп и непиковое окно
+compactor = ScheduleCompactor(
+    repository,
+    keep_days=int(os.getenv("ARCHIVE_KEEP_DAYS", 7)),
+    batch_size=int(os.getenv("ARCHIVE_BATCH", 50)),
+    rate_per_sec=float(os.getenv("ARCHIVE_RATE", 10)),
+    offpeak=parse_window(os.getenv("ARCHIVE_OFFPEAK", "01:00-07:00")),
+    owns=owns_chat,
+)
 
 # ------------------- 1. Инициализация расписания -------------------
 
-async def init_schedule(user_id: str, days_ahead: int = 30):
-    print("init started")
-    schedule_ref = db.reference(f"schedule/{user_id}")
-    
-    def sync_create_schedule():
-        print("sync started")
-        today = datetime.now()
-        existing_schedule = schedule_ref.get() or {}
-        
-        for day_offset in range(days_ahead):
-            current_date = today + timedelta(days=day_offset)
-            date_str = current_date.strftime("%Y-%m-%d")
-            day_of_week = current_date.strftime("%A").lower()
-            
-            # Получаем текущее расписание на день или создаем новое
-            day_schedule = existing_schedule.get(date_str, {})
-            
-            # 1. Инициализируем блоки сна (01:00–07:30), если их еще нет
-            for hour in range(1, 8):
-                for minute in [0, 30]:
-                    time_key = f"{hour:02d}:{minute:02d}"
-                    if time_key not in day_schedule:
-                        day_schedule[time_key] = {"type": "sleep", "task": None}
-
-            # 2. Инициализируем свободные блоки (08:00-00:30), если их еще нет
-            for hour in [*range(8, 24), 0]:  # Добавляем 0 для 00:00-00:30
-                for minute in [0, 30]:
-                    time_key = f"{hour:02d}:{minute:02d}"
-                    if time_key not in day_schedule:
-                        day_schedule[time_key] = {"type": "free", "task": None}             
-
-            # 3. Добавляем занятые блоки (лекции) согласно дню недели
-            lecture_times = []
-            if day_of_week == "monday":
-                lecture_times = ["09:00", "09:30", "10:00"]
-                lecture_task = "Лекция по ML"
-            elif day_of_week == "tuesday":
-                lecture_times = ["12:30", "13:00", "13:30", "14:00"]
-                lecture_task = "Лаб. по ML"
-            elif day_of_week == "thursday":
-                lecture_times = ["12:30", "13:00", "13:30", "14:00"]
-                lecture_task = "Лаб. по БД"
-            elif day_of_week == "friday":
-                lecture_times = ["17:30", "18:00", "18:30", "19:00"]
-                lecture_task = "Лаб. по сетям"
- 
-            
-            for time in lecture_times:
-                # Обновляем только если временной блок не занят или это лекция
-                day_schedule[time] = {
-                    "type": "lecture",
-                    "task": lecture_task
-                }
-
-            schedule_ref.child(date_str).set(day_schedule)
-            
-        
-    await asyncio.to_thread(sync_create_schedule)
+async def init_schedule(user_id: str):
+    """Готовит недельный шаблон пользователя (templates/{uid}).
+
+    Дни не создаются заранее: расписание дня собирается из шаблона
+    и отличий в schedule/{uid}/{date} при первом обращении.
+    """
+    return await repository.get_template(user_id)
 
 # ------------------- 2. Главное меню -------------------
 async def start(update: Update, context: CallbackContext):
     user_id = str(update.message.chat.id)
     
+    # Меню отвечаем сразу; расписание готовит фоновый материализатор
+    menu = ReplyKeyboardMarkup([
+        ["🗂 Задачи", "📝 План на день"],
+        ["📅 Расписание", "💪 Тренировки", "⚙️ Настройки"]
+    ], resize_keyboard=True)
+    
+    await update.message.reply_text("📋 *Главное меню*", reply_markup=menu, parse_mode="Markdown")
+    materializer.touch(user_id)
+    context.application.create_task(init_user(user_id))
+
+
+async def init_user(user_id: str):
     try:
         await init_schedule(user_id)
-        menu = ReplyKeyboardMarkup([
-            ["🗂 Задачи", "📝 План на день"],
-            ["📅 Расписание", "💪 Тренировки", "⚙️ Настройки"]
-        ], resize_keyboard=True)
-        
-        await update.message.reply_text("📋 *Главное меню*", reply_markup=menu, parse_mode="Markdown")
     except Exception as e:
-        print(f"Ошибка при инициализации: {e}")
-        await update.message.reply_text("⚠️ Произошла ошибка при загрузке. Попробуйте позже.")
+        logging.error("Ошибка при инициализации %s: %s", user_id, e)
 
 
 # ------------------- 3. Добавление задачи -------------------
@@ -136,10 +185,10 @@ async def handle_task_input(update: Update, context: CallbackContext):
     user_data = context.user_data
     
     if update.callback_query:
-        print(f"каллбек")
         # Обработка нажатия кнопки приоритета
         query = update.callback_query
         priority = query.data
+        logging.debug("Приоритет задачи %s: %s", user_id, priority)
         context.user_data['task_data'] = {'priority': priority}
         context.user_data['task_state'] = 'awaiting_name'
         context.user_data['expecting_priority'] = False
@@ -149,7 +198,6 @@ async def handle_task_input(update: Update, context: CallbackContext):
         return
     
     elif update.message:
-        print(f"то что надо")
         # Обработка текстовых сообщений
         text = update.message.text
         user_data = context.user_data
@@ -204,6 +252,9 @@ async def handle_task_input(update: Update, context: CallbackContext):
                 if deadline < datetime.now().strftime("%Y-%m-%d"):
                     await update.message.reply_text("❌ Дедлайн не может быть в прошлом.")
                     return
+                if deadline > latest_plan_date():
+                    await update.message.reply_text(f"❌ Дедлайн — не дальше чем через {MAX_PLAN_DAYS} дней.")
+                    return
                     
                 user_data['task_data']['deadline'] = deadline
                 user_data['task_state'] = 'awaiting_notes'
@@ -218,13 +269,11 @@ async def handle_task_input(update: Update, context: CallbackContext):
                 user_data['task_data']['notes'] = text
             
             # Сохранение задачи в базу
-            task_ref = db.reference(f"tasks/{user_id}").push()
-            task_id = task_ref.key
             user_data['task_data']['created_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(user_data['task_data'])
-            task_ref.set(user_data['task_data'])
-            
-            print(context.user_data.get('task_mode') )
+            user_data['task_data']['mode'] = user_data.get('task_mode', 'auto')
+            task_id = await repository.save_task(user_id, user_data['task_data'])
+            logging.debug("Задача %s сохранена для %s (режим %s)",
+                          task_id, user_id, user_data['task_data']['mode'])
 
             # Распределение задачи
             if context.user_data.get('task_mode') == "manual":
@@ -233,13 +282,20 @@ async def handle_task_input(update: Update, context: CallbackContext):
                 user_data['pending_task'] = task_id  # Сохраняем ID для ручного режима
                 await manual_task_assignment(update, context, user_id, task_id)
             else:
-                result = auto_assign_task_with_priority(user_id, task_id)
+                result, displaced = await auto_assign_task_with_priority(user_id, task_id)
                 if result == "need_confirmation":
                     await update.message.reply_text(
-                        "⚠️ Не хватает места! Перенести менее важные задачи? (/yes или /no)",
+                        "⚠️ Не хватает места! Блоки потеряют задачи:\n" + displaced +
+                        "\nПеренести их? (/yes или /no)",
                         reply_markup=ReplyKeyboardMarkup([['/yes', '/no']], resize_keyboard=True)
                     )
-                    user_data['pending_task'] = task_id
+                    # Отдельный ключ: pending_task занят ручным выбором блоков
+                    user_data['pending_reschedule'] = task_id
+                elif result == "partial":
+                    await update.message.reply_text(
+                        f"⚠️ Задача «{user_data['task_data']['name']}» добавлена, "
+                        "но до дедлайна запланирована лишь частично."
+                    )
                 else:
                     await update.message.reply_text(f"✅ Задача «{user_data['task_data']['name']}» добавлена!")
             # =============================================
@@ -250,7 +306,7 @@ async def handle_task_input(update: Update, context: CallbackContext):
                 user_data.pop('selected_priority', None)
             
         else:
-           print(f"иди нахуй))))")
+            logging.debug("Текст от %s в состоянии %s пропущен", user_id, user_data.get('task_state'))
 
 
 async def manual_task_assignment(update: Update, context: CallbackContext, user_id: str, task_id: str):
@@ -279,9 +335,17 @@ async def handle_manual_blocks(update: Update, context: CallbackContext):
         # Парсим введенное время
         block_time = datetime.strptime(text, "%d.%m.%Y %H:%M")
         block_str = block_time.strftime("%Y-%m-%d %H:%M")
+        if block_time.minute not in (0, 30):
+            await update.message.reply_text("❌ Блоки начинаются в ЧЧ:00 или ЧЧ:30. Выберите другой:")
+            return
+        if block_time < datetime.now() or block_str[:10] > latest_plan_date():
+            await update.message.reply_text(
+                f"❌ Блок должен быть в будущем и не дальше чем через {MAX_PLAN_DAYS} дней. Выберите другой:")
+            return
         
-        # Проверяем доступность блока (ваша реализация)
-        if not is_time_block_available(user_id, block_str):
+        # Проверяем доступность блока по индексу (без запроса к базе)
+        if block_str in user_data['selected_blocks'] or \
+                not await is_time_block_available(user_id, block_str):
             await update.message.reply_text("❌ Этот блок уже занят. Выберите другой:")
             return
         
@@ -296,19 +360,25 @@ async def handle_manual_blocks(update: Update, context: CallbackContext):
                 "Введите следующий блок:"
             )
         else:
-            # Все блоки выбраны - сохраняем
-            schedule_ref = db.reference(f"schedule/{user_id}")
-            
-            for block in user_data['selected_blocks']:
-                date_str, time_str = block.split(' ')
-                time_key = time_str  # HH:MM
-                
-                schedule_ref.child(date_str).child(time_key).update({
+            # Все блоки выбраны - сохраняем одной транзакцией
+            slots = [tuple(block.split(' ')) for block in user_data['selected_blocks']]
+            try:
+                # Блоки и assigned_blocks задачи (чтобы delete_task мог их освободить)
+                await repository.claim_slots(user_id, slots, {
                     'task_id': user_data['pending_task'],
                     'task': user_data['task_data']['name'],
                     'type': 'task'
-                })
-            
+                }, task_id=user_data['pending_task'])
+            except ConflictError as e:
+                # Блок успели занять: выбор начинается заново
+                user_data['blocks_remaining'] = len(user_data['selected_blocks'])
+                user_data['selected_blocks'] = []
+                await update.message.reply_text(
+                    f"❌ Блок {str(e).replace('/', ' ')} уже занят. Выберите блоки заново.\n"
+                    "Введите первый блок:"
+                )
+                return
+
             await update.message.reply_text(
                 f"✅ Задача «{user_data['task_data']['name']}» запланирована!\n"
                 f"Выбранные блоки: {', '.join(user_data['selected_blocks'])}"
@@ -322,98 +392,123 @@ async def handle_manual_blocks(update: Update, context: CallbackContext):
         await update.message.reply_text("❌ Неверный формат. Используйте ДД.ММ.ГГГГ ЧЧ:ММ")   
 
 
-def is_time_block_available(user_id: str, block_time_str: str) -> bool:
+async def is_time_block_available(user_id: str, block_time_str: str) -> bool:
     """Проверяет доступность временного блока"""
     date_str, time_str = block_time_str.split(' ')
     time_key = time_str # HH:MM
     
-    schedule_ref = db.reference(f"schedule/{user_id}/{date_str}")
+    availability = await repository.get_availability(user_id, until=date_str)
 
-    print(db.reference(f"schedule/{user_id}/{date_str}").get())
+    return availability.is_available(date_str, time_key)
 
-    day_schedule = schedule_ref.get() or {}
-    
-    print(day_schedule.get(time_key, {}).get('type'))
 
-    return day_schedule.get(time_key, {}).get('type') == 'free'        
+# ------------------- 4. Автоматическое распределение с переносом -------------------
+async def auto_assign_task_with_priority(user_id: str, task_id: str, allow_displace: bool = False):
+    """Пересчитывает распределение всех авто-задач пользователя вместе с новой.
 
+    Если план забирает блоки у уже распределённых задач, он не применяется
+    без подтверждения (/yes). Возвращает (результат, список таких задач).
+    """
+    tasks = await repository.get_tasks(user_id)
+    plan = await build_plan(user_id)
+    lost = displaced_tasks(tasks, plan, exclude={task_id})
+    displaced = describe_displaced(tasks, lost)
+
+    if lost and not allow_displace:
+        return "need_confirmation", displaced
+
+    await apply_plan(user_id, plan)
+    return ("partial" if task_id in plan["unscheduled"] else "assigned"), displaced
 
-# ------------------- 4. Автоматическое распределение с переносом -------------------
-async def auto_assign_task_with_priority(user_id: str, task_id: str):
-    
-    task = db.reference(f"tasks/{user_id}/{task_id}").get()
-    time_needed = task["time_required"] * 2  # Блоки по 30 мин
-    deadline = datetime.strptime(task["deadline"], "%Y-%m-%d")
-    assigned_blocks = []
-
-    current_date = datetime.now()
-    while current_date <= deadline and time_needed > 0:
-        date_str = current_date.strftime("%Y-%m-%d")
-        day_schedule = db.reference(f"schedule/{user_id}/{date_str}").get()
-
-        free_blocks = [
-            time for time, block in day_schedule.items()
-            if block["type"] == "free" and not block.get("task")
-        ][:6]  # Не более 6 блоков в день
-
-        for time in free_blocks:
-            assigned_blocks.append({"date": date_str, "time": time})
-            time_needed -= 1
-
-        current_date += timedelta(days=1)
-
-    if time_needed > 0:
-        if task["priority"] in ("high", "medium"):
-            return "need_confirmation"
-        else:
-            reschedule_low_priority_tasks(user_id, task_id, time_needed)
 
-    # Сохраняем блоки
-    db.reference(f"tasks/{user_id}/{task_id}/assigned_blocks").set(assigned_blocks)
-    for block in assigned_blocks:
-        db.reference(f"schedule/{user_id}/{block['date']}/{block['time']}").update({"task": task_id})
-    return "assigned"
+def describe_displaced(tasks: dict, lost: dict) -> str:
+    """Строки «- название: −N ч» для задач, теряющих блоки"""
+    return "\n".join(f"- {tasks[task_id].get('name', task_id)}: −{blocks / 2:g} ч"
+                     for task_id, blocks in lost.items())
+
+
+def latest_plan_date() -> str:
+    """Самый дальний допустимый дедлайн / ручной блок (YYYY-MM-DD)"""
+    return (datetime.now() + timedelta(days=MAX_PLAN_DAYS)).strftime("%Y-%m-%d")
+
+
+async def build_plan(user_id: str, only=None) -> dict:
+    """Один прогон планировщика по всем задачам пользователя.
+
+    Планировщик работает в пуле потоков на копиях задач и индекса, чтобы
+    не останавливать цикл событий; горизонт ограничен MAX_PLAN_DAYS даже
+    для задач, сохранённых до появления ограничения.
+    only — id задач, которые размещаются только в свободные блоки: блоки
+    остальных задач для планировщика заняты и не перераспределяются.
+    """
+    tasks = await repository.get_tasks(user_id)
+    if only is not None:
+        tasks = {task_id: tasks[task_id] for task_id in only if task_id in tasks}
+    last_deadline = min(max((t.get("deadline") or "" for t in tasks.values()), default=""),
+                        latest_plan_date())
+    availability = await repository.get_availability(user_id, until=last_deadline or None)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, plan_schedule, dict(tasks), availability.copy(), PRIORITIES)
 
 
 # ------------------- 5. Перенос задач -------------------
-async def reschedule_low_priority_tasks(user_id: str, new_task_id: str, blocks_needed: int):
-    tasks_ref = db.reference(f"tasks/{user_id}")
-    new_task_priority = tasks_ref.child(new_task_id).get()["priority"]
+async def apply_plan(user_id: str, plan: dict):
+    """Записывает только изменившиеся блоки и assigned_blocks (по одному update())"""
+    await repository.update_schedule(user_id, plan["schedule_updates"])
+    await repository.update_tasks(user_id, {
+        f"{task_id}/{field}": value
+        for task_id, values in plan["task_updates"].items()
+        for field, value in values.items()
+    })
 
-    for task_id, task_data in tasks_ref.get().items():
-        if PRIORITIES[task_data["priority"]] < PRIORITIES[new_task_priority]:
-            # Переносим задачу
-            new_blocks = find_free_blocks_after_deadline(user_id, task_data["deadline"])
-            if new_blocks:
-                tasks_ref.child(task_id).child("assigned_blocks").set(new_blocks)
-                blocks_needed -= len(task_data["assigned_blocks"])
-                if blocks_needed <= 0:
-                    break
+
+async def confirm_reschedule(update: Update, context: CallbackContext):
+    user_id = str(update.message.chat.id)
+    task_id = context.user_data.pop('pending_reschedule', None)
+    if not task_id or not await repository.get_task(user_id, task_id):
+        await update.message.reply_text("⚠️ Нет задачи, ожидающей подтверждения.")
+        return
+
+    result, displaced = await auto_assign_task_with_priority(user_id, task_id, allow_displace=True)
+    moved = f"\nБлоки потеряли задачи:\n{displaced}" if displaced else ""
+    if result == "partial":
+        await update.message.reply_text("⚠️ Задача запланирована частично: до дедлайна не хватает места." + moved)
+    else:
+        await update.message.reply_text("✅ Задачи перенесены, новая задача запланирована!" + moved)
+
+
+async def decline_reschedule(update: Update, context: CallbackContext):
+    user_id = str(update.message.chat.id)
+    task_id = context.user_data.pop('pending_reschedule', None)
+    if task_id:
+        # Иначе задача осталась бы авто-задачей без блоков, и следующий
+        # пересчёт сам отдал бы ей место уже сохранённых задач
+        if await repository.get_task(user_id, task_id):
+            await repository.update_task(user_id, task_id, {"mode": "unplaced"})
+        await update.message.reply_text("👌 Задача сохранена без распределения.")
+    else:
+        await update.message.reply_text("⚠️ Нет задачи, ожидающей подтверждения.")
 
 
 # ------------------- 6. Удаление задачи -------------------
 async def delete_task(update: Update, context: CallbackContext):
     task_name = " ".join(context.args)
     user_id = str(update.message.chat.id)
-    tasks_ref = db.reference(f"tasks/{user_id}")
+    # Поиск по индексу имён, без выгрузки всех задач
+    matches = await repository.find_tasks_by_name(user_id, task_name)
     
-    tasks = tasks_ref.get()
-    if not tasks:
-        await update.message.reply_text("❌ Нет задач для удаления.")
+    for task_id, task_data in matches.items():
+        # Освобождаем блоки: отличия удаляются, блок снова берётся из шаблона
+        await repository.update_schedule(user_id, {
+            f"{block['date']}/{block['time']}": None
+            for block in task_data.get("assigned_blocks", [])
+        })
+        # Удаляем задачу
+        await repository.remove_task(user_id, task_id)
+        await update.message.reply_text(f"✅ Задача «{task_name}» удалена!")
         return
-    
-    for task_id, task_data in tasks.items():
-        print(task_id, task_data)
-        if task_data["name"] == task_name:
-            # Освобождаем блоки
-            for block in task_data.get("assigned_blocks", []):
-                db.reference(f"schedule/{user_id}/{block['date']}/{block['time']}").update({"task": None})
-            # Удаляем задачу
-            tasks_ref.child(task_id).delete()
-            await update.message.reply_text(f"✅ Задача «{task_name}» удалена!")
-            return
 
-    await update.message.reply_text("❌ Задача не найдена.")                
+    await update.message.reply_text("❌ Задача не найдена.")
                 
 async def cancel_task(update: Update, context: CallbackContext):
     if 'task_state' in context.user_data:
@@ -424,73 +519,139 @@ async def cancel_task(update: Update, context: CallbackContext):
         
 
 # ------------------- 7. Просмотр расписания -------------------
+# Сколько дней подгружать одним запросом по диапазону при листании расписания
+SCHEDULE_PREFETCH_DAYS = int(os.getenv("SCHEDULE_PREFETCH_DAYS", 7))
+SCHEDULE_MAX_DAYS = 366
+
+
 async def show_schedule(update: Update, context: CallbackContext):
+    """/schedule [ДД.ММ.ГГГГ [ДД.ММ.ГГГГ]] — расписание за диапазон, по дню на страницу"""
     user_id = str(update.message.chat.id)
-    date = datetime.now().strftime("%Y-%m-%d")
-    schedule_ref = db.reference(f"schedule/{user_id}/{date}")
+    today = datetime.now().date()
+    try:
+        dates = [datetime.strptime(arg, "%d.%m.%Y").date() for arg in (context.args or [])[:2]]
+    except ValueError:
+        await update.message.reply_text("❌ Формат: /schedule ДД.ММ.ГГГГ [ДД.ММ.ГГГГ]")
+        return
+    start = dates[0] if dates else today
+    end = dates[1] if len(dates) > 1 else start
+    if end < start or (end - start).days >= SCHEDULE_MAX_DAYS:
+        await update.message.reply_text(f"❌ Диапазон должен быть не длиннее {SCHEDULE_MAX_DAYS} дней.")
+        return
+    await send_schedule_page(update.message.reply_text, user_id, start, end, 0)
 
-    schedule_text = f"📅 *Расписание на {date}*\n\n"
-    for time, block in schedule_ref.get().items():
-        if block["type"] != "sleep":
-            schedule_text += f"- {time}: {block.get('task', 'Свободно')}\n"
 
-    await update.message.reply_text(schedule_text, parse_mode="Markdown")
+async def show_week(update: Update, context: CallbackContext):
+    """/week — семь дней начиная с сегодняшнего"""
+    user_id = str(update.message.chat.id)
+    today = datetime.now().date()
+    await send_schedule_page(update.message.reply_text, user_id, today, today + timedelta(days=6), 0)
+
+
+async def send_schedule_page(send, user_id: str, start, end, page: int):
+    total = (end - start).days + 1
+    page = max(0, min(page, total - 1))
+    day = start + timedelta(days=page)
+    # Окна по SCHEDULE_PREFETCH_DAYS дней читаются одним запросом по диапазону;
+    # остальные страницы окна берутся из кэша
+    window_start = start + timedelta(days=page - page % SCHEDULE_PREFETCH_DAYS)
+    window_end = min(end, window_start + timedelta(days=SCHEDULE_PREFETCH_DAYS - 1))
+    await repository.get_days(user_id, window_start.isoformat(), window_end.isoformat())
+    text = await repository.get_schedule_page(user_id, day.isoformat())
+    keyboard = page_keyboard(f"sched:{start:%Y%m%d}:{end:%Y%m%d}", page, total)
+    await send(text, reply_markup=keyboard, parse_mode="Markdown")
+
+
+async def schedule_page(update: Update, context: CallbackContext):
+    """Кнопки ◀️/▶️ расписания: callback_data "sched:начало:конец:страница" """
+    query = update.callback_query
+    await query.answer()
+    _, start, end, page = query.data.split(":")
+    await send_schedule_page(
+        query.edit_message_text,
+        str(update.effective_chat.id),
+        datetime.strptime(start, "%Y%m%d").date(),
+        datetime.strptime(end, "%Y%m%d").date(),
+        int(page),
+    )
+
+
+async def show_free_slots(update: Update, context: CallbackContext):
+    """/free — ближайшие свободные блоки, постранично"""
+    await send_free_page(update.message.reply_text, str(update.message.chat.id), 0)
+
+
+async def free_page(update: Update, context: CallbackContext):
+    query = update.callback_query
+    await query.answer()
+    await send_free_page(query.edit_message_text, str(update.effective_chat.id), int(query.data.split(":")[1]))
+
+
+async def send_free_page(send, user_id: str, page: int):
+    # Блоки считаются по битовому индексу, запросов к базе нет
+    slots = await repository.next_free_slots(user_id, (page + 1) * FREE_PAGE_SIZE + 1)
+    has_next = len(slots) > (page + 1) * FREE_PAGE_SIZE
+    keyboard = page_keyboard("free", page, page + 2 if has_next else page + 1, counter=False)
+    text = render_free_slots(slots[page * FREE_PAGE_SIZE:(page + 1) * FREE_PAGE_SIZE], page)
+    await send(text, reply_markup=keyboard, parse_mode="Markdown")
+
+
+async def load_reminders(context: CallbackContext):
+    try:
+        await reminders.load(int(os.getenv("SCHEDULE_HORIZON_DAYS", 30)))
+    except Exception as e:
+        logging.error("Не удалось загрузить напоминания: %s", e)
+
+
+async def release_storage(application: Application):
+    """post_shutdown: обработчики, задачи и запись persistence уже завершены —
+    освобождаем пул потоков хранилища"""
+    repository.shutdown()
+
+
+async def handle_error(update: object, context: CallbackContext):
+    """Ошибки обработчиков: вместо молчания — понятный ответ пользователю"""
+    error = context.error
+    if isinstance(error, StorageUnavailable):
+        logging.warning("Хранилище недоступно: %s", error)
+        text = "⚠️ База данных временно недоступна. Попробуйте чуть позже."
+    else:
+        logging.error("Ошибка при обработке обновления", exc_info=error)
+        text = "❌ Что-то пошло не так. Попробуйте ещё раз."
+    if isinstance(update, Update) and update.effective_chat:
+        try:
+            await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+        except Exception:
+            logging.exception("Не удалось сообщить об ошибке")
+
+
+async def ignore_callback(update: Update, context: CallbackContext):
+    await update.callback_query.answer()
     
 async def show_daily_plan(update: Update, context: CallbackContext):
     user_id = str(update.message.chat.id)
     today = datetime.now().strftime("%Y-%m-%d")
     
-    # 1. Получаем расписание на сегодня
-    schedule_ref = db.reference(f"schedule/{user_id}/{today}")
-    daily_schedule = schedule_ref.get() or {}
-    
-    # 2. Получаем все задачи пользователя
-    tasks_ref = db.reference(f"tasks/{user_id}")
-    all_tasks = tasks_ref.get() or {}
-
-    # 3. Формируем список задач
-    plan_text = "📅 *Ваш план на сегодня:*\n\n"
-    tasks_found = False
-
-    for time_slot, slot_data in daily_schedule.items():
-        if slot_data.get("task"):
-            task_id = slot_data["task"]
-            task = all_tasks.get(task_id, {})
-            
-            plan_text += (
-                f"⏰ *{time_slot}*\n"
-                f"• {task.get('name', 'Задача')}\n"
-                f"• Приоритет: {task.get('priority', 'не указан')}\n"
-                f"• Заметки: {task.get('notes', 'нет')}\n\n"
-            )
-            tasks_found = True
-
-    if not tasks_found:
-        plan_text = "На сегодня задач нет. Отдыхайте! 😊"
+    # План дня — материализованное соединение блоков и задач; сбрасывается
+    # только записями в этот день или в показанные в нём задачи
+    plan = await repository.get_daily_plan(user_id, today)
 
-    await update.message.reply_text(plan_text, parse_mode="Markdown")
+    await update.message.reply_text(plan.text, parse_mode="Markdown")
     
     
 async def show_tasks(update: Update, context: CallbackContext):
     user_id = str(update.message.chat.id)
-    tasks_ref = db.reference(f"tasks/{user_id}")
-    tasks = tasks_ref.get() or {}
+    tasks = await repository.get_tasks(user_id)
 
     if not tasks:
         await update.message.reply_text("📭 У вас пока нет задач.")
         return
 
-    # Группируем задачи по статусу (активные/просроченные)
-    active_tasks = []
-    overdue_tasks = []
-    today = datetime.now().date()
-
-    for task_id, task_data in tasks.items():
-        deadline = datetime.strptime(task_data['deadline'], "%Y-%m-%d").date()
-        if deadline < today:
-            overdue_tasks.append(task_data)
-        else:
-            active_tasks.append(task_data)
+    # Группируем задачи по статусу (активные/просроченные) через индекс дедлайнов
+    index = await repository.get_task_index(user_id)
+    active_ids, overdue_ids = index.partition(datetime.now().strftime("%Y-%m-%d"))
+    active_tasks = [tasks[task_id] for task_id in active_ids]
+    overdue_tasks = [tasks[task_id] for task_id in overdue_ids]
 
     # Формируем сообщение
     message_text = "📋 *Ваши задачи:*\n\n"
@@ -507,6 +668,126 @@ async def show_tasks(update: Update, context: CallbackContext):
 
     await update.message.reply_text(message_text, parse_mode="Markdown")
 
+# ------------------- 7. Импорт и экспорт задач -------------------
+IMPORT_HELP = (
+    "📥 Пришлите CSV или JSON файлом (или текстом после /import).\n"
+    "Колонки: name, priority, time_required, deadline, notes\n"
+    "Пример:\n"
+    "name,priority,time_required,deadline,notes\n"
+    "Курсовая,high,6,25.12.2024,глава 2\n"
+    "Задачи с прошедшим дедлайном пропускаются."
+)
+
+
+async def import_tasks(update: Update, context: CallbackContext):
+    """/import — пакет задач из CSV/JSON: текстом после команды или следующим файлом"""
+    user_id = str(update.message.chat.id)
+    parts = update.message.text.split(None, 1)
+    if len(parts) < 2:
+        context.user_data['awaiting_import'] = True
+        await update.message.reply_text(IMPORT_HELP)
+        return
+    await run_import(update, user_id, parts[1].encode(), "")
+
+
+async def handle_import_document(update: Update, context: CallbackContext):
+    caption = update.message.caption or ""
+    if not context.user_data.pop('awaiting_import', False) and not caption.startswith("/import"):
+        return
+    document = update.message.document
+    if document.file_size and document.file_size > MAX_IMPORT_BYTES:
+        await update.message.reply_text("❌ Файл больше 1 МБ.")
+        return
+    file = await document.get_file()
+    data = bytes(await file.download_as_bytearray())
+    await run_import(update, str(update.message.chat.id), data, document.file_name or "")
+
+
+async def run_import(update: Update, user_id: str, data: bytes, filename: str):
+    """Проверка всех строк за один проход, одна запись и один прогон планировщика"""
+    try:
+        rows = parse_document(data, filename)
+    except DocumentError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    tasks, errors, skipped = validate_rows(rows, PRIORITY_LABELS)
+    if errors:
+        more = f"\n… и ещё {len(errors) - 10}" if len(errors) > 10 else ""
+        await update.message.reply_text(
+            "❌ Импорт отменён, ошибки в строках:\n" + "\n".join(errors[:10]) + more)
+        return
+    skipped_text = ""
+    if skipped:
+        more = f"\n… и ещё {len(skipped) - 10}" if len(skipped) > 10 else ""
+        skipped_text = "\n⚠️ Пропущены задачи с прошедшим дедлайном:\n" + "\n".join(skipped[:10]) + more
+    if not tasks:
+        await update.message.reply_text("📭 В файле нет задач для импорта." + skipped_text)
+        return
+
+    task_ids = await repository.save_tasks(user_id, tasks)
+    # Импорт без подтверждения, поэтому уже распределённые задачи не
+    # теряют блоков: новые задачи занимают только свободные
+    plan = await build_plan(user_id, only=task_ids)
+    await apply_plan(user_id, plan)
+
+    text = f"✅ Импортировано задач: {len(task_ids)}"
+    unplaced = list(plan["unscheduled"].items())
+    if unplaced:
+        current = await repository.get_tasks(user_id)
+        more = f"\n… и ещё {len(unplaced) - 10}" if len(unplaced) > 10 else ""
+        text += ("\n⚠️ Не хватило свободных блоков до дедлайна:\n"
+                 + describe_displaced(current, dict(unplaced[:10])) + more)
+    text += skipped_text
+    await update.message.reply_text(text)
+
+
+async def export_tasks(update: Update, context: CallbackContext):
+    """/export [csv|json] — все задачи файлом в формате, который принимает /import"""
+    user_id = str(update.message.chat.id)
+    fmt = (context.args or ["csv"])[0].lower()
+    if fmt not in ("csv", "json"):
+        await update.message.reply_text("❌ Формат: /export csv или /export json")
+        return
+    tasks = await repository.get_tasks(user_id)
+    if not tasks:
+        await update.message.reply_text("📭 У вас пока нет задач.")
+        return
+    await update.message.reply_document(document=export_document(tasks, fmt), filename=f"tasks.{fmt}")
+
+
+async def show_stats(update: Update, context: CallbackContext):
+    """/stats [ММ.ГГГГ [ММ.ГГГГ]] — итоги по архиву прошедших дней (по умолчанию за год)"""
+    user_id = str(update.message.chat.id)
+    try:
+        months = [datetime.strptime(arg, "%m.%Y").strftime("%Y-%m") for arg in (context.args or [])[:2]]
+    except ValueError:
+        await update.message.reply_text("❌ Формат: /stats ММ.ГГГГ [ММ.ГГГГ]")
+        return
+    if not months:
+        today = datetime.now().date()
+        months = [f"{today.year - 1}-{today.month:02d}", today.strftime("%Y-%m")]
+    start, end = months[0], months[-1]
+    archive = await repository.get_archive(user_id, min(start, end), max(start, end))
+    await update.message.reply_text(render_stats(archive_stats(archive)), parse_mode="Markdown")
+
+
+async def show_settings(update: Update, context: CallbackContext):
+    """/settings [...] — недельный шаблон: без аргументов показывает его, с ними — меняет"""
+    user_id = str(update.message.chat.id)
+    template = await repository.get_template(user_id)
+    if not context.args:
+        await update.message.reply_text(describe_template(template.data) + "\n\n" + SETTINGS_HELP)
+        return
+    try:
+        data = edit_template(template.data, context.args)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    # Сбрасывает собранные дни и индекс свободных блоков пользователя
+    await repository.save_template(user_id, data)
+    await update.message.reply_text("✅ Шаблон сохранён.\n\n" + describe_template(data))
+
+
 def format_task(task: dict) -> str:
     """Форматирует задачу в текст"""
     return (
@@ -521,23 +802,79 @@ def format_task(task: dict) -> str:
 def main():
     
     TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
+    bot_mode = os.getenv("BOT_MODE", "polling")
+    webhook_url = os.getenv("WEBHOOK_URL", "").rstrip("/")
+    if bot_mode not in ("polling", "webhook"):
+        raise ValueError(f"Неизвестный BOT_MODE: {bot_mode}")
+    if bot_mode == "webhook" and not webhook_url:
+        raise ValueError("BOT_MODE=webhook требует WEBHOOK_URL")
+    if not 0 <= WORKER_INDEX < WORKER_COUNT:
+        raise ValueError(f"WORKER_INDEX={WORKER_INDEX} вне 0..WORKER_COUNT-1")
+    # getUpdates допускает одного получателя (остальные — 409 Conflict), так что
+    # делить чаты между воркерами может только прокси перед webhook
+    if WORKER_COUNT > 1 and bot_mode != "webhook":
+        raise ValueError("WORKER_COUNT > 1 требует BOT_MODE=webhook и шардирующий прокси")
     
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    # Параллельная обработка обновлений разных чатов; из ограниченной очереди
+    # берётся не больше MAX_IN_FLIGHT_UPDATES обновлений сразу, так что при
+    # перегрузке очередь заполняется и приём притормаживает, а не копит память
+    concurrent_updates = int(os.getenv("CONCURRENT_UPDATES", 64))
+    update_queue = AdmissionQueue(
+        maxsize=int(os.getenv("UPDATE_QUEUE_SIZE", 1000)),
+        max_in_flight=int(os.getenv("MAX_IN_FLIGHT_UPDATES", concurrent_updates)),
+    )
+    # Сообщения одного чата — строго по очереди (машина состояний в user_data)
+    serializer = ChatSerializer(max_pending=int(os.getenv("CHAT_MAX_PENDING", 20)))
+    builder = (
+        Application.builder()
+        .application_class(SerializedApplication, {"serializer": serializer})
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(concurrent_updates)
+        .update_queue(update_queue)
+        .post_shutdown(release_storage)
+    )
+    # Все ответы и напоминания — через очереди с приоритетами и лимитами Telegram
+    if outbox is not None:
+        builder = builder.rate_limiter(outbox)
+    # Состояние диалогов (user_data) переживает рестарт и общее для воркеров
+    persistence = None
+    if os.getenv("PERSISTENCE", "sqlite") == "sqlite":
+        persistence = SqlitePersistence(
+            os.getenv("STATE_PATH", "state.db"),
+            update_interval=float(os.getenv("PERSISTENCE_INTERVAL", 5)),
+            # Чат обрабатывал другой воркер — кэши этого процесса о нём устарели
+            on_foreign_change=lambda kind, key: repository.forget_user(str(key)),
+        )
+        builder = builder.persistence(persistence)
+    application = builder.build()
 
     # Команды
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("addtask", add_task_start))
     application.add_handler(CommandHandler("deletetask", delete_task))
     application.add_handler(CommandHandler("schedule", show_schedule))
+    application.add_handler(CommandHandler("week", show_week))
+    application.add_handler(CommandHandler("free", show_free_slots))
+    application.add_handler(CommandHandler("import", import_tasks))
+    application.add_handler(CommandHandler("export", export_tasks))
+    application.add_handler(CommandHandler("stats", show_stats))
+    application.add_handler(CommandHandler("settings", show_settings))
+    application.add_handler(MessageHandler(filters.Document.ALL, handle_import_document))
     application.add_handler(CommandHandler("cancel", cancel_task))
+    application.add_handler(CommandHandler("yes", confirm_reschedule))
+    application.add_handler(CommandHandler("no", decline_reschedule))
 
     # Обработчики кнопок
     
     application.add_handler(MessageHandler(filters.Regex("^📝 План на день$"), show_daily_plan))
     application.add_handler(MessageHandler(filters.Regex("^🗂 Задачи$"), show_tasks))
     application.add_handler(MessageHandler(filters.Regex("^📅 Расписание$"), show_schedule))
+    application.add_handler(MessageHandler(filters.Regex("^⚙️ Настройки$"), show_settings))
     
     application.add_handler(CallbackQueryHandler(ask_priority, pattern="^(auto|manual)$"))
+    application.add_handler(CallbackQueryHandler(schedule_page, pattern=r"^sched:\d{8}:\d{8}:\d+$"))
+    application.add_handler(CallbackQueryHandler(free_page, pattern=r"^free:\d+$"))
+    application.add_handler(CallbackQueryHandler(ignore_callback, pattern="^noop$"))
     application.add_handler(CallbackQueryHandler(handle_task_input, pattern="^(urgent 🔴|high 🟠|medium 🟡|low ⚪)$"))
     
     application.add_handler(MessageHandler(
@@ -547,8 +884,71 @@ def main():
     handle_manual_blocks
     ))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_task_input))
+    application.add_error_handler(handle_error)
+
+    # Задержка и ошибки каждого обработчика
+    if os.getenv("METRICS_ENABLED", "1") == "1":
+        metrics.instrument_application(application)
+    metrics.add_gauges(lambda: flatten("repository", repository.stats()))
+    metrics.add_gauges(lambda: flatten("horizon", materializer.stats()))
+    metrics.add_gauges(lambda: flatten("reminders", reminders.stats()))
+    metrics.add_gauges(lambda: flatten("archive", compactor.stats()))
+    if outbox is not None:
+        metrics.add_gauges(lambda: flatten("outbox", outbox.stats()))
+
+    metrics.add_gauges(lambda: flatten("chats", serializer.stats()))
+    metrics.add_gauges(lambda: flatten("updates", update_queue.stats()))
+    if persistence is not None:
+        metrics.add_gauges(lambda: flatten("state", persistence.stats()))
+    setup_exporters(
+        metrics,
+        os.getenv("METRICS_EXPORTERS", "log"),
+        port=int(os.getenv("METRICS_PORT", 9100)),
+        host=os.getenv("METRICS_HOST", "127.0.0.1"),
+        dump_path=os.getenv("METRICS_DUMP_PATH", "metrics.json"),
+    )
+
+    # Фоновые задачи
+    application.job_queue.run_repeating(
+        materializer.tick,
+        interval=float(os.getenv("HORIZON_INTERVAL", 60)),
+        first=5,
+        name="horizon_materializer",
+    )
+    if os.getenv("REMINDERS_ENABLED", "1") == "1":
+        application.job_queue.run_once(load_reminders, when=0, name="reminders_load")
+        application.job_queue.run_repeating(
+            reminders.tick,
+            interval=float(os.getenv("REMINDER_TICK", 20)),
+            first=1,
+            name="reminders",
+        )
+    application.job_queue.run_repeating(
+        compactor.tick,
+        interval=float(os.getenv("ARCHIVE_INTERVAL", 600)),
+        first=60,
+        name="schedule_compactor",
+    )
+    application.job_queue.run_repeating(
+        metrics.export,
+        interval=float(os.getenv("METRICS_INTERVAL", 60)),
+        first=float(os.getenv("METRICS_INTERVAL", 60)),
+        name="metrics_export",
+    )
 
-    application.run_polling()
+    if bot_mode == "webhook":
+        # Локальный HTTP-сервер за обратным прокси (nginx, caddy и т.п.)
+        url_path = os.getenv("WEBHOOK_PATH", "telegram")
+        application.run_webhook(
+            listen=os.getenv("WEBHOOK_LISTEN", "127.0.0.1"),
+            port=int(os.getenv("WEBHOOK_PORT", 8443)),
+            url_path=url_path,
+            webhook_url=webhook_url + "/" + url_path,
+            secret_token=os.getenv("WEBHOOK_SECRET") or None,
+            max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40)),
+        )
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
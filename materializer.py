@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+def parse_window(value: str) -> tuple:
+    """"01:00-07:00" -> (time(1, 0), time(7, 0)); пустая строка — окна нет"""
+    if not value:
+        return None
+    start, end = value.split("-")
+    return (datetime.strptime(start.strip(), "%H:%M").time(),
+            datetime.strptime(end.strip(), "%H:%M").time())
+
+
+def in_window(window: tuple, now: time = None) -> bool:
+    """Попадает ли now в окно (start, end); окно может переходить через полночь"""
+    if window is None:
+        return True
+    now = now or datetime.now().time()
+    start, end = window
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end
+
+
+class BackgroundJob:
+    """Общая часть фоновых задач JobQueue: за проход не больше batch_size
+    элементов, не чаще rate_per_sec, непиковое окно offpeak и счётчики."""
+
+    def __init__(self, batch_size: int = 50, rate_per_sec: float = 20.0, offpeak: tuple = None):
+        self.batch_size = batch_size
+        self.rate_per_sec = rate_per_sec
+        self.offpeak = offpeak
+        self.processed = 0
+        self.errors = 0
+
+    def in_offpeak(self, now: time = None) -> bool:
+        return in_window(self.offpeak, now)
+
+    async def run_batch(self, items: list, handle, message: str):
+        """await handle(item) для первых batch_size элементов; ошибка
+        одного элемента пишется в лог (message % item) и не прерывает пачку"""
+        delay = 1 / self.rate_per_sec if self.rate_per_sec else 0
+        for item in items[:self.batch_size]:
+            try:
+                await handle(item)
+                self.processed += 1
+            except Exception:
+                self.errors += 1
+                logger.exception(message, item)
+            if delay:
+                await asyncio.sleep(delay)
+
+
+class HorizonMaterializer(BackgroundJob):
+    """Фоновое продвижение горизонта расписания активных пользователей.
+
+    Запускается через JobQueue (tick). За один проход обрабатывает не более
+    batch_size пользователей и не чаще rate_per_sec: новым пользователям
+    индекс строится сразу, остальным горизонт сдвигается на один день —
+    прошедшие дни выбрасываются из индекса и кэша, следующий день
+    прогревается. Сдвиг для уже известных пользователей выполняется только
+    в непиковое окно offpeak.
+    """
+
+    def __init__(self, repository, horizon_days: int = 30, batch_size: int = 50,
+                 rate_per_sec: float = 20.0, offpeak: tuple = None):
+        super().__init__(batch_size, rate_per_sec, offpeak)
+        self.repository = repository
+        self.horizon_days = horizon_days
+        # user_id -> последний подготовленный день (None — ещё не обрабатывался)
+        self.users = {}
+
+    def touch(self, user_id: str):
+        """Регистрирует активного пользователя"""
+        self.users.setdefault(user_id, None)
+
+    def pending(self, today: date = None) -> list:
+        today = today or date.today()
+        target = today + timedelta(days=self.horizon_days - 1)
+        offpeak = self.in_offpeak()
+        return [
+            user_id for user_id, last in self.users.items()
+            if last is None or (offpeak and last < target)
+        ]
+
+    async def tick(self, context=None):
+        today = date.today()
+        await self.run_batch(self.pending(today), lambda user_id: self.advance(user_id, today),
+                             "Не удалось продвинуть горизонт для %s")
+
+    async def advance(self, user_id: str, today: date):
+        repository = self.repository
+        target = today + timedelta(days=self.horizon_days - 1)
+        last = self.users.get(user_id)
+
+        if last is None:
+            # Новый пользователь: шаблон и индекс на весь горизонт одним чтением
+            await repository.get_availability(user_id, until=target)
+            await repository.get_day_schedule(user_id, today.isoformat())
+            self.users[user_id] = target
+            return
+
+        index = await repository.get_availability(user_id)
+        # Прошедшие дни больше не нужны ни в индексе, ни в кэше
+        for offset in range((today - index.start).days if index.start else 0):
+            day = index.start + timedelta(days=offset)
+            repository.cache.invalidate(("schedule", user_id, day.isoformat()))
+        index.trim_before(today)
+
+        # Один день за проход
+        next_day = max(last, today - timedelta(days=1)) + timedelta(days=1)
+        if next_day <= target:
+            index.ensure(next_day)
+            await repository.get_day_schedule(user_id, next_day.isoformat())
+            self.users[user_id] = next_day
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.users),
+            "pending": len(self.pending()),
+            "processed": self.processed,
+            "errors": self.errors,
+        }
@@ -0,0 +1,421 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержки (секунды) — от долей миллисекунды до таймаута БД
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_TIME = re.compile(r"^\d{2}:\d{2}$")
+_MONTH = re.compile(r"^\d{4}-\d{2}$")
+
+
+def path_pattern(path: str) -> str:
+    """"schedule/42/2024-05-01/08:00" -> "schedule/{uid}/{date}/{time}".
+
+    Второй сегмент — всегда uid, третий в tasks — id задачи; даты и время
+    распознаются по формату, остальные сегменты (имена полей) сохраняются.
+    """
+    parts = [part for part in (path or "").split("/") if part]
+    pattern = []
+    for position, part in enumerate(parts):
+        if position == 1:
+            part = "{uid}"
+        elif _DATE.match(part):
+            part = "{date}"
+        elif _TIME.match(part):
+            part = "{time}"
+        elif _MONTH.match(part):
+            part = "{month}"
+        elif position == 2 and parts[0] == "tasks":
+            part = "{id}"
+        pattern.append(part)
+    return "/".join(pattern) or "/"
+
+
+def flatten(prefix: str, data: dict) -> dict:
+    """{"cache": {"hits": 1}} -> {"prefix_cache_hits": 1}, только числа"""
+    values = {}
+    for key, value in data.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            values.update(flatten(name, value))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def payload_size(value) -> int:
+    """Размер значения в байтах в том виде, в каком оно уходит в базу"""
+    if value is None:
+        return 0
+    return len(json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode())
+
+
+class Histogram:
+    """Кумулятивная гистограмма с фиксированными границами корзин"""
+
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последняя корзина — +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for position, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[position] if position < len(self.bounds) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Series:
+    """Метрики одного обработчика или одной пары (операция, шаблон пути)"""
+
+    __slots__ = ("latency", "errors", "payload_bytes", "payload_samples")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.payload_bytes = 0
+        self.payload_samples = 0
+
+    def snapshot(self) -> dict:
+        data = self.latency.snapshot()
+        data["errors"] = self.errors
+        if self.payload_samples:
+            data["payload_avg_bytes"] = self.payload_bytes // self.payload_samples
+        return data
+
+
+class Metrics:
+    """Реестр метрик: обработчики Telegram и операции с хранилищем.
+
+    Запись идёт из потоков пула БД и из цикла событий, поэтому под замком.
+    Размер данных считается JSON-сериализацией, которая стоит столько же,
+    сколько сама отправка, — поэтому только для доли payload_sample вызовов.
+    """
+
+    def __init__(self, payload_sample: float = 0.1):
+        self.payload_sample = payload_sample
+        self.handlers = {}  # имя обработчика -> Series
+        self.storage = {}  # (операция, шаблон пути) -> Series
+        self.gauges = []  # функции, возвращающие {имя: значение}
+        self.exporters = []
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def _series(self, table: dict, key) -> Series:
+        series = table.get(key)
+        if series is None:
+            series = table[key] = Series()
+        return series
+
+    def observe_handler(self, name: str, seconds: float, error: bool = False):
+        with self._lock:
+            series = self._series(self.handlers, name)
+            series.latency.observe(seconds)
+            series.errors += error
+
+    def observe_storage(self, op: str, path: str, seconds: float, size: int = None, error: bool = False):
+        with self._lock:
+            series = self._series(self.storage, (op, path_pattern(path)))
+            series.latency.observe(seconds)
+            series.errors += error
+            if size is not None:
+                series.payload_bytes += size
+                series.payload_samples += 1
+
+    def sample_payload(self) -> bool:
+        return self.payload_sample >= 1 or random.random() < self.payload_sample
+
+    def add_gauges(self, source):
+        """source() -> плоский словарь {имя: число}, снимается при экспорте"""
+        self.gauges.append(source)
+
+    def gauge_values(self) -> dict:
+        values = {}
+        for source in self.gauges:
+            try:
+                values.update(source())
+            except Exception:
+                logger.exception("Не удалось снять показатели %s", source)
+        return values
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "uptime": round(time.time() - self.started, 1),
+                "handlers": {name: series.snapshot() for name, series in self.handlers.items()},
+                "storage": {f"{op} {path}": series.snapshot()
+                            for (op, path), series in self.storage.items()},
+                "gauges": self.gauge_values(),
+            }
+
+    # ------------------- Обёртки -------------------
+
+    def instrument_handler(self, callback, name: str = None):
+        """Оборачивает async-обработчик: задержка, число вызовов и ошибок"""
+        name = name or getattr(callback, "__name__", repr(callback))
+
+        @wraps(callback)
+        async def wrapper(update, context):
+            began = time.perf_counter()
+            error = False
+            try:
+                return await callback(update, context)
+            except Exception:
+                error = True
+                raise
+            finally:
+                self.observe_handler(name, time.perf_counter() - began, error)
+        return wrapper
+
+    def instrument_application(self, application):
+        """Оборачивает callback всех зарегистрированных обработчиков"""
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                handler.callback = self.instrument_handler(handler.callback)
+
+    # ------------------- Экспорт -------------------
+
+    async def export(self, context=None):
+        """Периодический экспорт (JobQueue): снимок передаётся всем экспортёрам"""
+        if not self.exporters:
+            return
+        snapshot = self.snapshot()
+        for exporter in self.exporters:
+            try:
+                exporter.export(snapshot)
+            except Exception:
+                logger.exception("Ошибка экспорта метрик в %s", type(exporter).__name__)
+
+    def prometheus_text(self) -> str:
+        lines = []
+        with self._lock:
+            _histograms(lines, "urroutine_handler_seconds", "handler",
+                        {(name,): series for name, series in self.handlers.items()})
+            _histograms(lines, "urroutine_storage_seconds", "op,path", self.storage)
+            lines.append("# TYPE urroutine_storage_payload_bytes summary")
+            for (op, path), series in self.storage.items():
+                if series.payload_samples:
+                    labels = _labels(("op", op), ("path", path))
+                    lines.append(f"urroutine_storage_payload_bytes_sum{{{labels}}} {series.payload_bytes}")
+                    lines.append(f"urroutine_storage_payload_bytes_count{{{labels}}} {series.payload_samples}")
+        for name, value in self.gauge_values().items():
+            metric = "urroutine_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(*pairs) -> str:
+    return ",".join(f'{key}="{str(value).replace(chr(34), chr(92) + chr(34))}"' for key, value in pairs)
+
+
+def _histograms(lines: list, metric: str, label_names: str, table: dict):
+    names = label_names.split(",")
+    lines.append(f"# TYPE {metric} histogram")
+    errors = []
+    for key, series in table.items():
+        key = key if isinstance(key, tuple) else (key,)
+        base = list(zip(names, key))
+        histogram = series.latency
+        cumulative = 0
+        for bound, count in zip(histogram.bounds + ("+Inf",), histogram.counts):
+            cumulative += count
+            lines.append(f"{metric}_bucket{{{_labels(*base, ('le', bound))}}} {cumulative}")
+        lines.append(f"{metric}_sum{{{_labels(*base)}}} {histogram.total}")
+        lines.append(f"{metric}_count{{{_labels(*base)}}} {histogram.count}")
+        errors.append(f"{metric.rsplit('_', 1)[0]}_errors_total{{{_labels(*base)}}} {series.errors}")
+    if errors:
+        lines.append(f"# TYPE {metric.rsplit('_', 1)[0]}_errors_total counter")
+        lines.extend(errors)
+
+
+# ------------------- Инструментирование хранилища -------------------
+
+class InstrumentedBackend:
+    """Прокси StorageBackend: задержка, ошибки и размер данных по шаблону пути"""
+
+    def __init__(self, backend, metrics: Metrics):
+        self.backend = backend
+        self.metrics = metrics
+        self.name = backend.name
+
+    def _call(self, op: str, path: str, fn, *args, payload=None):
+        metrics = self.metrics
+        began = time.perf_counter()
+        error = False
+        result = None
+        try:
+            result = fn(path, *args)
+            return result
+        except Exception:
+            error = True
+            raise
+        finally:
+            seconds = time.perf_counter() - began
+            size = None
+            if not error and metrics.sample_payload():
+                size = payload_size(payload if payload is not None else result)
+            metrics.observe_storage(op, path, seconds, size, error)
+
+    def get(self, path: str):
+        return self._call("get", path, self.backend.get)
+
+    def set(self, path: str, value):
+        return self._call("set", path, self.backend.set, value, payload=value)
+
+    def update(self, path: str, values: dict):
+        return self._call("update", path, self.backend.update, values, payload=values)
+
+    def push(self, path: str, value) -> str:
+        return self._call("push", path, self.backend.push, value, payload=value)
+
+    def delete(self, path: str):
+        return self._call("delete", path, self.backend.delete)
+
+    def transaction(self, path: str, keys: list, build):
+        return self._call("transaction", path, self.backend.transaction, keys, build)
+
+    def query_equal(self, path: str, child: str, value):
+        return self._call("query", path, self.backend.query_equal, child, value)
+
+    def get_range(self, path: str, start: str, end: str, limit: int = None):
+        return self._call("range", path, self.backend.get_range, start, end, limit)
+
+    def child_keys(self, path: str):
+        return self._call("keys", path, self.backend.child_keys)
+
+    def assigned_slots(self, start: str, end: str, user_ids: list):
+        return self._call("assigned", "schedule", lambda _, *args: self.backend.assigned_slots(*args),
+                          start, end, user_ids)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+
+# ------------------- Экспортёры -------------------
+
+class LogExporter:
+    """Одна структурированная (JSON) строка лога на каждый экспорт"""
+
+    def __init__(self, log: logging.Logger = None, level: int = logging.INFO):
+        self.log = log or logging.getLogger("urroutine.metrics")
+        self.level = level
+
+    def export(self, snapshot: dict):
+        self.log.log(self.level, json.dumps(snapshot, ensure_ascii=False, default=str))
+
+
+class FileExporter:
+    """Периодический дамп снимка в JSON-файл (перезаписывается целиком)"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, snapshot: dict):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(snapshot, file, ensure_ascii=False, indent=2, default=str)
+        os.replace(temporary, self.path)
+
+
+class PrometheusExporter:
+    """HTTP-эндпоинт /metrics в текстовом формате Prometheus (в отдельном потоке)"""
+
+    def __init__(self, metrics: Metrics, port: int = 9100, host: str = "127.0.0.1"):
+        exporter_metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter_metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("metrics: " + format, *args)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self.thread.start()
+
+    def export(self, snapshot: dict):
+        # Prometheus сам забирает данные по HTTP
+        pass
+
+    def close(self):
+        self.server.shutdown()
+
+
+def setup_exporters(metrics: Metrics, names: str, port: int = 9100, dump_path: str = "metrics.json",
+                    host: str = "127.0.0.1"):
+    """METRICS_EXPORTERS="log,prometheus,file" -> список экспортёров"""
+    for name in filter(None, (part.strip() for part in (names or "").split(","))):
+        if name == "log":
+            metrics.exporters.append(LogExporter())
+        elif name == "prometheus":
+            metrics.exporters.append(PrometheusExporter(metrics, port, host))
+        elif name == "file":
+            metrics.exporters.append(FileExporter(dump_path))
+        else:
+            raise ValueError(f"Неизвестный экспортёр метрик: {name}")
+    return metrics.exporters
+
+
+# ------------------- Логирование -------------------
+
+class SamplingFilter(logging.Filter):
+    """Пропускает WARNING и выше всегда, DEBUG/INFO — с вероятностью rate"""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+def setup_logging(level: str = "INFO", sample_rate: float = 1.0):
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        level=getattr(logging, str(level).upper(), logging.INFO),
+    )
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(SamplingFilter(sample_rate))
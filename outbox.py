@@ -0,0 +1,429 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Очереди по убыванию приоритета; rate_limit_args у методов бота — имя очереди
+LANES = ("interactive", "reminder", "broadcast")
+MAX_TEXT = 4096  # лимит Telegram на текст сообщения (в единицах UTF-16)
+# Методы, которые создают или меняют сообщения в чате, — на них действуют лимиты
+THROTTLED = ("send", "edit", "copyMessage", "forwardMessage")
+_SEPARATORS = ("\n\n", "\n", "")
+
+
+class OutboxFull(TelegramError):
+    """Сообщение не поставлено в очередь или вытеснено из неё при переполнении"""
+
+
+def _units(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def split_text(text: str, limit: int = MAX_TEXT) -> list:
+    """Делит текст на части не длиннее limit: по абзацам, затем по строкам,
+    и только строку длиннее limit — посимвольно. Разметка Markdown в боте
+    не переходит через строку, поэтому части остаются корректными."""
+    if _units(text) <= limit:
+        return [text]
+    return [chunk for chunk in _split(text, limit, 0) if chunk.strip()]
+
+
+def _split(text: str, limit: int, level: int) -> list:
+    separator = _SEPARATORS[level]
+    if not separator:
+        chunks, current, size = [], [], 0
+        for char in text:
+            width = _units(char)
+            if size + width > limit:
+                chunks.append("".join(current))
+                current, size = [], 0
+            current.append(char)
+            size += width
+        return chunks + ["".join(current)]
+    chunks, current = [], ""
+    for piece in text.split(separator):
+        candidate = current + separator + piece if current else piece
+        if _units(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        if _units(piece) <= limit:
+            current = piece
+        else:
+            chunks.extend(_split(piece, limit, level + 1))
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity про запас"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 — уже есть)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float):
+        """Следующий токен — не раньше чем через seconds (RetryAfter)"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ("lane", "chat_id", "callback", "args", "kwargs", "future", "enqueued", "attempts", "edit_key")
+
+    def __init__(self, lane, chat_id, callback, args, kwargs, edit_key=None):
+        self.lane = lane
+        self.chat_id = chat_id
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+        self.edit_key = edit_key
+
+
+class _Lane:
+    """Очередь одного приоритета: FIFO каждого чата и куча чатов по времени готовности"""
+
+    __slots__ = ("name", "queues", "heap", "scheduled", "latency", "dropped")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.queues = {}  # chat_id -> deque[_Job], в порядке появления чатов
+        self.heap = []  # (готов в, seq, chat_id)
+        self.scheduled = set()  # чаты, у которых есть запись в heap
+        self.latency = Histogram()  # ожидание в очереди до отправки
+        self.dropped = 0
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """Планировщик исходящих сообщений — rate limiter бота (Application.builder().rate_limiter).
+
+    Все вызовы send*/edit* проходят через корзины токенов: общую
+    (global_rate в секунду) и по чату (chat_rate в секунду с запасом
+    chat_burst; для групп — group_rate). Единственный фоновый диспетчер
+    выдаёт токены по очередям LANES в порядке приоритета, поэтому ответы
+    на действия пользователя уходят раньше напоминаний и рассылок.
+    Внутри чата порядок сохраняется: следующее сообщение чата отправляется
+    только после ответа Telegram на предыдущее.
+
+    Ещё не отправленная правка того же сообщения заменяется новой
+    (листание расписания, частые нажатия) — все ожидающие получают ответ
+    последней правки. Текст длиннее MAX_TEXT отправляется несколькими
+    сообщениями (клавиатура — у последнего), правка — обрезается.
+    RetryAfter ставит чат на паузу и повторяет отправку до max_retries раз.
+
+    Очередь ограничена max_queue: при переполнении вытесняется самое
+    старое сообщение менее приоритетной очереди, а новое сообщение самой
+    низкой очереди отклоняется (OutboxFull). Ответы пользователю
+    не вытесняются никогда.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3,
+                 group_rate: float = 20 / 60, max_queue: int = 2000, max_retries: int = 3):
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.lanes = {name: _Lane(name) for name in LANES}
+        self.buckets = {}  # chat_id -> TokenBucket
+        self.busy = set()  # чаты, сообщение которых сейчас отправляется
+        self.edits = {}  # (метод, chat_id, message_id) -> ещё не отправленная правка
+        self.pending = 0
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._worker = None
+        self._sending = set()  # задачи отправки (ссылки, чтобы их не собрал GC)
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.coalesced = 0
+        self.split = 0
+        self.truncated = 0
+
+    async def initialize(self) -> None:
+        if self._worker is None:
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def shutdown(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for task in list(self._sending):
+            task.cancel()
+        for lane in self.lanes.values():
+            for queue in lane.queues.values():
+                for job in queue:
+                    if not job.future.done():
+                        job.future.cancel()
+            lane.queues.clear()
+            lane.heap.clear()
+            lane.scheduled.clear()
+        self.edits.clear()
+        self.pending = 0
+
+    # ------------------- Приём -------------------
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None or not endpoint.startswith(THROTTLED) or endpoint == "sendChatAction":
+            return await callback(*args, **kwargs)
+        lane = rate_limit_args if rate_limit_args in self.lanes else LANES[0]
+        text = data.get("text")
+
+        if endpoint == "sendMessage" and text and _units(text) > MAX_TEXT:
+            self.split += 1
+            chunks = split_text(text)
+            futures = []
+            for position, chunk in enumerate(chunks):
+                part = dict(data, text=chunk)
+                if position < len(chunks) - 1:
+                    part.pop("reply_markup", None)
+                futures.append(self._submit(lane, chat_id, callback, (endpoint, part), kwargs))
+            results = await asyncio.gather(*futures)
+            return results[-1]
+
+        if endpoint == "editMessageText" and text and _units(text) > MAX_TEXT:
+            self.truncated += 1
+            data = dict(data, text=split_text(text, MAX_TEXT - 1)[0] + "…")
+            args = (endpoint, data)
+
+        edit_key = None
+        if endpoint.startswith("edit") and data.get("message_id") is not None:
+            edit_key = (endpoint, chat_id, data["message_id"])
+            job = self.edits.get(edit_key)
+            if job is not None:
+                # Правка ещё не ушла — отправится сразу последняя версия
+                job.args = args
+                job.kwargs = kwargs
+                self.coalesced += 1
+                return await asyncio.shield(job.future)
+        return await self._submit(lane, chat_id, callback, args, kwargs, edit_key)
+
+    def _submit(self, lane_name, chat_id, callback, args, kwargs, edit_key=None):
+        if self.pending >= self.max_queue and not self._evict(lane_name):
+            self.lanes[lane_name].dropped += 1
+            raise OutboxFull(f"Очередь исходящих переполнена ({self.pending})")
+        job = _Job(lane_name, chat_id, callback, args, kwargs, edit_key)
+        lane = self.lanes[lane_name]
+        lane.queues.setdefault(chat_id, deque()).append(job)
+        if edit_key is not None:
+            self.edits[edit_key] = job
+        self.pending += 1
+        self._schedule(chat_id, time.monotonic(), lane)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return asyncio.shield(job.future)
+
+    def _evict(self, lane_name: str) -> bool:
+        """Освобождает место: самое старое сообщение менее приоритетной очереди.
+        Для interactive место есть всегда — ответ пользователю не отбрасывается"""
+        for name in reversed(LANES[LANES.index(lane_name) + 1:]):
+            lane = self.lanes[name]
+            while lane.queues:
+                chat_id, queue = next(iter(lane.queues.items()))
+                job = queue.popleft()
+                if not queue:
+                    del lane.queues[chat_id]
+                if job.future.done():
+                    continue
+                self._finish(job)
+                lane.dropped += 1
+                job.future.set_exception(OutboxFull("Сообщение вытеснено из переполненной очереди"))
+                job.future.exception()  # ожидающий мог уже уйти — не ругаться в лог
+                return True
+        return lane_name == LANES[0]
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательный id — группа или канал: там лимит в минуту
+            group = isinstance(chat_id, int) and chat_id < 0 or str(chat_id).startswith(("-", "@"))
+            rate = self.group_rate if group else self.chat_rate
+            bucket = self.buckets[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    def _schedule(self, chat_id, now: float, *lanes):
+        """Ставит чат в кучу очереди, если у него есть сообщения и он не занят"""
+        if chat_id in self.busy:
+            return
+        ready = now + self._bucket(chat_id).delay(now)
+        for lane in lanes or self.lanes.values():
+            if chat_id in lane.queues and chat_id not in lane.scheduled:
+                lane.scheduled.add(chat_id)
+                heapq.heappush(lane.heap, (ready, next(self._seq), chat_id))
+
+    # ------------------- Отправка -------------------
+
+    async def _run(self):
+        while True:
+            try:
+                await self._dispatch()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Без диспетчера не уйдёт ни одно сообщение — продолжаем
+                logger.exception("Ошибка диспетчера исходящих сообщений")
+                await asyncio.sleep(0.1)
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            wait = self.global_bucket.delay(now)
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            job, wait = self._pick(now)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.global_bucket.take(now)
+            self._bucket(job.chat_id).take(now)
+            self.busy.add(job.chat_id)
+            if job.edit_key is not None and self.edits.get(job.edit_key) is job:
+                del self.edits[job.edit_key]
+            self.lanes[job.lane].latency.observe(now - job.enqueued)
+            task = asyncio.get_running_loop().create_task(self._send(job))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    def _pick(self, now: float) -> tuple:
+        """(сообщение, None) или (None, сколько ждать до ближайшего готового чата)"""
+        wait = None
+        for lane in self.lanes.values():
+            heap = lane.heap
+            while heap and heap[0][0] <= now:
+                _, _, chat_id = heapq.heappop(heap)
+                lane.scheduled.discard(chat_id)
+                if chat_id in self.busy:
+                    continue  # вернётся в кучу после ответа Telegram
+                queue = lane.queues.get(chat_id)
+                while queue and queue[0].future.done():
+                    self._finish(queue.popleft())  # ожидающий отменён
+                if not queue:
+                    lane.queues.pop(chat_id, None)
+                    continue
+                delay = self._bucket(chat_id).delay(now)
+                if delay:
+                    # Токен чата забрала более приоритетная очередь
+                    lane.scheduled.add(chat_id)
+                    heapq.heappush(heap, (now + delay, next(self._seq), chat_id))
+                    continue
+                job = queue.popleft()
+                if not queue:
+                    del lane.queues[chat_id]
+                return job, None
+            if heap:
+                wait = heap[0][0] - now if wait is None else min(wait, heap[0][0] - now)
+        return None, wait
+
+    async def _send(self, job: _Job):
+        requeued = False
+        try:
+            result = await job.callback(*job.args, **job.kwargs)
+        except RetryAfter as e:
+            if job.attempts < self.max_retries:
+                # Flood control: пауза чата и повтор в начале его очереди
+                job.attempts += 1
+                self.retried += 1
+                self._bucket(job.chat_id).pause(time.monotonic(), e.retry_after)
+                self.lanes[job.lane].queues.setdefault(job.chat_id, deque()).appendleft(job)
+                requeued = True
+            else:
+                self._fail(job, e)
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self.busy.discard(job.chat_id)
+            if not requeued:
+                self._finish(job)
+            self._schedule(job.chat_id, time.monotonic())
+            self._prune()
+            self._wakeup.set()
+
+    def _fail(self, job: _Job, error: Exception):
+        self.failed += 1
+        if not job.future.done():
+            job.future.set_exception(error)
+            job.future.exception()
+
+    def _finish(self, job: _Job):
+        self.pending -= 1
+        if job.edit_key is not None and self.edits.get(job.edit_key) is job:
+            del self.edits[job.edit_key]
+
+    def _prune(self):
+        """Забывает корзины неактивных чатов (полная корзина = состояние по умолчанию)"""
+        if len(self.buckets) < 10000:
+            return
+        now = time.monotonic()
+        active = self.busy.union(*(lane.queues for lane in self.lanes.values()))
+        self.buckets = {
+            chat_id: bucket for chat_id, bucket in self.buckets.items()
+            if chat_id in active or not bucket.full(now)
+        }
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "coalesced": self.coalesced,
+            "split": self.split,
+            "truncated": self.truncated,
+            "chats": len(self.buckets),
+            "lanes": {
+                name: {
+                    "queued": sum(len(queue) for queue in lane.queues.values()),
+                    "dropped": lane.dropped,
+                    "wait": lane.latency.snapshot(),
+                }
+                for name, lane in self.lanes.items()
+            },
+        }
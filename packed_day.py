@@ -0,0 +1,170 @@
+from availability import SLOTS_PER_DAY, DAY_START_SLOT, slot_index, slot_time
+
+# Коды типов блоков (0 — блока нет)
+SLOT_TYPES = ("", "sleep", "free", "lecture", "task")
+TYPE_CODES = {name: code for code, name in enumerate(SLOT_TYPES) if name}
+CODE_CHARS = ".SFLT"  # компактная строка кодов для сериализации
+# Порядок вывода блоков: с 08:00 до 07:30 следующего круга (как в исходном дереве)
+DISPLAY_ORDER = [(DAY_START_SLOT + i) % SLOTS_PER_DAY for i in range(SLOTS_PER_DAY)]
+FORMAT_VERSION = 1
+
+
+class PackedDay:
+    """Расписание дня в упакованном виде.
+
+    Вместо 48 словарей {"type": ..., "task": ...} — bytearray кодов типов
+    и bytearray индексов в боковую таблицу refs с парами (task, task_id).
+    Дерево schedule/{uid}/{date}/{HH:MM} по-прежнему остаётся форматом
+    хранения: from_dict()/to_dict() конвертируют без потерь для
+    получасовых ключей.
+    """
+
+    __slots__ = ("codes", "ref_index", "refs", "_ref_lookup")
+
+    def __init__(self):
+        self.codes = bytearray(SLOTS_PER_DAY)
+        self.ref_index = bytearray(SLOTS_PER_DAY)
+        self.refs = [None]  # 0 — «нет задачи»
+        self._ref_lookup = {}
+
+    # ------------------- Конвертация -------------------
+
+    def copy(self) -> "PackedDay":
+        packed = PackedDay()
+        packed.codes = bytearray(self.codes)
+        packed.ref_index = bytearray(self.ref_index)
+        packed.refs = list(self.refs)
+        packed._ref_lookup = dict(self._ref_lookup)
+        return packed
+
+    def overlay(self, overrides: dict) -> "PackedDay":
+        """Накладывает поля блоков из overrides поверх текущих (на месте)"""
+        for time_str, block in (overrides or {}).items():
+            if not isinstance(block, dict):
+                continue
+            for field in ("type", "task", "task_id"):
+                if field in block:
+                    self.set_field(time_str, field, block[field])
+        return self
+
+    @classmethod
+    def from_dict(cls, day: dict) -> "PackedDay":
+        packed = cls()
+        for time_str, block in (day or {}).items():
+            packed.set_slot(time_str, block)
+        return packed
+
+    def to_dict(self) -> dict:
+        """Дерево в исходном формате {"HH:MM": {"type", "task"[, "task_id"]}}"""
+        day = {}
+        for index in range(SLOTS_PER_DAY):
+            code = self.codes[index]
+            if not code:
+                continue
+            block = {"type": SLOT_TYPES[code]}
+            ref = self.refs[self.ref_index[index]]
+            if ref is not None:
+                task, task_id = ref
+                if task is not None:
+                    block["task"] = task
+                if task_id is not None:
+                    block["task_id"] = task_id
+            day[slot_time(index)] = block
+        return day
+
+    def to_json(self) -> dict:
+        """Компактная форма для передачи/хранения: строки кодов + таблица refs"""
+        return {
+            "v": FORMAT_VERSION,
+            "c": "".join(CODE_CHARS[code] for code in self.codes),
+            "i": self.ref_index.hex(),
+            "r": [list(ref) for ref in self.refs[1:]],
+        }
+
+    # ------------------- Чтение -------------------
+
+    def slot_type(self, time_str: str):
+        return SLOT_TYPES[self.codes[slot_index(time_str)]] or None
+
+    def slot_task(self, time_str: str):
+        """(task, task_id) блока или (None, None)"""
+        return self.refs[self.ref_index[slot_index(time_str)]] or (None, None)
+
+    def items(self):
+        """(time, type, task, task_id) для заполненных блоков в порядке показа"""
+        for index in DISPLAY_ORDER:
+            code = self.codes[index]
+            if code:
+                task, task_id = self.refs[self.ref_index[index]] or (None, None)
+                yield slot_time(index), SLOT_TYPES[code], task, task_id
+
+    def masks(self) -> tuple:
+        """(free, taken) — 48-битные маски для AvailabilityIndex"""
+        free = taken = 0
+        free_code = TYPE_CODES["free"]
+        for index in range(SLOTS_PER_DAY):
+            if self.codes[index] == free_code:
+                free |= 1 << index
+            ref = self.refs[self.ref_index[index]]
+            if ref is not None and ref[0]:
+                taken |= 1 << index
+        return free, taken
+
+    def __len__(self):
+        return SLOTS_PER_DAY - self.codes.count(0)
+
+    def __bool__(self):
+        return any(self.codes)
+
+    @property
+    def approx_size(self) -> int:
+        """Оценка занимаемой памяти для бюджета кэша"""
+        return 2 * SLOTS_PER_DAY + 64 + sum(
+            16 + len(task or "") + len(task_id or "") for task, task_id in self.refs[1:]
+        )
+
+    # ------------------- Запись -------------------
+
+    def set_slot(self, time_str: str, block):
+        index = slot_index(time_str)
+        if not isinstance(block, dict):
+            self.codes[index] = 0
+            self.ref_index[index] = 0
+            return
+        self.codes[index] = TYPE_CODES.get(block.get("type"), 0)
+        self.ref_index[index] = self._ref(block.get("task"), block.get("task_id"))
+
+    def set_field(self, time_str: str, field: str, value):
+        index = slot_index(time_str)
+        if field == "type":
+            self.codes[index] = TYPE_CODES.get(value, 0)
+            return
+        task, task_id = self.refs[self.ref_index[index]] or (None, None)
+        if field == "task":
+            task = value
+        elif field == "task_id":
+            task_id = value
+        else:
+            return
+        self.ref_index[index] = self._ref(task, task_id)
+
+    def _ref(self, task, task_id) -> int:
+        if task is None and task_id is None:
+            return 0
+        key = (task, task_id)
+        position = self._ref_lookup.get(key)
+        if position is None:
+            if len(self.refs) > SLOTS_PER_DAY:
+                self._compact()
+            self.refs.append(key)
+            position = len(self.refs) - 1
+            self._ref_lookup[key] = position
+        return position
+
+    def _compact(self):
+        """Выбрасывает из refs записи, на которые больше не ссылается ни один блок"""
+        used = sorted(set(self.ref_index) - {0})
+        remap = {old: new for new, old in enumerate(used, start=1)}
+        self.refs = [None] + [self.refs[old] for old in used]
+        self.ref_index = bytearray(remap.get(position, 0) for position in self.ref_index)
+        self._ref_lookup = {ref: position for position, ref in enumerate(self.refs) if ref}
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+
+class SqlitePersistence(BasePersistence):
+    """Общее состояние диалогов (user_data / chat_data) в локальном SQLite.
+
+    Несколько процессов бота открывают один файл в режиме WAL; рассчитано
+    на стабильное шардирование по chat id, когда чат переходит к другому
+    воркеру только при рестарте или смене числа воркеров.
+    Каждая запись хранит версию: при каждом обновлении Telegram
+    refresh_user_data() одним точечным чтением подтягивает состояние, если
+    другой процесс записал более новую версию, — поэтому незавершённое
+    добавление задачи продолжается с того же шага. Данные загружаются
+    лениво, при первом обновлении от пользователя, а не все при старте.
+
+    Чтения идут в отдельном пуле потоков через свои соединения только для
+    чтения и не ждут записи (WAL). Кэши процесса (LRU, индексы свободных
+    блоков) общим состоянием не являются: при загрузке более новой версии
+    вызывается on_foreign_change(kind, key), чтобы их сбросить. Версия
+    меняется только после отложенной записи, поэтому в течение
+    update_interval другой воркер может видеть устаревшие задачи.
+
+    Запись отложенная (write-behind): Application отдаёт изменения раз в
+    update_interval секунд, они копятся в буфере и пишутся одной
+    транзакцией в пуле потоков, не блокируя цикл событий.
+    """
+
+    def __init__(self, path: str = "state.db", update_interval: float = 5,
+                 read_threads: int = 4, on_foreign_change=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " kind TEXT NOT NULL, key INTEGER NOT NULL, version INTEGER NOT NULL, data TEXT NOT NULL,"
+            " PRIMARY KEY (kind, key)) WITHOUT ROWID"
+        )
+        # Соединения только для чтения — по одному на поток пула чтения
+        self._uri = Path(path).resolve().as_uri() + "?mode=ro"
+        self._reader = ThreadPoolExecutor(max_workers=read_threads, thread_name_prefix="state-read")
+        self._local = threading.local()
+        self._readers = []
+        self.on_foreign_change = on_foreign_change
+        self.versions = {}  # (kind, key) -> последняя известная версия
+        self.buffer = {}  # (kind, key) -> JSON или None (удаление), ещё не записано
+        self.writing = set()  # ключи, которые пишутся прямо сейчас
+        self._flush_task = None
+        self.writes = 0
+        self.refreshes = 0
+
+    # ------------------- Чтение -------------------
+
+    def _read(self, kind: str, key: int, known: int):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self._uri, uri=True, check_same_thread=False, timeout=30)
+            self._readers.append(db)
+        return db.execute(
+            "SELECT version, data FROM state WHERE kind = ? AND key = ? AND version > ?",
+            (kind, key, known),
+        ).fetchone()
+
+    def _pending(self, state: tuple) -> bool:
+        # У нас есть ещё не записанные изменения — они новее базы
+        return state in self.buffer or state in self.writing
+
+    async def _load(self, kind: str, key: int, data: dict):
+        """Подменяет data версией из базы, если она новее известной нам"""
+        state = (kind, key)
+        if self._pending(state):
+            return
+        known = self.versions.get(state, 0)
+        row = await asyncio.get_running_loop().run_in_executor(self._reader, self._read, kind, key, known)
+        # За время чтения могли появиться свои изменения или более новая версия
+        if row is None or self._pending(state) or row[0] <= self.versions.get(state, 0):
+            return
+        version, payload = row
+        data.clear()
+        data.update(json.loads(payload))
+        self.versions[state] = version
+        self.refreshes += 1
+        if self.on_foreign_change is not None:
+            self.on_foreign_change(kind, key)
+
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        await self._load("user", user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        await self._load("chat", chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    # ------------------- Запись -------------------
+
+    def _enqueue(self, kind: str, key: int, data):
+        self.buffer[(kind, key)] = None if data is None else json.dumps(data, ensure_ascii=False, default=str)
+        if self._flush_task is None or self._flush_task.done():
+            # Все изменения одного прохода update_persistence — одной транзакцией
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_soon())
+
+    async def _flush_soon(self):
+        await asyncio.sleep(0)
+        await self._write()
+
+    async def _write(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, {}
+        self.writing.update(batch)
+        try:
+            versions = await asyncio.get_running_loop().run_in_executor(None, self._write_batch, batch)
+            self.versions.update(versions)
+            for state in batch:
+                if batch[state] is None:
+                    self.versions.pop(state, None)
+            self.writes += 1
+        except Exception:
+            # Вернуть в буфер то, что не перезаписано более новыми изменениями
+            for state, payload in batch.items():
+                self.buffer.setdefault(state, payload)
+            logger.exception("Не удалось сохранить состояние диалогов (%s записей)", len(batch))
+        finally:
+            self.writing.difference_update(batch)
+
+    def _write_batch(self, batch: dict) -> dict:
+        versions = {}
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for (kind, key), payload in batch.items():
+                    if payload is None:
+                        self._db.execute("DELETE FROM state WHERE kind = ? AND key = ?", (kind, key))
+                        continue
+                    versions[(kind, key)] = self._db.execute(
+                        "INSERT INTO state (kind, key, version, data) VALUES (?, ?, 1, ?)"
+                        " ON CONFLICT (kind, key) DO UPDATE SET version = version + 1, data = excluded.data"
+                        " RETURNING version",
+                        (kind, key, payload),
+                    ).fetchone()[0]
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return versions
+
+    async def update_user_data(self, user_id: int, data: dict):
+        self._enqueue("user", user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        self._enqueue("chat", chat_id, data)
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name: str, key, new_state):
+        pass
+
+    async def drop_user_data(self, user_id: int):
+        self._enqueue("user", user_id, None)
+
+    async def drop_chat_data(self, chat_id: int):
+        self._enqueue("chat", chat_id, None)
+
+    async def flush(self):
+        """Вызывается при остановке Application: дописать буфер"""
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self._write()
+        self._reader.shutdown(wait=True)
+        for db in self._readers:
+            db.close()
+        with self._lock:
+            self._db.close()
+
+    def stats(self) -> dict:
+        return {
+            "known": len(self.versions),
+            "buffered": len(self.buffer),
+            "writes": self.writes,
+            "refreshes": self.refreshes,
+        }
+
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionQueue(asyncio.Queue):
+    """Очередь обновлений Application с ограничением обрабатываемых.
+
+    При concurrent_updates Application забирает обновление из очереди
+    и сразу создаёт задачу, а семафор берётся уже внутри неё: очередь
+    не наполняется, и при перегрузке в памяти копятся задачи, а не
+    обновления в ограниченной очереди. Здесь get() отдаёт следующее
+    обновление, только пока обрабатывается меньше max_in_flight
+    (счётчик уменьшает task_done(), который Application вызывает после
+    process_update). Остальные ждут в очереди; когда она заполнена
+    (maxsize), put() останавливает приём: long polling перестаёт
+    забирать обновления, webhook отвечает с задержкой.
+    """
+
+    def __init__(self, maxsize: int = 0, max_in_flight: int = 64):
+        super().__init__(maxsize)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.admission_waits = 0
+        self._released = asyncio.Event()
+
+    async def get(self):
+        while self.in_flight >= self.max_in_flight:
+            self.admission_waits += 1
+            self._released.clear()
+            await self._released.wait()
+        item = await super().get()
+        self.in_flight += 1
+        return item
+
+    def task_done(self):
+        super().task_done()
+        # При остановке Application вызывает task_done и для невыданных обновлений
+        if self.in_flight:
+            self.in_flight -= 1
+            self._released.set()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.qsize(),
+            "maxsize": self.maxsize,
+            "in_flight": self.in_flight,
+            "admission_waits": self.admission_waits,
+        }
+
+
+class ChatSerializer:
+    """Порядок обработки обновлений внутри одного чата при concurrent_updates.
+
+    Application обрабатывает до N обновлений параллельно, но машина
+    состояний в context.user_data (handle_task_input, ручные блоки)
+    рассчитана на последовательные сообщения одного пользователя.
+    Обновление целиком — вместе с refresh_data() состояния из
+    persistence, который PTB ждёт до вызова обработчика, — выполняется
+    под замком своего чата (SerializedApplication.process_update):
+    разные чаты идут параллельно, сообщения одного чата — строго по
+    очереди. Замок берётся до первого await, а asyncio.Lock будит
+    ожидающих в порядке FIFO, поэтому порядок — порядок поступления.
+
+    max_pending ограничивает очередь одного чата: лишние обновления
+    отбрасываются, чтобы один флудящий чат не занимал все слоты.
+    """
+
+    def __init__(self, max_pending: int = 20):
+        self.max_pending = max_pending
+        self.locks = {}  # chat_id -> asyncio.Lock
+        self.pending = {}  # chat_id -> ожидающие + выполняющийся
+        self.dropped = 0
+        self.max_wait = 0.0
+        self.waits = 0
+
+    async def run(self, update, process):
+        """await process(update) под замком чата обновления"""
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            return await process(update)
+        chat_id = chat.id
+        pending = self.pending.get(chat_id, 0)
+        if self.max_pending and pending >= self.max_pending:
+            self.dropped += 1
+            logger.warning("Очередь чата %s переполнена (%s), обновление пропущено", chat_id, pending)
+            return None
+        self.pending[chat_id] = pending + 1
+        lock = self.locks.setdefault(chat_id, asyncio.Lock())
+        began = time.perf_counter()
+        try:
+            async with lock:
+                waited = time.perf_counter() - began
+                if waited > 0.001:
+                    self.waits += 1
+                    self.max_wait = max(self.max_wait, waited)
+                return await process(update)
+        finally:
+            left = self.pending[chat_id] - 1
+            if left:
+                self.pending[chat_id] = left
+            else:
+                del self.pending[chat_id]
+                self.locks.pop(chat_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self.pending),
+            "pending": sum(self.pending.values()),
+            "dropped": self.dropped,
+            "waits": self.waits,
+            "max_wait": round(self.max_wait, 4),
+        }
+
+
+class SerializedApplication(Application):
+    """Application, где обновления одного чата идут через ChatSerializer.
+
+    Подключается через Application.builder().application_class(
+    SerializedApplication, {"serializer": ChatSerializer()}).
+    """
+
+    def __init__(self, *, serializer: ChatSerializer = None, **kwargs):
+        super().__init__(**kwargs)
+        self.serializer = serializer
+
+    async def process_update(self, update: object) -> None:
+        if self.serializer is None:
+            return await super().process_update(update)
+        return await self.serializer.run(update, super().process_update)
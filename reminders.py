@@ -0,0 +1,233 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+from telegram.error import Forbidden, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=512)
+def _midnight(date_str: str) -> float:
+    return datetime.strptime(date_str, "%Y-%m-%d").timestamp()
+
+
+class ReminderEngine:
+    """Напоминания о блоках расписания, занятых задачами.
+
+    Ближайшие занятые блоки всех пользователей лежат в куче по времени
+    срабатывания (начало блока минус lead). Куча не перестраивается:
+    отменённые и изменённые блоки помечаются устаревшими через токен
+    в entries и выбрасываются при извлечении (ленивое удаление).
+
+    Синхронизация инкрементальная: Repository сообщает о каждой записи
+    в schedule/{uid} (авто-распределение, ручные блоки, удаление задачи)
+    и о каждом полном чтении дерева пользователя. Полный просмотр базы —
+    только один раз при старте (load).
+
+    tick() вызывается JobQueue: достаёт наступившие напоминания и
+    отправляет их пачками не быстрее rate_per_sec, учитывая RetryAfter.
+    lane — очередь OutboundScheduler (rate_limit_args), чтобы напоминания
+    не задерживали ответы пользователям; None — бот без планировщика.
+    owns(user_id) — принадлежит ли пользователь этому воркеру: при
+    нескольких процессах каждый напоминает только своим чатам.
+    """
+
+    def __init__(self, repository, lead_minutes: int = 5, rate_per_sec: float = 25,
+                 batch_size: int = 100, grace_minutes: int = 15, lane: str = None, owns=None,
+                 load_chunk: int = 100):
+        self.repository = repository
+        self.load_chunk = load_chunk
+        self.lane = lane
+        self.owns = owns
+        self.lead = timedelta(minutes=lead_minutes)
+        self.rate_per_sec = rate_per_sec
+        self.batch_size = batch_size
+        self.grace = grace_minutes * 60
+        self.heap = []  # (fire_at, token, user_id, date, time)
+        self.entries = {}  # user_id -> {(date, time): [task, task_id, token]}
+        self.pending = 0
+        self.backlog = []  # извлечённые, но ещё не отправленные (лимит пачки)
+        self._tokens = itertools.count(1)
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+
+    # ------------------- Синхронизация -------------------
+
+    def fire_at(self, date_str: str, time_str: str) -> float:
+        hours, minutes = time_str.split(":")
+        return _midnight(date_str) + int(hours) * 3600 + int(minutes) * 60 - self.lead.total_seconds()
+
+    def _discard(self, user_id: str, keys) -> None:
+        slots = self.entries.get(user_id)
+        if not slots:
+            return
+        for key in keys:
+            if slots.pop(key, None) is not None:
+                self.pending -= 1
+        if not slots:
+            del self.entries[user_id]
+        if len(self.heap) > 2 * self.pending + 1024:
+            self._compact()
+
+    def set_slot(self, user_id: str, date_str: str, time_str: str, task=None, task_id=None):
+        """Ставит (или снимает, если задачи нет) напоминание для блока"""
+        if self.owns is not None and not self.owns(user_id):
+            return
+        key = (date_str, time_str)
+        fire_at = self.fire_at(date_str, time_str)
+        if (not task and not task_id) or fire_at < time.time() - self.grace:
+            self._discard(user_id, [key])
+            return
+        slots = self.entries.setdefault(user_id, {})
+        self.pending += key not in slots
+        token = next(self._tokens)
+        slots[key] = [task, task_id, token]
+        heapq.heappush(self.heap, (fire_at, token, user_id, date_str, time_str))
+        if len(self.heap) > 2 * self.pending + 1024:
+            self._compact()
+
+    def _compact(self):
+        """Выбрасывает из кучи устаревшие записи"""
+        self.heap = [
+            item for item in self.heap
+            if (self.entries.get(item[2]) or {}).get((item[3], item[4]), (None, None, None))[2] == item[1]
+        ]
+        heapq.heapify(self.heap)
+
+    def set_day(self, user_id: str, date_str: str, overrides: dict):
+        """Заменяет напоминания дня по его отличиям от шаблона"""
+        self._discard(user_id, [key for key in self.entries.get(user_id, ()) if key[0] == date_str])
+        for time_str, block in (overrides or {}).items():
+            if isinstance(block, dict) and block.get("type") != "lecture":
+                self.set_slot(user_id, date_str, time_str, block.get("task"), block.get("task_id"))
+
+    def on_schedule_tree(self, user_id: str, tree: dict):
+        """Полное дерево отличий пользователя (после чтения schedule/{uid})"""
+        today = date.today().isoformat()
+        self._discard(user_id, list(self.entries.get(user_id, ())))
+        for date_str, overrides in (tree or {}).items():
+            if date_str >= today:
+                self.set_day(user_id, date_str, overrides)
+
+    def on_schedule_write(self, user_id: str, parts: list, value):
+        """Одна запись multi-path update по schedule/{uid}: parts = [date, time?, field?]"""
+        if len(parts) == 1:
+            self.set_day(user_id, parts[0], value.to_dict() if hasattr(value, "to_dict") else value)
+            return
+        date_str, time_str = parts[0], parts[1]
+        if len(parts) == 2:
+            block = value if isinstance(value, dict) else {}
+            if block.get("type") == "lecture":
+                block = {}
+            self.set_slot(user_id, date_str, time_str, block.get("task"), block.get("task_id"))
+            return
+        field = parts[2]
+        if field not in ("task", "task_id"):
+            return
+        task, task_id, _ = self.entries.get(user_id, {}).get((date_str, time_str)) or (None, None, None)
+        if field == "task":
+            task = value
+        else:
+            task_id = value
+        self.set_slot(user_id, date_str, time_str, task, task_id)
+
+    async def load(self, days: int = 30):
+        """Первичная загрузка занятых блоков своих пользователей на days дней вперёд.
+
+        Пользователи читаются порциями по load_chunk, по одному запросу на
+        порцию. Неудавшаяся порция пропускается: напоминания её
+        пользователей появятся при следующем чтении их расписания.
+        Дальше напоминания поддерживаются только инкрементально."""
+        today = date.today()
+        start, end = today.isoformat(), (today + timedelta(days=days - 1)).isoformat()
+        user_ids = [user_id for user_id in await self.repository.get_schedule_users()
+                    if self.owns is None or self.owns(user_id)]
+        missed = 0
+        for offset in range(0, len(user_ids), self.load_chunk):
+            chunk = user_ids[offset:offset + self.load_chunk]
+            try:
+                slots = await self.repository.get_assigned_slots(start, end, chunk)
+            except Exception as e:
+                missed += len(chunk)
+                logger.warning("Не удалось загрузить напоминания %s пользователей: %r", len(chunk), e)
+                continue
+            for user_id, date_str, time_str, block in slots:
+                self.set_slot(user_id, date_str, time_str, block.get("task"), block.get("task_id"))
+        logger.info("Загружено напоминаний: %s (пропущено пользователей: %s)", self.pending, missed)
+
+    # ------------------- Отправка -------------------
+
+    def due(self, now: float = None) -> list:
+        """Извлекает наступившие актуальные напоминания"""
+        now = now or time.time()
+        result = []
+        while self.heap and self.heap[0][0] <= now:
+            fire_at, token, user_id, date_str, time_str = heapq.heappop(self.heap)
+            entry = self.entries.get(user_id, {}).get((date_str, time_str))
+            if entry is None or entry[2] != token:
+                continue  # отменено или перезаписано
+            self._discard(user_id, [(date_str, time_str)])
+            if fire_at < now - self.grace:
+                self.skipped += 1
+                continue
+            result.append((user_id, date_str, time_str, entry[0], entry[1]))
+        return result
+
+    async def tick(self, context):
+        self.backlog.extend(self.due())
+        batch, self.backlog = self.backlog[:self.batch_size], self.backlog[self.batch_size:]
+        delay = 1 / self.rate_per_sec if self.rate_per_sec else 0
+        for position, reminder in enumerate(batch):
+            try:
+                text = await self.render(*reminder)
+                if text:
+                    extra = {"rate_limit_args": self.lane} if self.lane else {}
+                    await context.bot.send_message(chat_id=int(reminder[0]), text=text, **extra)
+                    self.sent += 1
+                else:
+                    self.skipped += 1
+            except RetryAfter as e:
+                # Telegram просит подождать: остаток пачки — в следующий тик
+                logger.warning("Лимит Telegram, пауза %s c", e.retry_after)
+                self.backlog[:0] = batch[position:]
+                await asyncio.sleep(e.retry_after)
+                return
+            except Forbidden:
+                self.failed += 1
+                self.drop_user(reminder[0])
+            except Exception:
+                self.failed += 1
+                logger.exception("Не удалось отправить напоминание %s", reminder[0])
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def render(self, user_id: str, date_str: str, time_str: str, task, task_id):
+        """Текст напоминания; None — блок продолжает ту же задачу, что и предыдущий"""
+        previous = (datetime.strptime(time_str, "%H:%M") - timedelta(minutes=30)).strftime("%H:%M")
+        if time_str != "00:00":
+            day = await self.repository.get_day_schedule(user_id, date_str)
+            if day.slot_task(previous) == (task, task_id):
+                return None
+        summary = await self.repository.get_task(user_id, task_id or task) or {}
+        name = summary.get("name") or task
+        return f"⏰ В {time_str} начинается «{name}»"
+
+    def drop_user(self, user_id: str):
+        """Пользователь заблокировал бота — его напоминания больше не нужны"""
+        self._discard(user_id, list(self.entries.get(user_id, ())))
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "heap": len(self.heap),
+            "backlog": len(self.backlog),
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "failed": self.failed,
+        }
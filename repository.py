@@ -0,0 +1,577 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from availability import AvailabilityIndex
+from availability import SLOTS_PER_DAY
+from archive import ARCHIVE_START, archived_days, merge_month, summarize_days
+from cache import LRUCache, MISSING
+from daily_plan import PLAN_FIELDS, DailyPlan
+from schedule_view import render_day
+from packed_day import PackedDay
+from resilience import CircuitBreaker, RetryPolicy, SingleFlight, StorageUnavailable, is_transient
+from storage import ConflictError, StorageBackend
+from task_index import TaskIndex
+from templates import DEFAULT_TEMPLATE, WeeklyTemplate
+
+
+def _clean(value):
+    """Убирает None-поля так же, как это делает Firebase при записи"""
+    if isinstance(value, dict):
+        return {k: _clean(v) for k, v in value.items() if v is not None}
+    return value
+
+
+class Repository:
+    """Асинхронный доступ к tasks/{uid} и schedule/{uid}.
+
+    Синхронный бэкенд (Firebase или SQLite) выполняется в собственном
+    ограниченном пуле потоков, поэтому медленный запрос одного чата
+    не блокирует event loop.
+    Чтения идут через кэш, записи обновляют его (write-through).
+
+    Временные сбои повторяются с экспоненциальной задержкой; после серии
+    сбоев предохранитель размыкается, и чтения отдают устаревшие данные
+    из кэша, а при их отсутствии — StorageUnavailable. Одновременные
+    одинаковые чтения объединяются в один запрос.
+    """
+
+    def __init__(self, backend: StorageBackend, cache: LRUCache, max_workers: int = 8,
+                 max_concurrency: int = 32, timeout: float = 10.0, horizon_days: int = 30,
+                 retry: RetryPolicy = None, breaker: CircuitBreaker = None):
+        self.backend = backend
+        self.cache = cache
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.flights = SingleFlight()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="repo")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.horizon_days = horizon_days
+        # Битовые индексы свободных блоков: user_id -> AvailabilityIndex
+        self.availability = {}
+        # Недельные шаблоны: user_id -> WeeklyTemplate
+        self.templates = {}
+        # Вторичные индексы задач (имя, дедлайн): user_id -> TaskIndex
+        self.task_indexes = {}
+        # Какие планы и страницы дня зависят от задачи: user_id -> {task_id: {date}}
+        self.plan_refs = {}
+        # Подписчики на изменения расписания (on_schedule_tree / on_schedule_write)
+        self.listeners = []
+        # Метрики очереди
+        self.waiting = 0
+        self.max_waiting = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.stale_served = 0
+
+    async def run(self, fn, *args, timeout: float = None, retry: bool = True, breaker: bool = True):
+        """Вызов хранилища с повторами временных сбоев и предохранителем.
+
+        retry=False — для неидемпотентных операций (push, транзакция):
+        запрос, отвалившийся по таймауту, мог уже выполниться.
+        breaker=False — для фоновых проходов: их сбои не размыкают цепь
+        для запросов пользователей, а при незамкнутой цепи они сразу
+        получают StorageUnavailable, не занимая пробу.
+        """
+        attempt = 0
+        while True:
+            if not (self.breaker.allow() if breaker else self.breaker.state == CircuitBreaker.CLOSED):
+                raise StorageUnavailable("хранилище недоступно (предохранитель разомкнут)")
+            try:
+                result = await self._call(fn, *args, timeout=timeout)
+            except asyncio.CancelledError:
+                # Иначе отменённая проба навсегда оставила бы цепь в HALF_OPEN
+                if breaker:
+                    self.breaker.record_abandoned()
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    # Хранилище ответило (например, ConflictError) — оно живо
+                    if breaker:
+                        self.breaker.record_success()
+                    raise
+                if breaker:
+                    self.breaker.record_failure()
+                attempt += 1
+                if not retry or attempt >= self.retry.attempts:
+                    raise StorageUnavailable(f"хранилище недоступно: {e!r}") from e
+                self.retries += 1
+                await asyncio.sleep(self.retry.delay(attempt))
+                continue
+            if breaker:
+                self.breaker.record_success()
+            return result
+
+    async def read(self, fn, *args, version: tuple = None):
+        """Чтение: одновременные вызовы с теми же аргументами делят один запрос.
+
+        version — метка cache.version() читающего: запрос, начатый до
+        записи, не делится с читающими после неё.
+        """
+        key = (getattr(fn, "__name__", repr(fn)), args, version)
+        return await self.flights.do(key, lambda: self.run(fn, *args))
+
+    def _stale(self, key, error: StorageUnavailable):
+        """Устаревшее значение из кэша вместо недоступного хранилища;
+        без копии в кэше пробрасывается error"""
+        value = self.cache.get_stale(key)
+        if value is MISSING:
+            raise error
+        self.stale_served += 1
+        return value
+
+    async def _call(self, fn, *args, timeout: float = None):
+        """Выполняет блокирующий вызов в пуле с лимитом параллелизма и таймаутом.
+
+        По таймауту корутина получает asyncio.TimeoutError; сам поток
+        дорабатывает в фоне, но слот семафора освобождается сразу.
+        """
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.calls += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, fn, *args),
+                timeout or self.timeout,
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "stale_served": self.stale_served,
+            "coalesced": self.flights.shared,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            "cache": self.cache.stats(),
+        }
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # ------------------- Расписание -------------------
+
+    async def get_template(self, user_id: str) -> WeeklyTemplate:
+        """Недельный шаблон; новому пользователю записывается шаблон по умолчанию"""
+        template = self.templates.get(user_id)
+        if template is None:
+            data = await self.read(self.backend.get, f"templates/{user_id}")
+            if data is None:
+                data = DEFAULT_TEMPLATE
+                await self.run(self.backend.set, f"templates/{user_id}", data)
+            template = self.templates[user_id] = WeeklyTemplate(data)
+        return template
+
+    async def save_template(self, user_id: str, data: dict):
+        await self.run(self.backend.set, f"templates/{user_id}", data)
+        self.templates[user_id] = WeeklyTemplate(data)
+        # Собранные дни и индекс зависят от шаблона
+        self.cache.invalidate_user(user_id)
+        self.availability.pop(user_id, None)
+        self.plan_refs.pop(user_id, None)
+
+    def forget_user(self, user_id: str):
+        """Сбрасывает всё закэшированное о пользователе (его данные изменил другой процесс)"""
+        self.cache.invalidate_user(user_id)
+        self.availability.pop(user_id, None)
+        self.templates.pop(user_id, None)
+        self.task_indexes.pop(user_id, None)
+        self.plan_refs.pop(user_id, None)
+
+    async def get_schedule_tree(self, user_id: str) -> dict:
+        """Отличия от шаблона schedule/{uid} с сегодняшнего дня; заодно перестраивает индекс.
+
+        Прошедшие дни не читаются: их сворачивает в архив ScheduleCompactor.
+        """
+        template = await self.get_template(user_id)
+        today = date.today()
+        tree = await self.read(self.backend.get_range, f"schedule/{user_id}", today.isoformat(), "9999-12-31") or {}
+        index = AvailabilityIndex(start=today, fill=template.masks_for)
+        index.ensure(today + timedelta(days=self.horizon_days - 1))
+        for date_str, overrides in tree.items():
+            index.set_day(date_str, template.materialize(date_str, overrides))
+        self.availability[user_id] = index
+        for listener in self.listeners:
+            listener.on_schedule_tree(user_id, tree)
+        return tree
+
+    async def get_availability(self, user_id: str, until=None) -> AvailabilityIndex:
+        """Индекс свободных блоков; при первом обращении строится одним чтением,
+        дни после until достраиваются из шаблона без запросов"""
+        if user_id not in self.availability:
+            await self.get_schedule_tree(user_id)
+        index = self.availability[user_id]
+        if until is not None:
+            index.ensure(until)
+        return index
+
+    async def get_day_schedule(self, user_id: str, date_str: str) -> PackedDay:
+        key = ("schedule", user_id, date_str)
+        day = self.cache.get(key)
+        if day is MISSING:
+            template = await self.get_template(user_id)
+            version = self.cache.version(key)
+            try:
+                overrides = await self.read(self.backend.get, f"schedule/{user_id}/{date_str}", version=version)
+            except StorageUnavailable as e:
+                return self._stale(key, e)
+            day = template.materialize(date_str, overrides)
+            self.cache.set(key, day, version=version)
+        return day
+
+    async def get_days(self, user_id: str, start: str, end: str) -> list:
+        """[(date, PackedDay)] с start по end включительно.
+
+        Дни берутся из кэша; недостающие читаются одним запросом по
+        диапазону ключей schedule/{uid}, а не всем деревом.
+        """
+        template = await self.get_template(user_id)
+        first, last = date.fromisoformat(start), date.fromisoformat(end)
+        dates = [(first + timedelta(days=offset)).isoformat() for offset in range((last - first).days + 1)]
+        days = {date_str: self.cache.get(("schedule", user_id, date_str)) for date_str in dates}
+        missing = [date_str for date_str, day in days.items() if day is MISSING]
+        if missing:
+            versions = self.cache.version(*(("schedule", user_id, date_str) for date_str in missing))
+            try:
+                tree = await self.read(self.backend.get_range, f"schedule/{user_id}", missing[0], missing[-1],
+                                       version=versions)
+            except StorageUnavailable as e:
+                for date_str in missing:
+                    days[date_str] = self._stale(("schedule", user_id, date_str), e)
+                return [(date_str, days[date_str]) for date_str in dates]
+            for date_str, version in zip(missing, versions):
+                day = days[date_str] = template.materialize(date_str, (tree or {}).get(date_str))
+                self.cache.set(("schedule", user_id, date_str), day, version=(version,))
+        return [(date_str, days[date_str]) for date_str in dates]
+
+    async def get_schedule_page(self, user_id: str, date_str: str) -> str:
+        """Готовый текст страницы дня; сбрасывается записью в этот день"""
+        key = ("page", user_id, date_str)
+        text = self.cache.get(key)
+        if text is MISSING:
+            version = self.cache.version(key, ("schedule", user_id, date_str), ("tasks", user_id))
+            day = await self.get_day_schedule(user_id, date_str)
+            task_ids = DailyPlan.referenced_ids(day)
+            tasks = self.cache.peek(("tasks", user_id))
+            if tasks is MISSING:
+                tasks = await self.get_task_summaries(user_id, task_ids)
+            text = render_day(date_str, day, tasks)
+            self.cache.set(key, text, version=version)
+            # Страница показывает названия задач — переименование её сбрасывает
+            refs = self.plan_refs.setdefault(user_id, {})
+            for task_id in task_ids:
+                refs.setdefault(task_id, set()).add(date_str)
+        return text
+
+    async def next_free_slots(self, user_id: str, count: int, now: datetime = None) -> list:
+        """Ближайшие count свободных блоков в горизонте, начиная с текущего времени"""
+        now = now or datetime.now()
+        today = now.date()
+        until = today + timedelta(days=self.horizon_days - 1)
+        index = await self.get_availability(user_id, until=until)
+        current = now.strftime("%H:%M")
+        # С запасом на уже прошедшие сегодня блоки
+        slots = index.first_free(today, until, count + SLOTS_PER_DAY, per_day=SLOTS_PER_DAY)
+        today_str = today.isoformat()
+        return [slot for slot in slots if slot["date"] != today_str or slot["time"] >= current][:count]
+
+    async def get_assigned_slots(self, start: str, end: str, user_ids: list) -> list:
+        """Занятые задачами блоки за даты start..end у порции пользователей.
+
+        Фоновая загрузка: без повторов и без учёта в предохранителе, с
+        обычным таймаутом — порция ограничена вызывающим."""
+        return await self.run(self.backend.assigned_slots, start, end, list(user_ids), retry=False, breaker=False)
+
+    async def get_schedule_users(self) -> list:
+        """id пользователей, у которых есть отличия в schedule (только ключи)"""
+        return await self.run(self.backend.child_keys, "schedule", timeout=max(self.timeout, 120))
+
+    async def get_past_days(self, user_id: str, before: date, limit: int = None) -> dict:
+        """Сырые отличия дней раньше before: {date: overrides}, самые старые первыми"""
+        end = (before - timedelta(days=1)).isoformat()
+        return await self.run(self.backend.get_range, f"schedule/{user_id}", ARCHIVE_START, end, limit) or {}
+
+    async def archive_days(self, user_id: str, days: dict):
+        """Сворачивает прошедшие дни {date: overrides} в archive/{uid}/{YYYY-MM}
+        и удаляет их из schedule/{uid}.
+
+        Сводки месяцев обновляются транзакцией; дни, уже учтённые в архиве
+        (сбой между записью сводки и удалением), не учитываются повторно,
+        поэтому обе записи можно безопасно повторять.
+        """
+        template = await self.get_template(user_id)
+        tasks = await self.get_tasks(user_id)
+        months = sorted({date_str[:7] for date_str in days})
+
+        def build(current):
+            done = archived_days(current)
+            additions = summarize_days(
+                {date_str: day for date_str, day in days.items() if date_str not in done}, tasks, template)
+            return {month: merge_month(current.get(month), summary) for month, summary in additions.items()}
+
+        await self.run(self.backend.transaction, f"archive/{user_id}", months, build)
+        await self.run(self.backend.update, f"schedule/{user_id}", {date_str: None for date_str in days})
+        for date_str in days:
+            for kind in ("schedule", "plan", "page"):
+                self.cache.invalidate((kind, user_id, date_str))
+
+    async def get_archive(self, user_id: str, start: str, end: str) -> dict:
+        """Сводки месяцев start..end ("YYYY-MM") из archive/{uid} — без сырых блоков"""
+        return await self.read(self.backend.get_range, f"archive/{user_id}", start, end) or {}
+
+    async def update_schedule(self, user_id: str, updates: dict):
+        """Multi-path update() по schedule/{uid}: ключи вида "date/time[/field]" """
+        if not updates:
+            return
+        await self.run(lambda: self.backend.update(f"schedule/{user_id}", updates))
+        self._after_schedule_write(user_id, updates)
+
+    async def claim_slots(self, user_id: str, slots: list, values: dict, task_id: str = None) -> dict:
+        """Атомарно занимает блоки [(date, time), ...], если все они ещё свободны.
+
+        Проверка и запись идут транзакцией хранилища по узлу дня
+        schedule/{uid}/{date}, а не по всему расписанию: транзакция RTDB
+        читает и перезаписывает свой корень целиком. Блоки разных дней
+        занимаются по одной транзакции на день; если очередной день не
+        удался, уже занятые дни освобождаются. При конфликте бросается
+        ConflictError с ключом "date/time" занятого блока.
+        С task_id блоки затем записываются в assigned_blocks задачи; если
+        эта запись не удалась, блоки тоже освобождаются, а ошибка пробрасывается.
+        """
+        template = await self.get_template(user_id)
+        days = {}
+        for date_str, time_str in slots:
+            days.setdefault(date_str, []).append(time_str)
+        previous = {}
+        updates = {}
+        try:
+            for date_str, times in days.items():
+                updates.update(await self._claim_day(user_id, template, date_str, times, values, previous))
+            if task_id is not None:
+                await self.update_task(user_id, task_id, {
+                    "assigned_blocks": [{"date": date_str, "time": time_str} for date_str, time_str in slots],
+                })
+        except Exception:
+            # Иначе блоки остались бы занятыми задачей, которая о них не знает
+            if previous:
+                await self.update_schedule(user_id, previous)
+            raise
+        return updates
+
+    async def _claim_day(self, user_id: str, template, date_str: str, times: list,
+                         values: dict, previous: dict) -> dict:
+        """Транзакция claim_slots по одному дню; прежние значения блоков — в previous"""
+        claimed = {}
+
+        def build(current):
+            for time_str, override in current.items():
+                block = template.merge(date_str, time_str, override)
+                if block.get("type") != "free" or block.get("task"):
+                    raise ConflictError(f"{date_str}/{time_str}")
+            claimed.clear()
+            claimed.update(current)
+            return {f"{time_str}/{field}": value for time_str in times for field, value in values.items()}
+
+        day_updates = await self.run(self.backend.transaction, f"schedule/{user_id}/{date_str}",
+                                     times, build, retry=False)
+        previous.update({f"{date_str}/{time_str}": value for time_str, value in claimed.items()})
+        updates = {f"{date_str}/{path}": value for path, value in day_updates.items()}
+        self._after_schedule_write(user_id, updates)
+        return updates
+
+    def _after_schedule_write(self, user_id: str, updates: dict):
+        """Write-through записанных путей в кэш дней и индекс свободных блоков"""
+        template = self.templates.get(user_id) or WeeklyTemplate()
+        index = self.availability.get(user_id)
+        for date_str in {path.split("/", 1)[0] for path in updates}:
+            self.cache.invalidate(("plan", user_id, date_str))
+            self.cache.invalidate(("page", user_id, date_str))
+        for path, value in updates.items():
+            parts = path.split("/")
+            # Записи дня/блока целиком дополняются полями шаблона
+            if len(parts) == 1:
+                value = template.materialize(parts[0], value)
+            elif len(parts) == 2:
+                value = template.merge(parts[0], parts[1], value)
+            self._apply_schedule_update(user_id, parts, value)
+            if index is not None:
+                index.apply(path, value)
+            for listener in self.listeners:
+                listener.on_schedule_write(user_id, parts, value)
+
+    def _apply_schedule_update(self, user_id: str, parts: list, value):
+        key = ("schedule", user_id, parts[0])
+        day = self.cache.peek(key)
+        if day is MISSING:
+            # Чтение дня, начатое до записи, не должно попасть в кэш
+            self.cache.invalidate(key)
+            return
+        if len(parts) == 1:
+            self.cache.set(key, value)
+            return
+        if len(parts) == 2:
+            day.set_slot(parts[1], value)
+        else:
+            day.set_field(parts[1], parts[2], value)
+        self.cache.touch(key)
+
+    # ------------------- План на день -------------------
+
+    async def get_daily_plan(self, user_id: str, date_str: str) -> DailyPlan:
+        """План дня из кэша; при промахе — соединение дня с задачами.
+
+        Если дерево задач не в кэше, читаются только задачи, на которые
+        ссылаются блоки дня, а не весь tasks/{uid}.
+        """
+        key = ("plan", user_id, date_str)
+        plan = self.cache.get(key)
+        if plan is MISSING:
+            version = self.cache.version(key, ("schedule", user_id, date_str), ("tasks", user_id))
+            day = await self.get_day_schedule(user_id, date_str)
+            tasks = self.cache.peek(("tasks", user_id))
+            if tasks is MISSING:
+                tasks = await self.get_task_summaries(user_id, DailyPlan.referenced_ids(day))
+            plan = DailyPlan.build(date_str, day, tasks)
+            self.cache.set(key, plan, version=version)
+            refs = self.plan_refs.setdefault(user_id, {})
+            for task_id in plan.task_ids:
+                refs.setdefault(task_id, set()).add(date_str)
+        return plan
+
+    async def get_task_summaries(self, user_id: str, task_ids: set) -> dict:
+        """Отдельные задачи tasks/{uid}/{id} одним заходом в пул"""
+        if not task_ids:
+            return {}
+
+        def fetch():
+            return {task_id: self.backend.get(f"tasks/{user_id}/{task_id}") for task_id in task_ids}
+
+        return {task_id: task for task_id, task in (await self.run(fetch)).items() if task}
+
+    def _invalidate_plans(self, user_id: str, task_ids):
+        """Сбрасывает планы и страницы дней, в которых показаны изменённые задачи"""
+        refs = self.plan_refs.get(user_id)
+        if not refs:
+            return
+        for task_id in task_ids:
+            for date_str in refs.pop(task_id, ()):
+                self.cache.invalidate(("plan", user_id, date_str))
+                self.cache.invalidate(("page", user_id, date_str))
+
+    # ------------------- Задачи -------------------
+
+    async def get_tasks(self, user_id: str) -> dict:
+        key = ("tasks", user_id)
+        tasks = self.cache.get(key)
+        if tasks is MISSING:
+            version = self.cache.version(key)
+            try:
+                tasks = await self.read(self.backend.get, f"tasks/{user_id}", version=version) or {}
+            except StorageUnavailable as e:
+                return self._stale(key, e)
+            self.cache.set(key, tasks, version=version)
+            self.task_indexes[user_id] = TaskIndex(tasks)
+        return tasks
+
+    async def get_task(self, user_id: str, task_id: str):
+        return (await self.get_tasks(user_id)).get(task_id)
+
+    async def get_task_index(self, user_id: str) -> TaskIndex:
+        if user_id not in self.task_indexes:
+            self.task_indexes[user_id] = TaskIndex(await self.get_tasks(user_id))
+        return self.task_indexes[user_id]
+
+    async def find_tasks_by_name(self, user_id: str, name: str) -> dict:
+        """Задачи с данным именем: из индекса, а без него — запросом
+        orderByChild("name").equalTo(name) вместо выгрузки всех задач"""
+        index = self.task_indexes.get(user_id)
+        tasks = self.cache.peek(("tasks", user_id))
+        if index is not None and tasks is not MISSING:
+            return {task_id: tasks[task_id] for task_id in index.ids_by_name(name) if task_id in tasks}
+        return await self.read(self.backend.query_equal, f"tasks/{user_id}", "name", name) or {}
+
+    async def save_task(self, user_id: str, task_data: dict) -> str:
+        task_id = await self.run(self.backend.push, f"tasks/{user_id}", task_data, retry=False)
+        tasks = self.cache.peek(("tasks", user_id))
+        if tasks is not MISSING:
+            tasks[task_id] = _clean(task_data)
+        self.cache.touch(("tasks", user_id))
+        index = self.task_indexes.get(user_id)
+        if index is not None:
+            index.set(task_id, task_data)
+        return task_id
+
+    async def save_tasks(self, user_id: str, tasks: list) -> list:
+        """Пакетное добавление задач одним multi-path update(); возвращает их id"""
+        if not tasks:
+            return []
+        updates = {self.backend.new_key(): task for task in tasks}
+        await self.run(lambda: self.backend.update(f"tasks/{user_id}", updates))
+        cached = self.cache.peek(("tasks", user_id))
+        index = self.task_indexes.get(user_id)
+        for task_id, task in updates.items():
+            if cached is not MISSING:
+                cached[task_id] = _clean(task)
+            if index is not None:
+                index.set(task_id, task)
+        self.cache.touch(("tasks", user_id))
+        return list(updates)
+
+    async def update_task(self, user_id: str, task_id: str, values: dict):
+        await self.update_tasks(user_id, {f"{task_id}/{field}": value for field, value in values.items()})
+
+    async def update_tasks(self, user_id: str, updates: dict):
+        """Multi-path update() по tasks/{uid}: ключи вида "task_id/field" """
+        if not updates:
+            return
+        await self.run(lambda: self.backend.update(f"tasks/{user_id}", updates))
+        tasks = self.cache.peek(("tasks", user_id))
+        index = self.task_indexes.get(user_id)
+        self._invalidate_plans(user_id, {
+            path.partition("/")[0] for path in updates
+            if path.partition("/")[2] in PLAN_FIELDS + ("",)
+        })
+        for path, value in updates.items():
+            task_id, _, field = path.partition("/")
+            if tasks is not MISSING and task_id in tasks:
+                if value is None:
+                    tasks[task_id].pop(field, None)
+                else:
+                    tasks[task_id][field] = _clean(value)
+            if index is not None and field in ("name", "deadline") and task_id in index.keys:
+                name, deadline = index.keys[task_id]
+                index.set(task_id, {"name": name, "deadline": deadline, field: value})
+        self.cache.touch(("tasks", user_id))
+
+    async def remove_task(self, user_id: str, task_id: str):
+        await self.run(self.backend.delete, f"tasks/{user_id}/{task_id}")
+        self._invalidate_plans(user_id, [task_id])
+        tasks = self.cache.peek(("tasks", user_id))
+        if tasks is not MISSING:
+            tasks.pop(task_id, None)
+        self.cache.touch(("tasks", user_id))
+        index = self.task_indexes.get(user_id)
+        if index is not None:
+            index.discard(task_id)
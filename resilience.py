@@ -0,0 +1,131 @@
+import asyncio
+import random
+import sqlite3
+import time
+
+try:
+    from firebase_admin import exceptions as firebase_exceptions
+    _FIREBASE_TRANSIENT = (
+        firebase_exceptions.UnavailableError,
+        firebase_exceptions.DeadlineExceededError,
+        firebase_exceptions.InternalError,
+        firebase_exceptions.UnknownError,
+    )
+except ImportError:
+    _FIREBASE_TRANSIENT = ()
+
+
+class TransientStorageError(Exception):
+    """Временный сбой хранилища (сеть, перегрузка) — запрос можно повторить"""
+
+
+class StorageUnavailable(Exception):
+    """Хранилище недоступно: повторы исчерпаны или цепь разомкнута"""
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, (TransientStorageError, asyncio.TimeoutError, OSError) + _FIREBASE_TRANSIENT):
+        return True
+    return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+
+class RetryPolicy:
+    """Ограниченные экспоненциальные повторы с полным джиттером"""
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.05, max_delay: float = 1.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Размыкается после failure_threshold временных сбоев подряд.
+
+    Пока цепь разомкнута, запросы не отправляются (читатели получают
+    устаревшие данные из кэша). Через reset_timeout пропускается один
+    пробный запрос: успех замыкает цепь, сбой — размыкает снова.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe = False
+        if self.state == self.HALF_OPEN and not self._probe:
+            self._probe = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.state = self.CLOSED
+
+    def record_abandoned(self):
+        """Вызов отменён, не дав ответа: в HALF_OPEN следующий станет пробой"""
+        self._probe = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class _Abandoned(Exception):
+    """Ведущий вызов SingleFlight отменён: результата не будет"""
+
+
+class SingleFlight:
+    """Одновременные одинаковые чтения разделяют один запрос.
+
+    Если вызвавшего запрос отменили (например, по таймауту обработчика),
+    ожидающие не получают чужой CancelledError: первый из них выполняет
+    запрос заново, остальные присоединяются к нему.
+    """
+
+    def __init__(self):
+        self.calls = {}  # key -> asyncio.Future
+        self.shared = 0
+
+    async def do(self, key, factory):
+        while key in self.calls:
+            self.shared += 1
+            try:
+                return await asyncio.shield(self.calls[key])
+            except _Abandoned:
+                continue
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.set_exception(_Abandoned())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение забирают ожидающие; если их нет — не ругаться в лог
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.calls[key]
@@ -0,0 +1,57 @@
+from datetime import date
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.helpers import escape_markdown
+
+WEEKDAY_NAMES = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+FREE_PAGE_SIZE = 10  # свободных блоков на странице /free
+
+
+def render_day(date_str: str, day, tasks: dict = None) -> str:
+    """Страница расписания одного дня (сон не показывается).
+
+    tasks — сводки задач по id: авто-блоки хранят в task только id задачи,
+    ручные — название на момент выбора. Текст пользователя экранируется
+    под parse_mode="Markdown".
+    """
+    tasks = tasks or {}
+    weekday = WEEKDAY_NAMES[date.fromisoformat(date_str).weekday()]
+    lines = []
+    for time_slot, slot_type, task, task_id in day.items():
+        if slot_type == "sleep":
+            continue
+        if not task:
+            label = "Свободно"
+        elif slot_type == "lecture":
+            label = escape_markdown(task)
+        else:
+            default_name = task if task_id else "Задача"
+            label = escape_markdown((tasks.get(task_id or task) or {}).get("name", default_name))
+        lines.append(f"- {time_slot}: {label}")
+    return f"📅 *Расписание на {date_str} ({weekday})*\n\n" + "\n".join(lines or ["Нет блоков"])
+
+
+def render_free_slots(slots: list, page: int) -> str:
+    if not slots:
+        return "😔 Свободных блоков в горизонте планирования нет." if page == 0 else "Больше свободных блоков нет."
+    lines = []
+    current = None
+    for slot in slots:
+        if slot["date"] != current:
+            current = slot["date"]
+            weekday = WEEKDAY_NAMES[date.fromisoformat(current).weekday()]
+            lines.append(f"\n*{current} ({weekday})*")
+        lines.append(f"- {slot['time']}")
+    return "🕒 *Ближайшие свободные блоки:*\n" + "\n".join(lines)
+
+
+def page_keyboard(prefix: str, page: int, pages: int, counter: bool = True):
+    """Кнопки ◀️/▶️ с callback_data вида "{prefix}:{page}" (None — одна страница)"""
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️", callback_data=f"{prefix}:{page - 1}"))
+    if counter and pages > 1:
+        buttons.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="noop"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=f"{prefix}:{page + 1}"))
+    return InlineKeyboardMarkup([buttons]) if pages > 1 else None
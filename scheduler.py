@@ -0,0 +1,218 @@
+import heapq
+from datetime import date, datetime, timedelta
+
+from availability import DAY_MASK, DAY_START_SLOT, SLOTS_PER_DAY, slot_index, slot_time
+
+# Порядок перебора блоков внутри дня: с 08:00 до 23:30, затем 00:00–07:30
+SLOT_ORDER = [(DAY_START_SLOT + i) % SLOTS_PER_DAY for i in range(SLOTS_PER_DAY)]
+# Дедлайн и ручные блоки — не дальше, чем на столько дней вперёд: планировщик
+# проходит каждый день до самого дальнего дедлайна, индекс хранит их все
+MAX_PLAN_DAYS = 365
+# Задачи, которые планировщик не трогает: ручные и отклонённые через /no
+FIXED_MODES = ("manual", "unplaced")
+
+
+def priority_weight(priority, priorities: dict) -> int:
+    """Вес приоритета; в базе он хранится как "urgent 🔴", "high 🟠" и т.д."""
+    if not priority:
+        return 0
+    return priorities.get(str(priority).split()[0], 0)
+
+
+def blocks_required(task: dict) -> int:
+    hours = float(task.get("time_required") or 0)
+    blocks = int(hours * 2)
+    return blocks + (1 if blocks < hours * 2 else 0)
+
+
+def plan_schedule(tasks: dict, index, priorities: dict, now: datetime = None,
+                  per_day: int = 6) -> dict:
+    """Глобальное распределение всех автоматических задач пользователя.
+
+    tasks — дерево tasks/{uid}; index — AvailabilityIndex пользователя
+    (блоки type == "free" распределяемы, сон/лекции/ручные блоки фиксированы).
+    Ручные и отклонённые задачи (FIXED_MODES), просроченные задачи и уже
+    прошедшие блоки не трогаются.
+
+    1. Допуск (Moore–Hodgson по дедлайнам): задачи идут в порядке дедлайна,
+       при нехватке суммарной ёмкости отбрасывается самая неважная.
+    2. Размещение: валидные текущие блоки задач сохраняются, остаток
+       заполняется по EDF с учётом приоритета, не более per_day блоков
+       задачи в день. Если «липкие» блоки мешают, размещение повторяется
+       с нуля.
+
+    Возвращает {"assignments", "schedule_updates", "task_updates",
+    "unscheduled"}; schedule_updates содержит только изменившиеся блоки.
+    """
+    now = now or datetime.now()
+    result = {"assignments": {}, "schedule_updates": {}, "task_updates": {}, "unscheduled": {}}
+    if index.start is None or not tasks:
+        return result
+
+    first_offset = max((now.date() - index.start).days, 0)
+    now_slot = now.hour * 2 + (1 if now.minute >= 30 else 0)
+
+    def is_past(key):
+        return key[0] < first_offset or (key[0] == first_offset and key[1] < now_slot)
+
+    # Задачи к распределению: (дедлайн в днях от start, -вес, task_id, блоков)
+    jobs = []
+    owner = {}  # будущие блоки задач: (offset, slot) -> task_id
+    frozen = {}  # прошедшие блоки задач остаются в assigned_blocks как есть
+    for task_id, task in tasks.items():
+        if task.get("mode") in FIXED_MODES:
+            continue
+        try:
+            deadline = date.fromisoformat(task["deadline"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        last = min((deadline - index.start).days, len(index.free) - 1)
+        if last < first_offset:
+            continue
+        frozen[task_id] = []
+        for block in task.get("assigned_blocks") or []:
+            try:
+                day = date.fromisoformat(block["date"])
+                key = ((day - index.start).days, slot_index(block["time"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if is_past(key):
+                frozen[task_id].append(key)
+            else:
+                owner.setdefault(key, task_id)
+        need = blocks_required(task) - len(frozen[task_id])
+        jobs.append((last, -priority_weight(task.get("priority"), priorities), task_id, max(need, 0)))
+    if not jobs:
+        return result
+
+    horizon = max(job[0] for job in jobs)
+
+    # Распределяемые блоки по дням: free и не занятые чужими (не из tasks) задачами
+    usable = {}
+    for offset in range(first_offset, horizon + 1):
+        mask = index.free[offset]
+        foreign = index.taken[offset]
+        for slot in range(SLOTS_PER_DAY):
+            if foreign >> slot & 1 and (offset, slot) in owner:
+                foreign &= ~(1 << slot)
+        mask &= ~foreign & DAY_MASK
+        if offset == first_offset:
+            mask &= ~((1 << now_slot) - 1)
+        if mask:
+            usable[offset] = [slot for slot in SLOT_ORDER if mask >> slot & 1]
+
+    # 1. Допуск: Moore–Hodgson с весами приоритетов
+    jobs.sort()
+    admitted = []  # куча (вес, -блоков, task_id, блоков)
+    demand = 0
+    capacity = 0
+    cap_offset = first_offset
+    for last, neg_weight, task_id, need in jobs:
+        if need == 0:
+            continue
+        while cap_offset <= last:
+            capacity += len(usable.get(cap_offset, ()))
+            cap_offset += 1
+        heapq.heappush(admitted, (-neg_weight, -need, task_id, need))
+        demand += need
+        while demand > capacity and admitted:
+            _, _, dropped, dropped_need = heapq.heappop(admitted)
+            demand -= dropped_need
+            result["unscheduled"][dropped] = dropped_need
+    admitted_ids = {entry[2] for entry in admitted}
+    jobs = [job for job in jobs if job[3] == 0 or job[2] in admitted_ids]
+
+    # 2. Размещение
+    assignment = _place(jobs, usable, owner, per_day, sticky=True)
+    if any(len(assignment[job[2]]) < job[3] for job in jobs):
+        assignment = _place(jobs, usable, owner, per_day, sticky=False)
+    for last, _, task_id, need in jobs:
+        missing = need - len(assignment[task_id])
+        if missing > 0:
+            result["unscheduled"][task_id] = missing
+
+    # 3. Дифф относительно текущего состояния
+    new_owner = {}
+    for task_id, slots in assignment.items():
+        for key in slots:
+            new_owner[key] = task_id
+    for task_id in result["unscheduled"]:
+        assignment.setdefault(task_id, [])
+
+    def block_of(key):
+        return {
+            "date": (index.start + timedelta(days=key[0])).isoformat(),
+            "time": slot_time(key[1]),
+        }
+
+    for key in set(owner) | set(new_owner):
+        if owner.get(key) != new_owner.get(key):
+            block = block_of(key)
+            result["schedule_updates"][f"{block['date']}/{block['time']}/task"] = new_owner.get(key)
+
+    for task_id, slots in assignment.items():
+        blocks = [block_of(key) for key in sorted(frozen[task_id] + slots)]
+        result["assignments"][task_id] = blocks
+        if blocks != (tasks[task_id].get("assigned_blocks") or []):
+            result["task_updates"][task_id] = {"assigned_blocks": blocks}
+    return result
+
+
+def displaced_tasks(tasks: dict, plan: dict, exclude=()) -> dict:
+    """{task_id: сколько блоков теряет задача} для задач, у которых план
+    забирает блоки (кроме exclude — обычно только что добавленных)"""
+    lost = {}
+    for task_id, blocks in plan["assignments"].items():
+        if task_id in exclude or task_id not in tasks:
+            continue
+        task = tasks[task_id]
+        before = min(len(task.get("assigned_blocks") or []), blocks_required(task))
+        if len(blocks) < before:
+            lost[task_id] = before - len(blocks)
+    return lost
+
+
+def _place(jobs: list, usable: dict, owner: dict, per_day: int, sticky: bool) -> dict:
+    """EDF-заполнение дней; jobs отсортированы по (дедлайн, -вес)"""
+    assignment = {job[2]: [] for job in jobs}
+    remaining = {job[2]: job[3] for job in jobs}
+    used = set()
+    per_day_count = {}
+
+    if sticky:
+        deadlines = {job[2]: job[0] for job in jobs}
+        for key, task_id in sorted(owner.items()):
+            offset, slot = key
+            if (task_id in remaining and remaining[task_id] > 0
+                    and offset <= deadlines[task_id]
+                    and slot in usable.get(offset, ())
+                    and per_day_count.get((task_id, offset), 0) < per_day):
+                assignment[task_id].append(key)
+                used.add(key)
+                remaining[task_id] -= 1
+                per_day_count[(task_id, offset)] = per_day_count.get((task_id, offset), 0) + 1
+
+    pending = [job for job in jobs if remaining[job[2]] > 0]
+    heap = [(last, neg_weight, task_id) for last, neg_weight, task_id, _ in pending]
+    heapq.heapify(heap)
+    for offset in sorted(usable):
+        while heap and heap[0][0] < offset:
+            heapq.heappop(heap)  # дедлайн прошёл — остаток не размещается
+        if not heap:
+            break
+        free_slots = [slot for slot in usable[offset] if (offset, slot) not in used]
+        position = 0
+        postponed = []
+        while heap and position < len(free_slots):
+            last, neg_weight, task_id = heapq.heappop(heap)
+            quota = min(per_day - per_day_count.get((task_id, offset), 0), remaining[task_id])
+            take = free_slots[position:position + max(quota, 0)]
+            position += len(take)
+            for slot in take:
+                assignment[task_id].append((offset, slot))
+            remaining[task_id] -= len(take)
+            if remaining[task_id] > 0:
+                postponed.append((last, neg_weight, task_id))
+        for entry in postponed:
+            heapq.heappush(heap, entry)
+    return assignment
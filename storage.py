@@ -0,0 +1,623 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from resilience import TransientStorageError
+
+logger = logging.getLogger(__name__)
+
+# Бэкенды хранения с API по путям в духе Firebase RTDB:
+# tasks/{uid}/{task_id}, schedule/{uid}/{date}/{HH:MM}, прочие корни — документами.
+
+_PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+
+def _push_id() -> str:
+    """Ключ в формате push-id Firebase: 8 символов времени + 12 случайных"""
+    value = int(time.time() * 1000)
+    stamp = []
+    for _ in range(8):
+        stamp.append(_PUSH_CHARS[value % 64])
+        value //= 64
+    return "".join(reversed(stamp)) + "".join(random.choice(_PUSH_CHARS) for _ in range(12))
+
+
+def _split(path: str) -> list:
+    return [part for part in path.strip("/").split("/") if part]
+
+
+def _clean(value):
+    """Убирает None-поля и пустые словари, как это делает Firebase"""
+    if isinstance(value, dict):
+        cleaned = {}
+        for key, child in value.items():
+            child = _clean(child)
+            if child is not None:
+                cleaned[key] = child
+        return cleaned or None
+    return value
+
+
+def _get_in(doc, parts: list):
+    for part in parts:
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def _set_in(doc, parts: list, value):
+    """Возвращает копию doc с value по пути parts (None — удаление)"""
+    if not parts:
+        return _clean(value)
+    doc = dict(doc) if isinstance(doc, dict) else {}
+    child = _set_in(doc.get(parts[0]), parts[1:], value)
+    if child is None:
+        doc.pop(parts[0], None)
+    else:
+        doc[parts[0]] = child
+    return doc or None
+
+
+class ConflictError(Exception):
+    """Условие транзакции не выполнено (например, блок уже занят)"""
+
+
+class StorageBackend:
+    """Интерфейс хранилища: get/set/update/push/delete по путям"""
+
+    name = "base"
+
+    def get(self, path: str):
+        raise NotImplementedError
+
+    def set(self, path: str, value):
+        raise NotImplementedError
+
+    def update(self, path: str, updates: dict):
+        """Multi-path update: ключи updates — пути относительно path"""
+        raise NotImplementedError
+
+    def push(self, path: str, value) -> str:
+        raise NotImplementedError
+
+    def new_key(self) -> str:
+        """Ключ для нового дочернего узла без запроса к базе (для пакетной записи)"""
+        return _push_id()
+
+    def delete(self, path: str):
+        self.set(path, None)
+
+    def transaction(self, path: str, keys: list, build) -> dict:
+        """Атомарно читает path/key для каждого key, вызывает build(current)
+        и применяет возвращённый multi-path update относительно path.
+        build бросает ConflictError, чтобы отменить запись."""
+        raise NotImplementedError
+
+    def query_equal(self, path: str, child: str, value) -> dict:
+        """Дочерние узлы path, у которых поле child равно value"""
+        return {
+            key: node for key, node in (self.get(path) or {}).items()
+            if isinstance(node, dict) and node.get(child) == value
+        }
+
+    def get_range(self, path: str, start: str, end: str, limit: int = None) -> dict:
+        """Дочерние узлы path с ключами от start до end включительно,
+        по возрастанию ключа, не больше limit"""
+        tree = self.get(path) or {}
+        keys = sorted(key for key in tree if start <= key <= end)[:limit]
+        return {key: tree[key] for key in keys}
+
+    def child_keys(self, path: str) -> list:
+        """Ключи дочерних узлов path без их содержимого"""
+        return list(self.get(path) or {})
+
+    def assigned_slots(self, start: str, end: str, user_ids: list) -> list:
+        """[(uid, date, time, block)] блоков с задачей за даты start..end у
+        пользователей user_ids.
+
+        По одному запросу диапазона дат на пользователя — без чтения всего
+        дерева; при старте вызывается порциями пользователей."""
+        result = []
+        for user_id in user_ids:
+            for date_str, day in self.get_range(f"schedule/{user_id}", start, end).items():
+                for time_str, block in (day or {}).items():
+                    if isinstance(block, dict) and (block.get("task") or block.get("task_id")):
+                        result.append((user_id, date_str, time_str, block))
+        return result
+
+
+class FirebaseBackend(StorageBackend):
+    """Firebase Realtime Database через firebase_admin.db"""
+
+    name = "firebase"
+
+    def __init__(self, key_json: str, database_url: str):
+        import firebase_admin
+        from firebase_admin import credentials, db, exceptions
+
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(json.loads(key_json))
+            firebase_admin.initialize_app(cred, {"databaseURL": database_url})
+        self._db = db
+        self._invalid_argument = exceptions.InvalidArgumentError
+        self._unindexed = set()  # поля, для которых на сервере нет .indexOn
+
+    def get(self, path: str):
+        return self._db.reference(path).get()
+
+    def set(self, path: str, value):
+        self._db.reference(path).set(value)
+
+    def update(self, path: str, updates: dict):
+        self._db.reference(path).update(updates)
+
+    def push(self, path: str, value) -> str:
+        ref = self._db.reference(path).push()
+        ref.set(value)
+        return ref.key
+
+    def delete(self, path: str):
+        self._db.reference(path).delete()
+
+    def transaction(self, path: str, keys: list, build) -> dict:
+        # Транзакция RTDB по поддереву path: функция может вызываться
+        # повторно при конкурентной записи, итоговые updates — из последнего вызова
+        result = {}
+
+        def apply(tree):
+            current = {key: _get_in(tree, _split(key)) for key in keys}
+            updates = build(current)
+            result["updates"] = updates
+            for rel_path, value in updates.items():
+                tree = _set_in(tree, _split(rel_path), value)
+            return tree
+
+        self._db.reference(path).transaction(apply)
+        return result.get("updates", {})
+
+    def query_equal(self, path: str, child: str, value) -> dict:
+        # Требует ".indexOn" для child в database.rules.json; без него сервер
+        # отвечает 400 "Index not defined" — тогда читаем path целиком
+        if child not in self._unindexed:
+            try:
+                return dict(self._db.reference(path).order_by_child(child).equal_to(value).get() or {})
+            except self._invalid_argument as e:
+                if "index" not in str(e).lower():
+                    raise
+                self._unindexed.add(child)
+                logger.warning("Нет .indexOn для %s (%s): запрос читает узел целиком, "
+                               "задеплойте database.rules.json", child, path)
+        return super().query_equal(path, child, value)
+
+    def get_range(self, path: str, start: str, end: str, limit: int = None) -> dict:
+        # Сервер отдаёт только нужные дни, а не всё дерево schedule/{uid}
+        query = self._db.reference(path).order_by_key().start_at(start).end_at(end)
+        if limit:
+            query = query.limit_to_first(limit)
+        return dict(query.get() or {})
+
+    def child_keys(self, path: str) -> list:
+        # shallow=True: сервер отдаёт только ключи, без поддеревьев
+        return list(self._db.reference(path).get(shallow=True) or {})
+
+
+class MemoryBackend(StorageBackend):
+    """Дерево в памяти процесса — заменитель RTDB для нагрузочных тестов.
+
+    Значения проходят через JSON при чтении и записи, как по сети,
+    поэтому вызывающий код не может случайно разделить с хранилищем объекты.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.root = {}
+        self._lock = threading.RLock()
+
+    def get(self, path: str):
+        with self._lock:
+            value = _get_in(self.root, _split(path))
+            return json.loads(json.dumps(value)) if value is not None else None
+
+    def set(self, path: str, value):
+        self.update("", {path: value})
+
+    def update(self, path: str, updates: dict):
+        base = _split(path)
+        encoded = {key: json.loads(json.dumps(value)) for key, value in updates.items()}
+        with self._lock:
+            for rel_path, value in encoded.items():
+                self._write(base + _split(rel_path), _clean(value))
+
+    def push(self, path: str, value) -> str:
+        key = _push_id()
+        self.update(path, {key: value})
+        return key
+
+    def transaction(self, path: str, keys: list, build) -> dict:
+        with self._lock:
+            current = {key: self.get(f"{path}/{key}") for key in keys}
+            updates = build(current)
+            self.update(path, updates)
+        return updates
+
+    def _write(self, parts: list, value):
+        if not parts:
+            self.root = value or {}
+            return
+        # Спускаемся по пути, запоминая родителей для удаления пустых узлов
+        node = self.root
+        trail = []
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[part] = {}
+            trail.append((node, part))
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+            for parent, part in reversed(trail):
+                if parent[part]:
+                    break
+                del parent[part]
+        else:
+            node[parts[-1]] = value
+
+
+class SqliteBackend(StorageBackend):
+    """Локальное хранилище на SQLite (WAL + mmap), без сетевых запросов.
+
+    tasks и schedule разложены по таблицам с ключами по пользователю
+    и дате (и индексом задач по имени для /deletetask); остальные корни (templates/…, archive/…) хранятся
+    JSON-документами по ключу "root/uid".
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            user_id TEXT NOT NULL,
+            task_id TEXT NOT NULL,
+            name TEXT,
+            deadline TEXT,
+            data TEXT NOT NULL,
+            PRIMARY KEY (user_id, task_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS tasks_by_name ON tasks (user_id, name);
+        DROP INDEX IF EXISTS tasks_by_deadline;
+
+        CREATE TABLE IF NOT EXISTS slots (
+            user_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (user_id, date, time)
+        ) WITHOUT ROWID;
+        DROP INDEX IF EXISTS slots_by_task;
+
+        CREATE TABLE IF NOT EXISTS documents (
+            key TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str = "urroutine.db", mmap_size: int = 256 * 1024 * 1024):
+        self.path = path
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # Одно соединение на поток: репозиторий вызывает бэкенд из пула потоков
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self._local.conn = conn
+        return conn
+
+    # ------------------- Чтение -------------------
+
+    def get(self, path: str):
+        parts = _split(path)
+        conn = self._conn()
+        if not parts:
+            raise ValueError("Чтение корня базы не поддерживается")
+        if parts[0] == "tasks" and len(parts) >= 2:
+            return self._get_tasks(conn, parts)
+        if parts[0] == "schedule" and len(parts) >= 2:
+            return self._get_schedule(conn, parts)
+        if len(parts) >= 2:
+            row = conn.execute("SELECT data FROM documents WHERE key = ?",
+                               ("/".join(parts[:2]),)).fetchone()
+            return _get_in(json.loads(row[0]), parts[2:]) if row else None
+        return self._get_documents(conn, parts[0])
+
+    def _get_tasks(self, conn, parts):
+        user_id = parts[1]
+        if len(parts) == 2:
+            rows = conn.execute("SELECT task_id, data FROM tasks WHERE user_id = ?", (user_id,))
+            return {task_id: json.loads(data) for task_id, data in rows} or None
+        row = conn.execute("SELECT data FROM tasks WHERE user_id = ? AND task_id = ?",
+                           (user_id, parts[2])).fetchone()
+        return _get_in(json.loads(row[0]), parts[3:]) if row else None
+
+    def _get_schedule(self, conn, parts):
+        user_id = parts[1]
+        if len(parts) == 2:
+            rows = conn.execute(
+                "SELECT date, time, data FROM slots WHERE user_id = ? ORDER BY date, time",
+                (user_id,))
+        elif len(parts) == 3:
+            rows = conn.execute(
+                "SELECT date, time, data FROM slots WHERE user_id = ? AND date = ? ORDER BY time",
+                (user_id, parts[2]))
+        else:
+            row = conn.execute(
+                "SELECT data FROM slots WHERE user_id = ? AND date = ? AND time = ?",
+                (user_id, parts[2], parts[3])).fetchone()
+            return _get_in(json.loads(row[0]), parts[4:]) if row else None
+        tree = {}
+        for date_str, time_str, data in rows:
+            tree.setdefault(date_str, {})[time_str] = json.loads(data)
+        if len(parts) == 3:
+            return tree.get(parts[2])
+        return tree or None
+
+    def query_equal(self, path: str, child: str, value) -> dict:
+        parts = _split(path)
+        if len(parts) == 2 and parts[0] == "tasks" and child in ("name", "deadline"):
+            rows = self._conn().execute(
+                f"SELECT task_id, data FROM tasks WHERE user_id = ? AND {child} = ?",
+                (parts[1], value))
+            return {task_id: json.loads(data) for task_id, data in rows}
+        return super().query_equal(path, child, value)
+
+    def assigned_slots(self, start: str, end: str, user_ids: list) -> list:
+        if not user_ids:
+            return []
+        rows = self._conn().execute(
+            "SELECT user_id, date, time, data FROM slots"
+            f" WHERE user_id IN ({', '.join('?' * len(user_ids))}) AND date BETWEEN ? AND ?",
+            (*user_ids, start, end))
+        result = []
+        for user_id, date_str, time_str, data in rows:
+            block = json.loads(data)
+            if isinstance(block, dict) and (block.get("task") or block.get("task_id")):
+                result.append((user_id, date_str, time_str, block))
+        return result
+
+    def get_range(self, path: str, start: str, end: str, limit: int = None) -> dict:
+        parts = _split(path)
+        if len(parts) != 2 or parts[0] != "schedule":
+            return super().get_range(path, start, end, limit)
+        rows = self._conn().execute(
+            "SELECT date, time, data FROM slots WHERE user_id = ? AND date BETWEEN ? AND ?"
+            " ORDER BY date, time",
+            (parts[1], start, end))
+        tree = {}
+        for date_str, time_str, data in rows:
+            if date_str not in tree and limit and len(tree) >= limit:
+                break
+            tree.setdefault(date_str, {})[time_str] = json.loads(data)
+        return tree
+
+    def child_keys(self, path: str) -> list:
+        parts = _split(path)
+        if parts in (["tasks"], ["schedule"]):
+            table = "tasks" if parts[0] == "tasks" else "slots"
+            return [row[0] for row in self._conn().execute(f"SELECT DISTINCT user_id FROM {table}")]
+        return super().child_keys(path)
+
+    def _get_documents(self, conn, root):
+        rows = conn.execute("SELECT key, data FROM documents WHERE key LIKE ?", (root + "/%",))
+        return {key.split("/", 1)[1]: json.loads(data) for key, data in rows} or None
+
+    # ------------------- Запись -------------------
+
+    def set(self, path: str, value):
+        self.update("", {path: value})
+
+    def update(self, path: str, updates: dict):
+        base = _split(path)
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for rel_path, value in updates.items():
+                    self._write(conn, base + _split(rel_path), value)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def transaction(self, path: str, keys: list, build) -> dict:
+        base = _split(path)
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = {key: self.get("/".join(base + _split(key))) for key in keys}
+                updates = build(current)
+                for rel_path, value in updates.items():
+                    self._write(conn, base + _split(rel_path), value)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return updates
+
+    def push(self, path: str, value) -> str:
+        key = _push_id()
+        self.update(path, {key: value})
+        return key
+
+    def _write(self, conn, parts, value):
+        value = _clean(value)
+        if parts and parts[0] == "tasks" and len(parts) >= 2:
+            self._write_tasks(conn, parts, value)
+        elif parts and parts[0] == "schedule" and len(parts) >= 2:
+            self._write_schedule(conn, parts, value)
+        elif len(parts) >= 2:
+            key = "/".join(parts[:2])
+            row = conn.execute("SELECT data FROM documents WHERE key = ?", (key,)).fetchone()
+            doc = _set_in(json.loads(row[0]) if row else None, parts[2:], value)
+            if doc is None:
+                conn.execute("DELETE FROM documents WHERE key = ?", (key,))
+            else:
+                conn.execute("INSERT OR REPLACE INTO documents (key, data) VALUES (?, ?)",
+                             (key, json.dumps(doc, ensure_ascii=False)))
+        elif len(parts) == 1:
+            conn.execute("DELETE FROM documents WHERE key LIKE ?", (parts[0] + "/%",))
+            for child, child_value in (value or {}).items():
+                self._write(conn, parts + [child], child_value)
+        else:
+            raise ValueError("Запись в корень базы не поддерживается")
+
+    def _write_tasks(self, conn, parts, value):
+        user_id = parts[1]
+        if len(parts) == 2:
+            conn.execute("DELETE FROM tasks WHERE user_id = ?", (user_id,))
+            for task_id, task in (value or {}).items():
+                self._write_tasks(conn, [*parts, task_id], task)
+            return
+        task_id = parts[2]
+        if len(parts) > 3:
+            row = conn.execute("SELECT data FROM tasks WHERE user_id = ? AND task_id = ?",
+                               (user_id, task_id)).fetchone()
+            value = _set_in(json.loads(row[0]) if row else None, parts[3:], value)
+        if value is None:
+            conn.execute("DELETE FROM tasks WHERE user_id = ? AND task_id = ?", (user_id, task_id))
+            return
+        conn.execute(
+            "INSERT OR REPLACE INTO tasks (user_id, task_id, name, deadline, data) VALUES (?, ?, ?, ?, ?)",
+            (user_id, task_id, value.get("name"), value.get("deadline"),
+             json.dumps(value, ensure_ascii=False)))
+
+    def _write_schedule(self, conn, parts, value):
+        user_id = parts[1]
+        if len(parts) == 2:
+            conn.execute("DELETE FROM slots WHERE user_id = ?", (user_id,))
+            for date_str, day in (value or {}).items():
+                self._write_schedule(conn, [*parts, date_str], day)
+            return
+        date_str = parts[2]
+        if len(parts) == 3:
+            conn.execute("DELETE FROM slots WHERE user_id = ? AND date = ?", (user_id, date_str))
+            for time_str, slot in (value or {}).items():
+                self._write_schedule(conn, [*parts, time_str], slot)
+            return
+        time_str = parts[3]
+        if len(parts) > 4:
+            row = conn.execute(
+                "SELECT data FROM slots WHERE user_id = ? AND date = ? AND time = ?",
+                (user_id, date_str, time_str)).fetchone()
+            value = _set_in(json.loads(row[0]) if row else None, parts[4:], value)
+        if value is None:
+            conn.execute("DELETE FROM slots WHERE user_id = ? AND date = ? AND time = ?",
+                         (user_id, date_str, time_str))
+            return
+        conn.execute(
+            "INSERT OR REPLACE INTO slots (user_id, date, time, data) VALUES (?, ?, ?, ?)",
+            (user_id, date_str, time_str, json.dumps(value, ensure_ascii=False)))
+
+
+
+class FaultInjectingBackend(StorageBackend):
+    """Обёртка, вносящая временные сбои и задержку в каждый вызов.
+
+    Для проверки повторов, предохранителя и отдачи устаревших данных
+    без сети: failure_rate — доля вызовов, падающих с TransientStorageError,
+    down=True — полный отказ хранилища.
+    """
+
+    def __init__(self, backend: StorageBackend, failure_rate: float = 0.0,
+                 latency: float = 0.0, seed: int = None):
+        self.backend = backend
+        self.name = backend.name
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.down = False
+        self.calls = 0
+        self.injected = 0
+        self._random = random.Random(seed)
+
+    def _fault(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.down or self._random.random() < self.failure_rate:
+            self.injected += 1
+            raise TransientStorageError("injected fault")
+
+    def get(self, path: str):
+        self._fault()
+        return self.backend.get(path)
+
+    def set(self, path: str, value):
+        self._fault()
+        self.backend.set(path, value)
+
+    def update(self, path: str, updates: dict):
+        self._fault()
+        self.backend.update(path, updates)
+
+    def push(self, path: str, value) -> str:
+        self._fault()
+        return self.backend.push(path, value)
+
+    def delete(self, path: str):
+        self._fault()
+        self.backend.delete(path)
+
+    def transaction(self, path: str, keys: list, build) -> dict:
+        self._fault()
+        return self.backend.transaction(path, keys, build)
+
+    def query_equal(self, path: str, child: str, value) -> dict:
+        self._fault()
+        return self.backend.query_equal(path, child, value)
+
+    def get_range(self, path: str, start: str, end: str, limit: int = None) -> dict:
+        self._fault()
+        return self.backend.get_range(path, start, end, limit)
+
+    def child_keys(self, path: str) -> list:
+        self._fault()
+        return self.backend.child_keys(path)
+
+    def assigned_slots(self, start: str, end: str, user_ids: list) -> list:
+        self._fault()
+        return self.backend.assigned_slots(start, end, user_ids)
+
+
+def create_backend() -> StorageBackend:
+    """Бэкенд по переменной окружения STORAGE_BACKEND (firebase | sqlite | memory).
+    STORAGE_FAULT_RATE > 0 оборачивает его в FaultInjectingBackend"""
+    kind = os.getenv("STORAGE_BACKEND", "firebase").lower()
+    if kind == "memory":
+        backend = MemoryBackend()
+    elif kind == "sqlite":
+        backend = SqliteBackend(os.getenv("SQLITE_PATH", "urroutine.db"))
+    elif kind == "firebase":
+        backend = FirebaseBackend(
+            os.getenv("FIREBASE_KEY"),
+            os.getenv("FIREBASE_DATABASE_URL", "https://urroutine-default-rtdb.firebaseio.com"),
+        )
+    else:
+        raise ValueError(f"Неизвестный STORAGE_BACKEND: {kind}")
+    fault_rate = float(os.getenv("STORAGE_FAULT_RATE", 0))
+    if fault_rate > 0:
+        backend = FaultInjectingBackend(backend, failure_rate=fault_rate)
+    return backend
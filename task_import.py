@@ -0,0 +1,126 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+
+from scheduler import MAX_PLAN_DAYS
+
+# Колонки CSV (и поля объектов JSON) — те же, что у задачи в базе
+COLUMNS = ("name", "priority", "time_required", "deadline", "notes")
+MAX_ROWS = 1000
+MAX_NAME = 100  # как в пошаговом вводе
+MAX_HOURS = 200
+
+
+class DocumentError(ValueError):
+    """Документ не удалось разобрать целиком (формат, кодировка, размер)"""
+
+
+def parse_document(data: bytes, filename: str = "") -> list:
+    """CSV или JSON -> список словарей-строк (формат по расширению или содержимому)"""
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise DocumentError("Файл должен быть в кодировке UTF-8")
+    stripped = text.lstrip()
+    if filename.lower().endswith(".json") or stripped[:1] in ("[", "{"):
+        try:
+            payload = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise DocumentError(f"Некорректный JSON: {e.msg} (строка {e.lineno})")
+        rows = payload.get("tasks") if isinstance(payload, dict) else payload
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise DocumentError("JSON должен быть списком задач или {\"tasks\": [...]}")
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        missing = {"name", "time_required", "deadline"} - set(reader.fieldnames or ())
+        if missing:
+            raise DocumentError(f"В CSV нет колонок: {', '.join(sorted(missing))}")
+        rows = list(reader)
+    if len(rows) > MAX_ROWS:
+        raise DocumentError(f"Слишком много задач: {len(rows)} (максимум {MAX_ROWS})")
+    return rows
+
+
+def _parse_deadline(value) -> str:
+    value = str(value or "").strip()
+    for fmt in ("%d.%m.%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ValueError(f"дедлайн «{value}» не в формате ДД.ММ.ГГГГ")
+
+
+def validate_rows(rows: list, priority_labels: dict, today: date = None) -> tuple:
+    """Один проход по всем строкам: (задачи, ошибки, пропущенные).
+
+    priority_labels — {"high": "high 🟠", ...}; приоритет принимается
+    ключом или подписью кнопки, по умолчанию — medium. Задачи получают
+    те же поля, что и при пошаговом вводе. Строки с прошедшим дедлайном
+    не ошибка, а предупреждение в пропущенных: /export отдаёт и
+    просроченные задачи, и его файл должен импортироваться обратно.
+    """
+    today = today or date.today()
+    latest = (today + timedelta(days=MAX_PLAN_DAYS)).isoformat()
+    today = today.isoformat()
+    by_label = {label: label for label in priority_labels.values()}
+    by_label.update({key: label for key, label in priority_labels.items()})
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    tasks, errors, skipped = [], [], []
+    for number, row in enumerate(rows, start=1):
+        try:
+            name = str(row.get("name") or "").strip()
+            if not name:
+                raise ValueError("пустое название")
+            if len(name) > MAX_NAME:
+                raise ValueError(f"название длиннее {MAX_NAME} символов")
+
+            priority = str(row.get("priority") or "").strip() or "medium"
+            label = by_label.get(priority) or by_label.get(priority.split()[0].lower())
+            if label is None:
+                raise ValueError(f"неизвестный приоритет «{priority}»")
+
+            try:
+                hours = float(str(row.get("time_required", "")).replace(",", "."))
+            except ValueError:
+                raise ValueError(f"время «{row.get('time_required')}» — не число")
+            if not 0 < hours <= MAX_HOURS:
+                raise ValueError(f"время должно быть от 0 до {MAX_HOURS} ч")
+
+            deadline = _parse_deadline(row.get("deadline"))
+            if deadline < today:
+                skipped.append(f"{number}: «{name}» — дедлайн {deadline} уже прошёл")
+                continue
+            if deadline > latest:
+                raise ValueError(f"дедлайн дальше чем через {MAX_PLAN_DAYS} дней")
+        except ValueError as e:
+            errors.append(f"{number}: {e}")
+            continue
+
+        task = {
+            "name": name,
+            "priority": label,
+            "time_required": hours,
+            "deadline": deadline,
+            "created_at": created_at,
+            "mode": "auto",
+        }
+        notes = str(row.get("notes") or "").strip()
+        if notes:
+            task["notes"] = notes
+        tasks.append(task)
+    return tasks, errors, skipped
+
+
+def export_document(tasks: dict, fmt: str = "csv") -> bytes:
+    """Задачи пользователя в CSV или JSON с колонками COLUMNS (по дедлайну)"""
+    ordered = sorted(tasks.values(), key=lambda task: (task.get("deadline") or "", task.get("name") or ""))
+    rows = [{column: task.get(column, "") for column in COLUMNS} for task in ordered]
+    if fmt == "json":
+        return json.dumps({"tasks": rows}, ensure_ascii=False, indent=2).encode()
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8-sig")
@@ -0,0 +1,54 @@
+from bisect import bisect_left, insort
+
+
+class TaskIndex:
+    """Вторичный индекс задач пользователя.
+
+    name -> множество task_id и отсортированный список (deadline, task_id).
+    Дедлайны хранятся строками "YYYY-MM-DD", поэтому сортируются без strptime.
+    """
+
+    def __init__(self, tasks: dict = None):
+        self.by_name = {}
+        self.by_deadline = []
+        self.keys = {}  # task_id -> (name, deadline)
+        for task_id, task in (tasks or {}).items():
+            self.set(task_id, task)
+
+    def set(self, task_id: str, task: dict):
+        """Добавляет задачу или переиндексирует её после изменения"""
+        key = (task.get("name"), task.get("deadline") or "")
+        if self.keys.get(task_id) == key:
+            return
+        self.discard(task_id)
+        name, deadline = key
+        self.keys[task_id] = key
+        self.by_name.setdefault(name, set()).add(task_id)
+        insort(self.by_deadline, (deadline, task_id))
+
+    def discard(self, task_id: str):
+        key = self.keys.pop(task_id, None)
+        if key is None:
+            return
+        name, deadline = key
+        ids = self.by_name.get(name)
+        if ids is not None:
+            ids.discard(task_id)
+            if not ids:
+                del self.by_name[name]
+        position = bisect_left(self.by_deadline, (deadline, task_id))
+        if position < len(self.by_deadline) and self.by_deadline[position] == (deadline, task_id):
+            del self.by_deadline[position]
+
+    def ids_by_name(self, name: str) -> set:
+        return self.by_name.get(name, set())
+
+    def partition(self, today: str) -> tuple:
+        """(активные, просроченные) task_id, каждый список по возрастанию дедлайна"""
+        split = bisect_left(self.by_deadline, (today, ""))
+        overdue = [task_id for _, task_id in self.by_deadline[:split]]
+        active = [task_id for _, task_id in self.by_deadline[split:]]
+        return active, overdue
+
+    def __len__(self):
+        return len(self.keys)
@@ -0,0 +1,170 @@
+import copy
+from datetime import date
+
+from availability import slot_index, slot_time
+from packed_day import PackedDay
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+# Шаблон по умолчанию: сон, свободное время и приёмы пищи; пары пользователь
+# добавляет сам (/settings). Диапазоны включают и начальный, и конечный
+# получасовой блок.
+DEFAULT_TEMPLATE = {
+    "sleep": {"start": "01:00", "end": "07:30"},
+    "free": {"start": "08:00", "end": "00:30"},
+    "meals": [
+        {"start": "08:00", "end": "08:00", "task": "Завтрак"},
+        {"start": "13:00", "end": "13:30", "task": "Обед"},
+        {"start": "19:00", "end": "19:00", "task": "Ужин"},
+    ],
+}
+
+# Дни недели в /settings: пн..вс или monday..sunday
+WEEKDAY_ALIASES = dict(zip(("пн", "вт", "ср", "чт", "пт", "сб", "вс"), WEEKDAYS))
+
+SETTINGS_HELP = (
+    "Изменить шаблон недели:\n"
+    "/settings sleep 01:00-07:30 — сон\n"
+    "/settings free 08:00-00:30 — свободное время\n"
+    "/settings meal 13:00-13:30 Обед — приём пищи каждый день (вместо «Обед» — «-», чтобы убрать)\n"
+    "/settings lecture пн 09:00-10:00 Лекция — пара (вместо названия — «-», чтобы убрать)\n"
+    "/settings reset — шаблон по умолчанию"
+)
+
+
+def _slot_range(start: str, end: str) -> list:
+    """Блоки с start по end включительно, с переходом через полночь"""
+    first, last = slot_index(start), slot_index(end)
+    count = (last - first) % 48 + 1
+    return [(first + i) % 48 for i in range(count)]
+
+
+class WeeklyTemplate:
+    """Недельный шаблон пользователя (templates/{uid}).
+
+    В schedule/{uid}/{date} хранятся только отличия от шаблона; день
+    собирается как «шаблон дня недели + overrides» по полям блока.
+    """
+
+    def __init__(self, data: dict = None):
+        self.data = data or DEFAULT_TEMPLATE
+        self.days = [self._compile(weekday) for weekday in WEEKDAYS]
+        self._masks = [day.masks() for day in self.days]
+
+    def _compile(self, weekday: str) -> PackedDay:
+        day = PackedDay()
+        for kind in ("sleep", "free"):
+            bounds = self.data.get(kind)
+            if bounds:
+                for index in _slot_range(bounds["start"], bounds["end"]):
+                    day.set_slot(slot_time(index), {"type": kind})
+        # Приёмы пищи и пары — фиксированные блоки, которые нельзя занять задачей
+        fixed = (self.data.get("meals") or []) + ((self.data.get("lectures") or {}).get(weekday) or [])
+        for block in fixed:
+            for index in _slot_range(block["start"], block["end"]):
+                day.set_slot(slot_time(index), {"type": "lecture", "task": block.get("task")})
+        return day
+
+    @staticmethod
+    def _weekday(value) -> int:
+        if isinstance(value, str):
+            value = date.fromisoformat(value)
+        return value.weekday()
+
+    def materialize(self, date_str: str, overrides: dict = None) -> PackedDay:
+        return self.days[self._weekday(date_str)].copy().overlay(overrides)
+
+    def masks_for(self, day) -> tuple:
+        """(free, taken) шаблонного дня — для AvailabilityIndex.fill"""
+        return self._masks[self._weekday(day)]
+
+    def block(self, date_str: str, time_str: str) -> dict:
+        task, task_id = self.days[self._weekday(date_str)].slot_task(time_str)
+        block = {"type": self.days[self._weekday(date_str)].slot_type(time_str)}
+        if task is not None:
+            block["task"] = task
+        if task_id is not None:
+            block["task_id"] = task_id
+        return block
+
+    def merge(self, date_str: str, time_str: str, value) -> dict:
+        """Итоговый блок после записи value целиком в date/time"""
+        merged = self.block(date_str, time_str)
+        merged.update(value if isinstance(value, dict) else {})
+        return merged
+
+    @property
+    def approx_size(self) -> int:
+        return sum(day.approx_size for day in self.days)
+
+
+def parse_range(text: str) -> tuple:
+    """"ЧЧ:ММ-ЧЧ:ММ" -> (start, end) по получасовым блокам; ValueError при ошибке"""
+    bounds = text.split("-")
+    if len(bounds) != 2:
+        raise ValueError(f"Диапазон «{text}» должен быть вида ЧЧ:ММ-ЧЧ:ММ")
+    times = []
+    for bound in bounds:
+        hours, _, minutes = bound.partition(":")
+        if not (hours.isdigit() and int(hours) < 24 and minutes in ("00", "30")):
+            raise ValueError(f"Время «{bound}» должно быть вида ЧЧ:00 или ЧЧ:30")
+        times.append(f"{int(hours):02d}:{minutes}")
+    return tuple(times)
+
+
+def _put_block(blocks: list, start: str, end: str, name: str) -> list:
+    """Блоки без начинающегося в start; name "-" — только удаление"""
+    blocks = [block for block in blocks if block["start"] != start]
+    if name != "-":
+        blocks.append({"start": start, "end": end, "task": name})
+    return sorted(blocks, key=lambda block: block["start"])
+
+
+def edit_template(data: dict, args: list) -> dict:
+    """Новые данные шаблона после команды /settings (args без самой команды).
+
+    data не меняется; при неверной команде — ValueError с текстом для пользователя.
+    """
+    data = copy.deepcopy(data or DEFAULT_TEMPLATE)
+    command = args[0].lower() if args else ""
+    if command == "reset" and len(args) == 1:
+        return copy.deepcopy(DEFAULT_TEMPLATE)
+    if command in ("sleep", "free") and len(args) == 2:
+        start, end = parse_range(args[1])
+        data[command] = {"start": start, "end": end}
+        return data
+    if command == "meal" and len(args) >= 3:
+        start, end = parse_range(args[1])
+        data["meals"] = _put_block(data.get("meals") or [], start, end, " ".join(args[2:]))
+        return data
+    if command == "lecture" and len(args) >= 4:
+        weekday = WEEKDAY_ALIASES.get(args[1].lower(), args[1].lower())
+        if weekday not in WEEKDAYS:
+            raise ValueError(f"Неизвестный день недели «{args[1]}»: пн, вт, ср, чт, пт, сб или вс")
+        start, end = parse_range(args[2])
+        lectures = data.setdefault("lectures", {})
+        lectures[weekday] = _put_block(lectures.get(weekday) or [], start, end, " ".join(args[3:]))
+        if not lectures[weekday]:
+            del lectures[weekday]
+        return data
+    raise ValueError(SETTINGS_HELP)
+
+
+def describe_template(data: dict) -> str:
+    """Текст шаблона для /settings (без разметки)"""
+    data = data or DEFAULT_TEMPLATE
+
+    def span(block):
+        return f"{block['start']}-{block['end']}"
+
+    lines = ["⚙️ Шаблон недели", ""]
+    for kind, title in (("sleep", "Сон"), ("free", "Свободное время")):
+        if data.get(kind):
+            lines.append(f"{title}: {span(data[kind])}")
+    for block in data.get("meals") or []:
+        lines.append(f"Каждый день {span(block)}: {block.get('task')}")
+    aliases = {weekday: alias for alias, weekday in WEEKDAY_ALIASES.items()}
+    for weekday in WEEKDAYS:
+        for block in (data.get("lectures") or {}).get(weekday) or []:
+            lines.append(f"{aliases[weekday].capitalize()} {span(block)}: {block.get('task')}")
+    return "\n".join(lines)
@@ -0,0 +1,51 @@
+from datetime import date
+
+from availability import AvailabilityIndex, DAY_MASK
+
+START = date(2030, 1, 7)
+
+
+def all_free(day):
+    return DAY_MASK, 0
+
+
+def test_first_free_starts_at_morning_and_respects_per_day():
+    index = AvailabilityIndex(START, fill=all_free)
+    index.ensure("2030-01-09")
+    blocks = index.first_free("2030-01-07", "2030-01-09", 5, per_day=2)
+    assert blocks == [
+        {"date": "2030-01-07", "time": "08:00"},
+        {"date": "2030-01-07", "time": "08:30"},
+        {"date": "2030-01-08", "time": "08:00"},
+        {"date": "2030-01-08", "time": "08:30"},
+        {"date": "2030-01-09", "time": "08:00"},
+    ]
+
+
+def test_first_free_stops_at_deadline():
+    index = AvailabilityIndex(START, fill=all_free)
+    index.ensure("2030-01-09")
+    assert len(index.first_free("2030-01-07", "2030-01-07", 10, per_day=4)) == 4
+
+
+def test_apply_task_field_and_whole_block():
+    index = AvailabilityIndex(START, fill=all_free)
+    index.apply("2030-01-07/08:00/task", "t1")
+    assert not index.is_available("2030-01-07", "08:00")
+    assert index.first_free("2030-01-07", "2030-01-07", 1)[0]["time"] == "08:30"
+
+    index.apply("2030-01-07/08:00/task", None)
+    assert index.is_available("2030-01-07", "08:00")
+
+    index.apply("2030-01-07/09:00", {"type": "lecture"})
+    assert not index.is_available("2030-01-07", "09:00")
+    index.apply("2030-01-07/09:00", {"type": "free"})
+    assert index.is_available("2030-01-07", "09:00")
+
+
+def test_copy_is_independent():
+    index = AvailabilityIndex(START, fill=all_free)
+    index.ensure("2030-01-08")
+    snapshot = index.copy()
+    index.apply("2030-01-07/08:00/task", "t1")
+    assert snapshot.is_available("2030-01-07", "08:00")
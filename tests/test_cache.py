@@ -0,0 +1,58 @@
+from cache import LRUCache, MISSING
+
+
+def test_lru_evicts_oldest_by_size_and_expires_by_ttl():
+    cache = LRUCache(max_bytes=20, ttl=60)
+    cache.set(("tasks", "1"), "a" * 8)
+    cache.set(("tasks", "2"), "b" * 8)
+    assert cache.get(("tasks", "1")) == "a" * 8  # 1 становится самым свежим
+    cache.set(("tasks", "3"), "c" * 8)
+    assert cache.get(("tasks", "2")) is MISSING and cache.evictions == 1
+
+    cache.ttl = -1
+    cache.set(("tasks", "4"), "d")
+    assert cache.get(("tasks", "4")) is MISSING
+    assert cache.get_stale(("tasks", "4")) == "d"
+    assert cache.peek(("tasks", "4")) is MISSING and cache.get_stale(("tasks", "4")) is MISSING
+
+
+def test_invalidate_user_drops_only_that_user():
+    cache = LRUCache()
+    cache.set(("schedule", "1", "2030-01-07"), {})
+    cache.set(("tasks", "1"), {})
+    cache.set(("tasks", "2"), {})
+    cache.invalidate_user("1")
+    assert cache.stats()["entries"] == 1 and cache.get(("tasks", "2")) == {}
+
+
+def test_read_started_before_write_is_not_cached():
+    cache = LRUCache()
+    key = ("tasks", "1")
+    for write in (cache.invalidate, cache.touch, lambda key: cache.set(key, {"new": 1}),
+                  lambda key: cache.invalidate_user("1")):
+        cache.clear()
+        version = cache.version(key)  # промах: чтение уходит в хранилище
+        write(key)
+        cache.set(key, {"old": 1}, version=version)
+        assert cache.peek(key) in (MISSING, {"new": 1})
+
+    version = cache.version(key)
+    cache.invalidate(("tasks", "2"))
+    cache.set(key, {"fresh": 1}, version=version)
+    assert cache.get(key) == {"fresh": 1}
+    assert cache.stats()["rejected"] == 4
+
+
+def test_version_marks_survive_forgetting_versions():
+    cache = LRUCache()
+    key = ("tasks", "1")
+    stale = cache.version(key)
+    cache.invalidate(key)
+    for number in range(2000):  # версии без записей в кэше периодически забываются
+        cache.invalidate(("tasks", str(number + 10)))
+    assert len(cache._versions) < 2000
+    cache.set(key, "stale", version=stale)
+    assert cache.peek(key) is MISSING
+    version = cache.version(key)
+    cache.set(key, "fresh", version=version)
+    assert cache.peek(key) == "fresh"
@@ -0,0 +1,148 @@
+import asyncio
+import os
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["OUTBOX_ENABLED"] = "0"
+
+import main  # noqa: E402
+
+CHAT_ID = 424242
+
+
+class FakeMessage:
+    def __init__(self, text: str = None):
+        self.chat = SimpleNamespace(id=CHAT_ID)
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return self
+
+
+class FakeQuery:
+    def __init__(self, data: str):
+        self.data = data
+        self.message = FakeMessage()
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text, **kwargs):
+        self.message.replies.append(text)
+
+
+def message(text: str):
+    return SimpleNamespace(message=FakeMessage(text), callback_query=None,
+                           effective_chat=SimpleNamespace(id=CHAT_ID), effective_user=SimpleNamespace(id=CHAT_ID))
+
+
+def button(data: str):
+    return SimpleNamespace(message=None, callback_query=FakeQuery(data),
+                           effective_chat=SimpleNamespace(id=CHAT_ID), effective_user=SimpleNamespace(id=CHAT_ID))
+
+
+async def add_task(context, mode: str, name: str, hours: str = "1"):
+    deadline = (date.today() + timedelta(days=5)).strftime("%d.%m.%Y")
+    await main.add_task_start(message("/addtask"), context)
+    await main.ask_priority(button(mode), context)
+    await main.handle_task_input(button("high 🟠"), context)
+    for text in (name, hours, deadline, "заметка"):
+        update = message(text)
+        await main.handle_task_input(update, context)
+    return update.message.replies
+
+
+@pytest.fixture
+def context():
+    main.backend.backend.root = {}  # MemoryBackend под InstrumentedBackend: чистая база на тест
+    main.repository.forget_user(str(CHAT_ID))
+    return SimpleNamespace(user_data={}, args=[], application=None)
+
+
+def test_yes_and_no_do_not_touch_manual_block_selection(context):
+    async def scenario():
+        await add_task(context, "manual", "Ручная")
+        assert context.user_data["blocks_remaining"] == 2
+        day = (date.today() + timedelta(days=2)).strftime("%d.%m.%Y")
+        await main.handle_manual_blocks(message(f"{day} 10:00"), context)
+
+        yes, no = message("/yes"), message("/no")
+        await main.confirm_reschedule(yes, context)
+        await main.decline_reschedule(no, context)
+        assert yes.message.replies == ["⚠️ Нет задачи, ожидающей подтверждения."]
+        assert no.message.replies == ["⚠️ Нет задачи, ожидающей подтверждения."]
+
+        last = message(f"{day} 10:30")
+        await main.handle_manual_blocks(last, context)
+        assert last.message.replies[-1].startswith("✅")
+        tasks = await main.repository.get_tasks(str(CHAT_ID))
+        (task,) = tasks.values()
+        assert task["mode"] == "manual" and len(task["assigned_blocks"]) == 2
+
+    asyncio.run(scenario())
+
+
+def test_schedule_page_shows_escaped_task_names(context):
+    async def scenario():
+        await add_task(context, "auto", "Курс_работа")
+        user_id = str(CHAT_ID)
+        tasks = await main.repository.get_tasks(user_id)
+        ((task_id, task),) = tasks.items()
+        date_str = task["assigned_blocks"][0]["date"]
+
+        text = await main.repository.get_schedule_page(user_id, date_str)
+        assert "Курс\\_работа" in text and task_id not in text
+
+        await main.repository.update_task(user_id, task_id, {"name": "Диплом"})
+        text = await main.repository.get_schedule_page(user_id, date_str)
+        assert "Диплом" in text and "Курс" not in text
+
+    asyncio.run(scenario())
+
+
+def test_settings_persists_template(context):
+    async def scenario():
+        context.args = ["lecture", "пн", "10:00-11:00", "Лекция"]
+        update = message("/settings")
+        await main.show_settings(update, context)
+        assert update.message.replies[-1].startswith("✅")
+        saved = main.backend.get(f"templates/{CHAT_ID}")
+        assert saved["lectures"] == {"monday": [{"start": "10:00", "end": "11:00", "task": "Лекция"}]}
+
+        context.args = ["lecture", "пн", "10:00"]
+        update = message("/settings")
+        await main.show_settings(update, context)
+        assert update.message.replies[-1].startswith("❌")
+
+    asyncio.run(scenario())
+
+
+def test_import_does_not_take_blocks_of_placed_tasks(context):
+    async def scenario():
+        await add_task(context, "auto", "Старая")
+        user_id = str(CHAT_ID)
+        (old_id, old), = (await main.repository.get_tasks(user_id)).items()
+        deadline = (date.today() + timedelta(days=1)).strftime("%d.%m.%Y")
+        header = "name,priority,time_required,deadline,notes\n"
+
+        update = message("/import")
+        await main.run_import(update, user_id, f"{header}Срочная,urgent,3,{deadline},\n".encode(), "tasks.csv")
+        assert update.message.replies[-1] == "✅ Импортировано задач: 1"
+        tasks = await main.repository.get_tasks(user_id)
+        (new_id,) = set(tasks) - {old_id}
+        assert tasks[old_id]["assigned_blocks"] == old["assigned_blocks"]
+        taken = {(block["date"], block["time"]) for block in old["assigned_blocks"]}
+        assert len(tasks[new_id]["assigned_blocks"]) == 6
+        assert taken.isdisjoint((block["date"], block["time"]) for block in tasks[new_id]["assigned_blocks"])
+
+        update = message("/import")
+        await main.run_import(update, user_id, f"{header}Огромная,urgent,100,{deadline},\n".encode(), "tasks.csv")
+        assert update.message.replies[-1].endswith("Не хватило свободных блоков до дедлайна:\n- Огромная: −100 ч")
+        assert (await main.repository.get_tasks(user_id))[old_id]["assigned_blocks"] == old["assigned_blocks"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from telegram.error import RetryAfter
+
+from outbox import MAX_TEXT, OutboundScheduler, OutboxFull, split_text
+
+
+def test_split_text_prefers_paragraphs_and_respects_limit():
+    text = "\n\n".join(["а" * 3000, "б" * 3000, "в" * 5000])
+    chunks = split_text(text)
+    assert chunks[:2] == ["а" * 3000, "б" * 3000]
+    assert "".join(chunks[2:]) == "в" * 5000
+    assert all(len(chunk) <= MAX_TEXT for chunk in chunks)
+    assert split_text("коротко") == ["коротко"]
+
+
+class Recorder:
+    """callback бота: запоминает отправки; первые fail_times вызовов — RetryAfter"""
+
+    def __init__(self, fail_times: int = 0):
+        self.calls = []
+        self.fail_times = fail_times
+
+    async def __call__(self, endpoint, data):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RetryAfter(0)
+        self.calls.append((endpoint, data["chat_id"], data.get("text")))
+        return len(self.calls)
+
+
+def request(scheduler, callback, chat_id, text, lane=None, endpoint="sendMessage", **data):
+    data = dict(data, chat_id=chat_id, text=text)
+    return asyncio.ensure_future(
+        scheduler.process_request(callback, (endpoint, data), {}, endpoint, data, lane))
+
+
+def test_interactive_lane_goes_before_reminders():
+    async def scenario():
+        scheduler = OutboundScheduler(global_rate=1000, chat_rate=1000)
+        callback = Recorder()
+        futures = [request(scheduler, callback, 1, "напоминание", "reminder"),
+                   request(scheduler, callback, 2, "ответ")]
+        await asyncio.sleep(0)
+        await scheduler.initialize()
+        await asyncio.wait_for(asyncio.gather(*futures), 1)
+        await scheduler.shutdown()
+        assert [text for *_, text in callback.calls] == ["ответ", "напоминание"]
+
+    asyncio.run(scenario())
+
+
+def test_pending_edits_are_coalesced_and_retry_after_keeps_chat_order():
+    async def scenario():
+        scheduler = OutboundScheduler(global_rate=1000, chat_rate=1000)
+        callback = Recorder(fail_times=1)
+        futures = [request(scheduler, callback, 1, "первое"),
+                   request(scheduler, callback, 1, "старая", endpoint="editMessageText", message_id=7),
+                   request(scheduler, callback, 1, "новая", endpoint="editMessageText", message_id=7)]
+        await asyncio.sleep(0)
+        await scheduler.initialize()
+        results = await asyncio.wait_for(asyncio.gather(*futures), 1)
+        await scheduler.shutdown()
+        assert callback.calls == [("sendMessage", 1, "первое"), ("editMessageText", 1, "новая")]
+        assert results == [1, 2, 2]
+        assert (scheduler.retried, scheduler.coalesced, scheduler.pending) == (1, 1, 0)
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_evicts_lower_lanes_but_not_user_replies():
+    async def scenario():
+        scheduler = OutboundScheduler(max_queue=1)
+        callback = Recorder()
+        reminder = request(scheduler, callback, 1, "напоминание", "reminder")
+        await asyncio.sleep(0)
+        with pytest.raises(OutboxFull):
+            await request(scheduler, callback, 2, "рассылка", "broadcast")
+        reply = request(scheduler, callback, 3, "ответ")
+        with pytest.raises(OutboxFull):
+            await reminder
+        await scheduler.initialize()
+        assert await asyncio.wait_for(reply, 1) == 1
+        await scheduler.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,58 @@
+import asyncio
+
+from persistence import SqlitePersistence
+
+
+def test_refresh_loads_newer_version_from_other_process(tmp_path):
+    async def scenario():
+        changes = []
+        writer = SqlitePersistence(str(tmp_path / "state.db"))
+        reader = SqlitePersistence(str(tmp_path / "state.db"),
+                                   on_foreign_change=lambda kind, key: changes.append((kind, key)))
+        await writer.update_user_data(1, {"task_state": "awaiting_name"})
+        await writer.update_chat_data(1, {"page": 2})
+        await writer._flush_task
+        assert writer.writes == 1  # оба изменения прохода — одной транзакцией
+
+        user_data = {}
+        await reader.refresh_user_data(1, user_data)
+        assert user_data == {"task_state": "awaiting_name"}
+        assert changes == [("user", 1)]
+
+        await reader.refresh_user_data(1, user_data)  # версия не менялась — без перезагрузки
+        assert changes == [("user", 1)] and reader.refreshes == 1
+
+        await writer.update_user_data(1, {"task_state": "awaiting_hours"})
+        await writer._flush_task
+        await reader.refresh_user_data(1, user_data)
+        assert user_data == {"task_state": "awaiting_hours"}
+
+        await writer.drop_user_data(1)
+        await writer.flush()
+        await reader.refresh_user_data(1, user_data)
+        assert user_data == {"task_state": "awaiting_hours"} and reader.refreshes == 2
+        await reader.flush()
+
+    asyncio.run(scenario())
+
+
+def test_refresh_keeps_unwritten_local_changes(tmp_path):
+    async def scenario():
+        other = SqlitePersistence(str(tmp_path / "state.db"))
+        local = SqlitePersistence(str(tmp_path / "state.db"))
+        await other.update_user_data(1, {"step": "other"})
+        await other.flush()
+
+        user_data = {"step": "local"}
+        local.buffer[("user", 1)] = '{"step": "local"}'  # ещё не записано этим процессом
+        await local.refresh_user_data(1, user_data)
+        assert user_data == {"step": "local"} and local.refreshes == 0
+        await local.flush()
+
+        reopened = SqlitePersistence(str(tmp_path / "state.db"))
+        user_data = {}
+        await reopened.refresh_user_data(1, user_data)
+        assert user_data == {"step": "local"}  # запись при остановке — новее чужой
+        await reopened.flush()
+
+    asyncio.run(scenario())
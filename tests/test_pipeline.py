@@ -0,0 +1,122 @@
+import asyncio
+import time
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+from telegram.ext import Application, TypeHandler
+
+from persistence import SqlitePersistence
+from pipeline import AdmissionQueue, ChatSerializer, SerializedApplication
+
+
+class SlowFirstRead(SqlitePersistence):
+    """Первое чтение состояния идёт долго, следующие — сразу"""
+
+    reads = 0
+
+    def _read(self, kind, key, known):
+        SlowFirstRead.reads += 1
+        if SlowFirstRead.reads == 1:
+            time.sleep(0.05)
+        return super()._read(kind, key, known)
+
+
+def make_update(update_id: int, chat_id: int = 1) -> Update:
+    user = User(chat_id, "user", False)
+    message = Message(update_id, datetime.now(), Chat(chat_id, Chat.PRIVATE), from_user=user, text=str(update_id))
+    return Update(update_id, message=message)
+
+
+def build(tmp_path, events):
+    application = (
+        Application.builder()
+        .application_class(SerializedApplication, {"serializer": ChatSerializer()})
+        .token("1:TEST")
+        .concurrent_updates(8)
+        .persistence(SlowFirstRead(str(tmp_path / "state.db")))
+        .build()
+    )
+
+    async def handler(update, context):
+        events.append(("start", update.update_id))
+        await asyncio.sleep(0.01)
+        events.append(("end", update.update_id))
+
+    application.add_handler(TypeHandler(Update, handler))
+    application._initialized = True  # без getMe: сеть в тестах не нужна
+    return application
+
+
+def test_same_chat_updates_keep_order_across_state_refresh(tmp_path):
+    # Обновление 1 ждёт чтения состояния в пуле, обновление 2 — нет;
+    # замок чата берётся до refresh_data, поэтому 2 не обгоняет 1
+    events = []
+    application = build(tmp_path, events)
+
+    async def main():
+        first = asyncio.ensure_future(application.process_update(make_update(1)))
+        second = asyncio.ensure_future(application.process_update(make_update(2)))
+        await asyncio.gather(first, second)
+        await application.persistence.flush()
+
+    asyncio.run(main())
+    assert events == [("start", 1), ("end", 1), ("start", 2), ("end", 2)]
+
+
+def test_other_chats_run_in_parallel():
+    serializer = ChatSerializer()
+    events = []
+
+    async def process(update):
+        events.append(("start", update.effective_chat.id))
+        await asyncio.sleep(0.01)
+        events.append(("end", update.effective_chat.id))
+
+    async def main():
+        await asyncio.gather(serializer.run(make_update(1, chat_id=1), process),
+                             serializer.run(make_update(2, chat_id=2), process))
+
+    asyncio.run(main())
+    assert events[:2] == [("start", 1), ("start", 2)]
+    assert serializer.stats()["chats"] == 0
+
+
+def test_chat_queue_limit_drops_updates():
+    serializer = ChatSerializer(max_pending=2)
+    handled = []
+
+    async def process(update):
+        await asyncio.sleep(0.01)
+        handled.append(update.update_id)
+
+    async def main():
+        await asyncio.gather(*(serializer.run(make_update(number), process) for number in range(1, 5)))
+
+    asyncio.run(main())
+    assert handled == [1, 2]
+    assert serializer.dropped == 2
+
+
+def test_admission_queue_limits_in_flight_updates():
+    async def scenario():
+        queue = AdmissionQueue(maxsize=3, max_in_flight=2)
+        for update_id in range(3):
+            queue.put_nowait(update_id)
+        assert queue.full()
+
+        assert [await queue.get(), await queue.get()] == [0, 1]
+        third = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0)
+        assert not third.done()  # два обновления ещё обрабатываются
+        assert queue.stats() == {"queued": 1, "maxsize": 3, "in_flight": 2, "admission_waits": 1}
+
+        queue.task_done()
+        assert await asyncio.wait_for(third, 1) == 2
+        assert queue.in_flight == 2
+
+        queue.put_nowait(3)
+        for _ in range(3):
+            queue.task_done()  # при остановке и для невыданного: счётчик не уходит в минус
+        assert queue.in_flight == 0
+
+    asyncio.run(scenario())
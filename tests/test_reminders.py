@@ -0,0 +1,54 @@
+import asyncio
+from datetime import date, timedelta
+
+from cache import LRUCache
+from reminders import ReminderEngine
+from repository import Repository
+from resilience import CircuitBreaker, RetryPolicy
+from storage import MemoryBackend
+
+TOMORROW = (date.today() + timedelta(days=1)).isoformat()
+
+
+class FlakyBackend(MemoryBackend):
+    """assigned_slots падает на порциях с пользователем broken"""
+
+    def __init__(self, broken: str):
+        super().__init__()
+        self.broken = broken
+        self.chunks = []
+
+    def assigned_slots(self, start, end, user_ids):
+        self.chunks.append(list(user_ids))
+        if self.broken in user_ids:
+            raise ConnectionError("сбой порции")
+        return super().assigned_slots(start, end, user_ids)
+
+
+def test_load_reads_users_in_chunks_and_skips_failed_chunk():
+    backend = FlakyBackend(broken="2")
+    for user_id in ("1", "2", "3", "4"):
+        backend.update(f"schedule/{user_id}", {f"{TOMORROW}/10:00": {"type": "task", "task": "x", "task_id": "t"}})
+    breaker = CircuitBreaker(failure_threshold=1)
+    repository = Repository(backend, LRUCache(), breaker=breaker, retry=RetryPolicy(attempts=3, base_delay=0))
+    engine = ReminderEngine(repository, load_chunk=2, owns=lambda user_id: user_id != "4")
+
+    asyncio.run(engine.load(days=3))
+
+    assert backend.chunks == [["1", "2"], ["3"]]  # без повторов и без чужих пользователей
+    assert sorted(engine.entries) == ["3"]
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_due_skips_rewritten_and_cancelled_slots():
+    engine = ReminderEngine(repository=None, lead_minutes=0)
+    engine.set_slot("1", TOMORROW, "10:00", "old", "t1")
+    engine.set_slot("1", TOMORROW, "10:00", "new", "t2")
+    engine.set_slot("1", TOMORROW, "09:30", "x", "t3")
+    engine.set_slot("1", TOMORROW, "09:30")  # блок освобождён
+
+    assert engine.due(now=engine.fire_at(TOMORROW, "09:30") - 1) == []
+    due = engine.due(now=engine.fire_at(TOMORROW, "10:00") + 1)
+
+    assert due == [("1", TOMORROW, "10:00", "new", "t2")]
+    assert engine.pending == 0 and not engine.entries and not engine.heap
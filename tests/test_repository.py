@@ -0,0 +1,100 @@
+import asyncio
+import threading
+
+import pytest
+
+from cache import LRUCache
+from repository import Repository
+from resilience import RetryPolicy
+from storage import ConflictError, MemoryBackend
+
+
+class RecordingBackend(MemoryBackend):
+    """Запоминает корни транзакций; запись в tasks/ можно сломать"""
+
+    def __init__(self):
+        super().__init__()
+        self.transactions = []
+        self.fail_tasks = False
+
+    def transaction(self, path, keys, build):
+        self.transactions.append(path)
+        return super().transaction(path, keys, build)
+
+    def update(self, path, updates):
+        if self.fail_tasks and path.startswith("tasks/"):
+            raise ConnectionError("tasks недоступны")
+        super().update(path, updates)
+
+
+def make_repository(backend):
+    return Repository(backend, LRUCache(), retry=RetryPolicy(attempts=1, base_delay=0, max_delay=0))
+
+
+TASK = {"type": "task", "task": "Курсовая", "task_id": "t1"}
+
+
+def test_claim_slots_runs_one_transaction_per_day():
+    backend = RecordingBackend()
+    repository = make_repository(backend)
+    slots = [("2030-01-07", "11:00"), ("2030-01-07", "11:30"), ("2030-01-08", "10:00")]
+    updates = asyncio.run(repository.claim_slots("1", slots, TASK))
+    assert backend.transactions == ["schedule/1/2030-01-07", "schedule/1/2030-01-08"]
+    assert updates["2030-01-08/10:00/task_id"] == "t1"
+    assert backend.get("schedule/1/2030-01-07/11:30") == TASK
+
+
+def test_claim_slots_releases_earlier_days_on_conflict():
+    backend = RecordingBackend()
+    backend.update("schedule/1", {"2030-01-08/10:00": {"type": "task", "task": "Чужая", "task_id": "t0"}})
+    repository = make_repository(backend)
+    with pytest.raises(ConflictError) as error:
+        asyncio.run(repository.claim_slots("1", [("2030-01-07", "11:00"), ("2030-01-08", "10:00")], TASK))
+    assert str(error.value) == "2030-01-08/10:00"
+    assert backend.get("schedule/1/2030-01-07") is None
+    assert backend.get("schedule/1/2030-01-08/10:00/task") == "Чужая"
+
+
+def test_claim_slots_releases_blocks_when_task_write_fails():
+    backend = RecordingBackend()
+    backend.set("tasks/1/t1", {"name": "Курсовая"})
+    backend.fail_tasks = True
+    repository = make_repository(backend)
+    with pytest.raises(Exception):
+        asyncio.run(repository.claim_slots("1", [("2030-01-07", "11:00")], TASK, task_id="t1"))
+    assert backend.get("schedule/1") is None
+    assert backend.get("tasks/1/t1") == {"name": "Курсовая"}
+
+
+class SlowReadBackend(MemoryBackend):
+    """Чтение tasks/1 ждёт release — запись успевает пройти посередине"""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def get(self, path):
+        value = super().get(path)
+        if path == "tasks/1" and not self.release.is_set():
+            self.started.set()
+            self.release.wait(5)
+        return value
+
+
+def test_read_through_started_before_write_does_not_cache_stale_tasks():
+    async def scenario():
+        backend = SlowReadBackend()
+        backend.set("tasks/1/t1", {"name": "Старое"})
+        repository = make_repository(backend)
+        reader = asyncio.ensure_future(repository.get_tasks("1"))
+        await asyncio.get_running_loop().run_in_executor(None, backend.started.wait, 5)
+
+        await repository.update_task("1", "t1", {"name": "Новое"})
+        backend.release.set()
+        assert (await reader)["t1"]["name"] == "Старое"  # ответ того чтения — как было в базе
+
+        assert (await repository.get_tasks("1"))["t1"]["name"] == "Новое"
+        assert repository.cache.stats()["rejected"] == 1
+
+    asyncio.run(scenario())
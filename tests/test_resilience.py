@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+
+from cache import LRUCache
+from repository import Repository
+from resilience import CircuitBreaker, RetryPolicy, SingleFlight, StorageUnavailable, TransientStorageError
+from storage import MemoryBackend
+
+
+def make_repository(breaker: CircuitBreaker) -> Repository:
+    return Repository(MemoryBackend(), LRUCache(), breaker=breaker,
+                      retry=RetryPolicy(attempts=1, base_delay=0, max_delay=0))
+
+
+def test_breaker_opens_and_recovers_after_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow()  # пробный запрос
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # одновременно — только одна проба
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_cancelled_probe_frees_the_probe_slot():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    repository = make_repository(breaker)
+
+    def slow():
+        time.sleep(0.05)
+        return "ok"
+
+    def fail():
+        raise TransientStorageError("down")
+
+    async def main():
+        with pytest.raises(StorageUnavailable):
+            await repository.run(fail)
+        assert breaker.state == CircuitBreaker.OPEN
+        probe = asyncio.ensure_future(repository.run(slow))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        # Следующий вызов — новая проба, а не вечный StorageUnavailable
+        assert await repository.run(lambda: "ok") == "ok"
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(main())
+    repository.shutdown()
+
+
+def test_single_flight_shares_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def main():
+        return await asyncio.gather(*(flights.do("key", fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == [1] * 5
+    assert flights.shared == 4 and flights.calls == {}
+
+
+def test_single_flight_waiter_takes_over_cancelled_leader():
+    flights = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return len(calls)
+
+    async def main():
+        leader = asyncio.ensure_future(flights.do("key", fetch))
+        await asyncio.sleep(0.005)
+        waiters = [asyncio.ensure_future(flights.do("key", fetch)) for _ in range(3)]
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        results = await asyncio.gather(*waiters)
+        assert leader.cancelled()
+        return results
+
+    assert asyncio.run(main()) == [2, 2, 2]
+    assert len(calls) == 2 and flights.calls == {}
+
+
+def test_single_flight_error_reaches_all_waiters():
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise KeyError("missing")
+
+    async def main():
+        return await asyncio.gather(*(flights.do("key", fetch) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, KeyError) for result in asyncio.run(main()))
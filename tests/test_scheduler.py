@@ -0,0 +1,71 @@
+from datetime import date, datetime, timedelta
+
+from availability import AvailabilityIndex, slot_index
+from scheduler import displaced_tasks, plan_schedule
+
+PRIORITIES = {"urgent": 4, "high": 3, "medium": 2, "low": 1}
+START = date(2030, 1, 7)
+NOW = datetime(2030, 1, 7, 0, 0)
+
+
+def make_index(slots=("08:00", "08:30", "09:00", "09:30"), days=7):
+    """Индекс, где свободны только slots каждого дня"""
+    mask = sum(1 << slot_index(time_str) for time_str in slots)
+    index = AvailabilityIndex(START, fill=lambda day: (mask, 0))
+    index.ensure(START + timedelta(days=days - 1))
+    return index
+
+
+def task(hours, deadline_offset, priority="medium 🟡", **fields):
+    return {"name": fields.pop("name", "задача"), "time_required": hours, "priority": priority,
+            "deadline": (START + timedelta(days=deadline_offset)).isoformat(), "mode": "auto", **fields}
+
+
+def apply(tasks, index, plan):
+    """Применяет план так же, как main.apply_plan + write-through индекса"""
+    for path, value in plan["schedule_updates"].items():
+        index.apply(path, value)
+    for task_id, values in plan["task_updates"].items():
+        tasks[task_id].update(values)
+
+
+def test_admission_drops_least_important_task():
+    tasks = {"high": task(2, 0, "high 🟠"), "low": task(1, 0, "low ⚪")}
+    plan = plan_schedule(tasks, make_index(), PRIORITIES, now=NOW)
+    assert plan["unscheduled"] == {"low": 2}
+    assert len(plan["assignments"]["high"]) == 4
+
+
+def test_per_day_cap():
+    slots = [f"{hour:02d}:00" for hour in range(8, 20)]
+    plan = plan_schedule({"t": task(6, 3)}, make_index(slots), PRIORITIES, now=NOW, per_day=4)
+    days = [block["date"] for block in plan["assignments"]["t"]]
+    assert len(days) == 12
+    assert max(days.count(day) for day in set(days)) == 4
+
+
+def test_replan_without_changes_is_empty_diff():
+    tasks = {"a": task(2, 2), "b": task(1.5, 1, "high 🟠")}
+    index = make_index()
+    apply(tasks, index, plan_schedule(tasks, index, PRIORITIES, now=NOW))
+    plan = plan_schedule(tasks, index, PRIORITIES, now=NOW)
+    assert plan["schedule_updates"] == {}
+    assert plan["task_updates"] == {}
+    assert plan["unscheduled"] == {}
+
+
+def test_declined_task_does_not_displace_kept_tasks():
+    # /no: задача помечается "unplaced" и не отбирает блоки у сохранённых
+    tasks = {"kept": task(2, 0, "low ⚪")}
+    index = make_index()
+    apply(tasks, index, plan_schedule(tasks, index, PRIORITIES, now=NOW))
+    assert len(tasks["kept"]["assigned_blocks"]) == 4
+
+    tasks["new"] = task(2, 0, "urgent 🔴")
+    plan = plan_schedule(tasks, index, PRIORITIES, now=NOW)
+    assert displaced_tasks(tasks, plan, exclude={"new"}) == {"kept": 4}
+
+    tasks["new"]["mode"] = "unplaced"
+    plan = plan_schedule(tasks, index, PRIORITIES, now=NOW)
+    assert plan["schedule_updates"] == {}
+    assert displaced_tasks(tasks, plan, exclude={"new"}) == {}
@@ -0,0 +1,75 @@
+import pytest
+
+from storage import ConflictError, MemoryBackend, SqliteBackend
+
+TASKS = {
+    "t1": {"name": "Курсовая", "deadline": "2030-01-10", "time_required": 2},
+    "t2": {"name": "Отчёт", "deadline": "2030-01-08", "time_required": 1},
+}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    return SqliteBackend(str(tmp_path / "test.db"))
+
+
+def fill(backend):
+    backend.set("tasks/1", TASKS)
+    backend.update("schedule/1", {
+        "2030-01-07/08:00": {"type": "free", "task": "t1"},
+        "2030-01-07/09:00": {"type": "lecture"},
+        "2030-01-08/08:00": {"type": "free", "task": "t2"},
+        "2030-01-09/10:00": {"type": "free"},
+    })
+    backend.update("schedule/2", {"2030-01-07/08:00": {"type": "task", "task": "x", "task_id": "k"}})
+    backend.set("templates/1", {"week": {"mon": "free"}})
+
+
+def test_reads(backend):
+    fill(backend)
+    assert backend.get("tasks/1") == TASKS
+    assert backend.get("tasks/1/t2/name") == "Отчёт"
+    assert backend.get("templates/1") == {"week": {"mon": "free"}}
+    assert backend.get("schedule/1/2030-01-07/09:00") == {"type": "lecture"}
+    assert list(backend.get_range("schedule/1", "2030-01-08", "2030-01-31")) == ["2030-01-08", "2030-01-09"]
+    assert list(backend.get_range("schedule/1", "2030-01-01", "2030-01-31", limit=1)) == ["2030-01-07"]
+    assert sorted(backend.child_keys("schedule")) == ["1", "2"]
+    assert backend.query_equal("tasks/1", "name", "Отчёт") == {"t2": TASKS["t2"]}
+
+
+def test_assigned_slots(backend):
+    fill(backend)
+    slots = sorted(backend.assigned_slots("2030-01-07", "2030-01-07", ["1", "2"]))
+    assert [(user_id, time_str) for user_id, _, time_str, _ in slots] == [("1", "08:00"), ("2", "08:00")]
+    assert [slot[0] for slot in backend.assigned_slots("2030-01-01", "2030-12-31", ["2"])] == ["2"]
+    assert backend.assigned_slots("2030-01-01", "2030-12-31", []) == []
+
+
+def test_updates_and_deletes(backend):
+    fill(backend)
+    backend.update("tasks/1", {"t1/assigned_blocks": [{"date": "2030-01-07", "time": "08:00"}], "t2": None})
+    assert list(backend.get("tasks/1")) == ["t1"]
+    assert backend.get("tasks/1/t1/assigned_blocks") == [{"date": "2030-01-07", "time": "08:00"}]
+    backend.update("schedule/1", {"2030-01-07/08:00/task": None, "2030-01-09": None})
+    assert backend.get("schedule/1/2030-01-07/08:00") == {"type": "free"}
+    assert backend.get("schedule/1/2030-01-09") is None
+    backend.delete("schedule/2")
+    assert backend.get("schedule/2") is None
+
+
+def test_transaction(backend):
+    fill(backend)
+
+    def claim(current):
+        for key, block in current.items():
+            if block and block.get("task"):
+                raise ConflictError(key)
+        return {f"{key}/task": "t3" for key in current}
+
+    assert backend.transaction("schedule/1", ["2030-01-09/10:00"], claim) == {"2030-01-09/10:00/task": "t3"}
+    assert backend.get("schedule/1/2030-01-09/10:00") == {"type": "free", "task": "t3"}
+    with pytest.raises(ConflictError):
+        backend.transaction("schedule/1", ["2030-01-09/11:00", "2030-01-07/08:00"], claim)
+    assert backend.get("schedule/1/2030-01-09/11:00") is None
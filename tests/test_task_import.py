@@ -0,0 +1,43 @@
+from datetime import date, timedelta
+
+from scheduler import MAX_PLAN_DAYS
+from task_import import export_document, parse_document, validate_rows
+
+LABELS = {"urgent": "urgent 🔴", "high": "high 🟠", "medium": "medium 🟡", "low": "low ⚪"}
+TODAY = date(2030, 1, 7)
+
+
+def row(**fields):
+    return {"name": "Курсовая", "time_required": "2", "deadline": "10.01.2030", **fields}
+
+
+def test_priority_by_key_label_and_default():
+    rows = [row(priority="high"), row(priority="low ⚪"), row(priority=""), row(priority="   ")]
+    tasks, errors, skipped = validate_rows(rows, LABELS, TODAY)
+    assert errors == [] and skipped == []
+    assert [task["priority"] for task in tasks] == ["high 🟠", "low ⚪", "medium 🟡", "medium 🟡"]
+
+
+def test_errors_are_collected_per_row():
+    rows = [row(name=""), row(time_required="два"), row(priority="later"), row(deadline="2030/01/10"),
+            row(deadline=(TODAY + timedelta(days=MAX_PLAN_DAYS + 1)).isoformat())]
+    tasks, errors, skipped = validate_rows(rows, LABELS, TODAY)
+    assert tasks == []
+    assert [error.split(":")[0] for error in errors] == ["1", "2", "3", "4", "5"]
+
+
+def test_overdue_rows_are_skipped_not_errors():
+    tasks, errors, skipped = validate_rows([row(deadline="01.01.2030"), row()], LABELS, TODAY)
+    assert errors == []
+    assert len(tasks) == 1 and tasks[0]["deadline"] == "2030-01-10"
+    assert skipped and skipped[0].startswith("1:")
+
+
+def test_export_round_trip():
+    tasks, _, _ = validate_rows([row(notes="глава 2"), row(name="Отчёт", priority="urgent")], LABELS, TODAY)
+    exported = {str(number): task for number, task in enumerate(tasks)}
+    for fmt in ("csv", "json"):
+        again, errors, skipped = validate_rows(parse_document(export_document(exported, fmt)), LABELS, TODAY)
+        assert errors == [] and skipped == []
+        assert [(task["name"], task["priority"], task.get("notes")) for task in again] == \
+            [(task["name"], task["priority"], task.get("notes")) for task in tasks]
@@ -0,0 +1,39 @@
+import pytest
+
+from templates import DEFAULT_TEMPLATE, WeeklyTemplate, edit_template, parse_range
+
+
+def test_default_template_has_meals_and_no_lectures():
+    template = WeeklyTemplate()
+    assert "lectures" not in DEFAULT_TEMPLATE
+    assert template.block("2030-01-07", "13:30") == {"type": "lecture", "task": "Обед"}
+    assert template.block("2030-01-07", "09:00") == {"type": "free"}
+    assert template.block("2030-01-07", "03:00") == {"type": "sleep"}
+
+
+def test_edit_template_does_not_mutate_input():
+    data = edit_template(DEFAULT_TEMPLATE, ["lecture", "пн", "9:00-10:00", "Лекция", "по", "ML"])
+    assert data["lectures"] == {"monday": [{"start": "09:00", "end": "10:00", "task": "Лекция по ML"}]}
+    assert "lectures" not in DEFAULT_TEMPLATE
+    assert WeeklyTemplate(data).block("2030-01-07", "10:00") == {"type": "lecture", "task": "Лекция по ML"}
+    assert WeeklyTemplate(data).block("2030-01-08", "10:00") == {"type": "free"}
+
+    data = edit_template(data, ["lecture", "monday", "09:00-10:00", "-"])
+    assert data["lectures"] == {}
+    data = edit_template(data, ["meal", "13:00-13:30", "-"])
+    assert [meal["task"] for meal in data["meals"]] == ["Завтрак", "Ужин"]
+    assert edit_template(data, ["sleep", "00:00-06:30"])["sleep"] == {"start": "00:00", "end": "06:30"}
+    assert edit_template(data, ["reset"]) == DEFAULT_TEMPLATE
+
+
+@pytest.mark.parametrize("args", [[], ["sleep"], ["sleep", "01:15-07:00"], ["lecture", "xx", "09:00-10:00", "A"],
+                                  ["free", "8-9"], ["unknown", "1"]])
+def test_edit_template_rejects_bad_commands(args):
+    with pytest.raises(ValueError):
+        edit_template(DEFAULT_TEMPLATE, args)
+
+
+def test_parse_range():
+    assert parse_range("23:30-0:00") == ("23:30", "00:00")
+    with pytest.raises(ValueError):
+        parse_range("24:00-01:00")